@@ -1,14 +1,34 @@
 import streamlit as st
 import polars as pl
-import pandas as pd
-import io
-import base64
-import json
-
-from src.data_loading import load_data, load_codebook
-from src.sampling import get_random_sample, get_stratified_sample, calculate_sample_size
-from src.statistics import get_class_distribution, calculate_metrics, get_confusion_matrix, suggest_sampling_method, create_label_to_code_mapping
-from src.visualization import plot_class_distribution, plot_confusion_matrix, display_multi_class_stats
+import bisect
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from src.data_loading import SHARD_ROOT, load_data, scan_data, load_shards, load_profile, get_columns, load_codebook, load_codebook_index, load_duplicate_groups, load_dataset_key
+from src.dataset_cache import class_distribution_from_profile
+from src.sampling import SAMPLE_WEIGHT_COLUMN, SequentialSampler, get_random_sample, get_weighted_sample, get_stratified_sample, calculate_sample_size, allocate_sample, design_margin_of_error
+from src.statistics import get_class_distribution, get_class_text_lengths, get_class_accuracies, suggest_sampling_method, bootstrap_confidence_intervals, accuracy_interval, label_domains
+from src.visualization import plot_class_distribution, plot_confusion_matrix, display_confusion_viewer, display_multi_class_stats, display_reliability_stats, display_stage_timings
+from src.metrics_accumulator import ConfusionAccumulator, metrics_from_confusion_matrix, hierarchical_metrics
+from src.confusion import MAX_HEATMAP_LABELS
+from src.coding_store import CodingStore
+from src.journal import CodingJournal, sample_fingerprint, journal_path, sample_journals, read_decisions, coder_slug
+from src.work_queue import WorkQueue, queue_path
+from src.reliability import build_coder_matrix, calculate_reliability
+from src.export import EXPORT_FORMATS, build_results, results_file, metrics_summary
+from src.dedup import DUPLICATE_GROUP_COLUMN, NEAR_DUPLICATE_THRESHOLD, drop_duplicates, coded_group_labels, propagate_labels
+from src.background import BackgroundTasks
+from src.instrumentation import Profiler, activate, stage
+
+# Record per-stage timings from the start of every session (also switchable in the developer panel)
+PROFILE_DEFAULT = os.environ.get("MCV_PROFILE") == "1"
+# Sequential sampling never stops before this many items are coded, however narrow the interval looks
+SEQUENTIAL_MIN_ITEMS = 30
+# Sequential samples draw their next batch in the background once the coder is this close to the last drawn item
+PREFETCH_ITEMS = 10
+# Interval at which panels waiting for a background result check whether it is ready
+BACKGROUND_POLL_SECONDS = 1.0
 
 # Set page configuration for a wider layout
 st.set_page_config(layout="wide", page_title="Comprehensive Manual Coding Validation Tool")
@@ -24,7 +44,65 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+def profiled(rerun=False):
+    """
+    Run a function with the session's profiler active when profiling is switched on, timing it as one stage.
+    
+    Args:
+    rerun: The function is a script run of its own (the app or a fragment); its end closes the rerun in the profiler
+    
+    Returns:
+    Decorator
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profiler = None
+            if st.session_state.setdefault('profiling', PROFILE_DEFAULT):
+                profiler = st.session_state.setdefault('profiler', Profiler())
+            activate(profiler)
+            # Nested fragments first run inside their parent's run; only the outermost run closes the rerun
+            closes_rerun = rerun and not st.session_state.get('profiled_run', False)
+            if closes_rerun:
+                st.session_state.profiled_run = True
+            try:
+                with stage(fn.__name__):
+                    return fn(*args, **kwargs)
+            finally:
+                if closes_rerun:
+                    st.session_state.profiled_run = False
+                    if profiler is not None:
+                        profiler.finish_rerun()
+        return wrapper
+    return decorator
+
+@st.cache_resource
+def get_background_executor():
+    """
+    Get the process-wide thread pool that computes statistics and prefetches sequential batches off the script thread.
+    
+    Returns:
+    ThreadPoolExecutor with MCV_BACKGROUND_WORKERS threads (default 2), shared by all sessions
+    """
+    return ThreadPoolExecutor(int(os.environ.get("MCV_BACKGROUND_WORKERS", 2)), thread_name_prefix="mcv-background")
+
+def developer_panel():
+    """
+    Developer panel: switch for per-stage instrumentation, timings of the current rerun and the session trace.
+    """
+    with st.expander("🛠️ Developer: performance"):
+        st.toggle("Record per-stage timings", key="profiling",
+                  help="Times every pipeline stage of this session. Takes effect from the next interaction.")
+        profiler = st.session_state.get('profiler')
+        if not st.session_state.profiling or profiler is None:
+            return
+        display_stage_timings(profiler.summary(), profiler.peak_rss / 2**20)
+        st.download_button("Download session trace (Chrome trace format)", data=profiler.chrome_trace,
+                           file_name="session_trace.json", mime="application/json",
+                           help="Open in chrome://tracing or https://ui.perfetto.dev")
+
 def display_codebook(codebook):
+    import pandas as pd
     st.subheader("Complete Codebook")
     df = pd.DataFrame([
         {
@@ -37,6 +115,484 @@ def display_codebook(codebook):
     ])
     st.dataframe(df, height=400)  # Adjust height as needed
 
+@profiled()
+def start_coding_session(coded_data, unique_labels, text_column, label_column, coder="", sequential=None, duplicates=None, shared=False):
+    """
+    Reset the coding state for a new sample, resuming from the coder's journal if one exists.
+    
+    Args:
+    coded_data: Polars DataFrame with the items to code
+    unique_labels: Sorted list of label values
+    text_column: Name of the text column
+    label_column: Name of the predicted label column
+    coder: Coder name; coders of the same sample keep separate journals
+    sequential: For sequential sampling, dictionary with the SequentialSampler, target margin_of_error and
+    confidence_level; coded_data then holds the batches drawn so far
+    duplicates: For samples drawn without duplicate texts, tuple of (full dataset, duplicate groups) to propagate
+    the manual labels to
+    shared: Split the sample with other coders through a shared work queue; the coder then only codes leased items.
+    Sequential samples grow per session and cannot be shared
+    """
+    if 'journal' in st.session_state:
+        st.session_state.journal.close()
+    if st.session_state.get('work_queue') is not None:
+        st.session_state.work_queue.close()
+    if 'background' in st.session_state:
+        st.session_state.background.cancel()
+    # A sequential sample is identified by its first batch, which does not change as more batches are drawn
+    fingerprint_data = coded_data.head(sequential['sampler'].batch_size) if sequential else coded_data
+    fingerprint = sample_fingerprint(fingerprint_data, text_column, label_column)
+    journal = CodingJournal(journal_path(fingerprint, coder), unique_labels)
+    decisions, current_index = journal.replay()
+    if sequential:
+        # Draw again the batches coded before a restart
+        needed = max(current_index, decisions['item_index'].max() if len(decisions) else 0) + 1
+        if needed > len(coded_data):
+            coded_data = pl.concat([coded_data, sequential['sampler'].extend(len(coded_data), needed)])
+    # Samples with inverse-probability weights (uncertainty-weighted, or uploaded with a sample_weight column) get weighted metrics
+    weighted = SAMPLE_WEIGHT_COLUMN in coded_data.columns
+    accumulator = ConfusionAccumulator(unique_labels, weighted=weighted)
+    accumulator.add_many(decisions['manual_label'], decisions['predicted_label'],
+                         coded_data[SAMPLE_WEIGHT_COLUMN].gather(decisions['item_index']) if weighted else None)
+    
+    st.session_state.coded_data = coded_data
+    st.session_state.unique_labels = unique_labels
+    st.session_state.current_index = min(current_index, len(coded_data) - 1)
+    coding_store = CodingStore(len(coded_data), unique_labels)
+    coding_store.set_many(decisions['item_index'], decisions['manual_label'])
+    work_queue = None
+    if shared and not sequential:
+        # The coder moves between the items they have coded and those leased to them
+        work_queue = WorkQueue(queue_path(fingerprint), len(coded_data))
+        leased = work_queue.lease(coder)
+        st.session_state.queue_items = sorted(set(decisions['item_index'].to_list()) | set(leased))
+        st.session_state.current_index = leased[0] if leased else st.session_state.current_index
+    st.session_state.work_queue = work_queue
+    st.session_state.coding_store = coding_store
+    st.session_state.metrics_accumulator = accumulator
+    st.session_state.journal = journal
+    st.session_state.sample_fingerprint = fingerprint
+    st.session_state.coder = coder
+    st.session_state.sequential = sequential
+    st.session_state.duplicates = duplicates
+    st.session_state.background = BackgroundTasks(get_background_executor())
+    st.session_state.resumed_items = len(decisions)
+    st.session_state.data_loaded = True
+
+def sequential_precision():
+    """
+    Estimate the accuracy of a sequential sample and check it against the target precision.
+    
+    Returns:
+    Tuple of (estimate, lower bound, upper bound, whether the target margin of error is reached)
+    """
+    sequential = st.session_state.sequential
+    accumulator = st.session_state.metrics_accumulator
+    estimate, lower, upper = accuracy_interval(int(accumulator.counts.trace()), accumulator.total(),
+                                               sequential['confidence_level'])
+    reached = accumulator.total() >= SEQUENTIAL_MIN_ITEMS and (upper - lower) / 2 <= sequential['margin_of_error']
+    return estimate, lower, upper, reached
+
+def adjacent_item(step):
+    """
+    Get the item that Previous (step -1) or Next (step 1) navigates to.
+    
+    In a shared work queue, coders only move between their own items.
+    
+    Args:
+    step: -1 or 1
+    
+    Returns:
+    Index of the item
+    """
+    current_index = st.session_state.current_index
+    if st.session_state.work_queue is None:
+        return min(max(current_index + step, 0), len(st.session_state.coded_data) - 1)
+    items = st.session_state.queue_items
+    if not items:
+        return current_index
+    position = bisect.bisect_left(items, current_index) + (step if step < 0 or current_index in items else 0)
+    return items[min(max(position, 0), len(items) - 1)]
+
+def next_queued_item(item_index):
+    """
+    Find the coder's next uncoded item in the shared work queue, leasing another batch once theirs is done.
+    
+    Args:
+    item_index: Index of the item just coded
+    
+    Returns:
+    Index of the item or None if the queue has no items left for the coder
+    """
+    coding_store = st.session_state.coding_store
+    uncoded = [index for index in st.session_state.queue_items if index not in coding_store]
+    if not uncoded:
+        leased = st.session_state.work_queue.lease(st.session_state.coder)
+        st.session_state.queue_items = sorted(set(st.session_state.queue_items) | set(leased))
+        uncoded = [index for index in leased if index not in coding_store]
+    return next((index for index in uncoded if index > item_index), uncoded[0] if uncoded else None)
+
+def team_coding_store(work_queue, num_items, unique_labels):
+    """
+    Collect the manual labels of every coder of a shared work queue.
+    
+    Args:
+    work_queue: WorkQueue of the sample
+    num_items: Number of items in the sample
+    unique_labels: Sorted list of label values
+    
+    Returns:
+    CodingStore with the team's labels
+    """
+    decisions = work_queue.decisions()
+    coding_store = CodingStore(num_items, unique_labels)
+    coding_store.set_many(decisions['item_index'], decisions['manual_label'])
+    return coding_store
+
+@profiled()
+def go_to_item(index):
+    """
+    Navigate to an item of the sample.
+    
+    Args:
+    index: Index of the item to show
+    """
+    st.session_state.current_index = index
+    st.session_state.journal.record_position(index)
+
+@profiled()
+def submit_label(item_index, predicted_label):
+    """
+    Record the manual label selected for an item and move on to the next one.
+    
+    Args:
+    item_index: Index of the coded item
+    predicted_label: Label predicted by the classifier
+    """
+    manual_label = st.session_state[f"manual_label_{item_index}"]
+    work_queue = st.session_state.work_queue
+    if work_queue is not None and not work_queue.submit(st.session_state.coder, item_index, manual_label):
+        # The coder's lease expired and another coder has taken or coded the item
+        st.session_state.queue_items.remove(item_index)
+        st.session_state.queue_conflict = True
+        next_index = next_queued_item(item_index)
+        st.session_state.current_index = item_index if next_index is None else next_index
+        return
+    accumulator = st.session_state.metrics_accumulator
+    weight = st.session_state.coded_data[SAMPLE_WEIGHT_COLUMN][item_index] if accumulator.weighted else 1
+    # Re-submitting an item after going back retracts its earlier label
+    previous = st.session_state.coding_store.set(item_index, manual_label)
+    if previous is not None:
+        accumulator.remove(previous, predicted_label, weight)
+    accumulator.add(manual_label, predicted_label, weight)
+
+    if work_queue is not None:
+        next_index = next_queued_item(item_index)
+        st.session_state.current_index = item_index if next_index is None else next_index
+        st.session_state.coding_completed = next_index is None
+    else:
+        last_index = len(st.session_state.coded_data) - 1
+        # Sequential samples draw the next batch when the last drawn item is coded and the target is not reached yet
+        if item_index == last_index and st.session_state.sequential and not sequential_precision()[3]:
+            # Usually drawn in the background while the last items of the batch were coded
+            drawn = len(st.session_state.coded_data)
+            batch = st.session_state.background.get('next_batch', drawn, st.session_state.sequential['sampler'].extend, drawn)
+            st.session_state.coded_data = pl.concat([st.session_state.coded_data, batch])
+            st.session_state.coding_store.resize(len(st.session_state.coded_data))
+            last_index += len(batch)
+        st.session_state.current_index = min(item_index + 1, last_index)
+        st.session_state.coding_completed = item_index == last_index
+    st.session_state.journal.record_submit(item_index, manual_label, predicted_label, st.session_state.current_index)
+
+def compute_statistics(cm, labels, intervals, domains):
+    """
+    Compute everything the statistics panel shows for one state of the confusion matrix, e.g. in a background task.
+    
+    Args:
+    cm: Copy of the confusion matrix (rows: true labels, columns: predicted labels)
+    labels: Copy of the label values in matrix order
+    intervals: Also compute bootstrap confidence intervals
+    domains: Optional domain name of every label (see label_domains)
+    
+    Returns:
+    Dictionary with metrics, intervals, detailed metrics, the summary CSV, the confusion matrix, labels, domains and
+    the full heatmap (None beyond MAX_HEATMAP_LABELS labels)
+    """
+    metrics = metrics_from_confusion_matrix(cm)
+    intervals = bootstrap_confidence_intervals(cm) if intervals else None
+    detailed = hierarchical_metrics(cm, labels, domains)
+    return {
+        'metrics': metrics,
+        'intervals': intervals,
+        'detailed': detailed,
+        'summary_csv': metrics_summary(metrics, intervals, labels, detailed).write_csv(),
+        'cm': cm,
+        'labels': labels,
+        'domains': domains,
+        'figure': plot_confusion_matrix(cm, labels) if len(labels) <= MAX_HEATMAP_LABELS else None
+    }
+
+def compute_reliability(coder_journals, classifier_labels, unique_labels, num_items):
+    """
+    Compute inter-coder reliability across the journals of a sample, e.g. in a background task.
+    
+    Args:
+    coder_journals: Dictionary mapping coder slugs to journal paths (see sample_journals)
+    classifier_labels: Optional Polars DataFrame with item_index and the predicted label as manual_label, to
+    include the classifier as a coder
+    unique_labels: Sorted list of label values
+    num_items: Number of items in the sample
+    
+    Returns:
+    Tuple of (reliability statistics, coder names)
+    """
+    codings = {coder or "(unnamed)": read_decisions(path)[0] for coder, path in coder_journals.items()}
+    if classifier_labels is not None:
+        codings["classifier"] = classifier_labels
+    labels, matrix = build_coder_matrix(codings, unique_labels, num_items)
+    return calculate_reliability(matrix, len(labels)), list(codings)
+
+def show_statistics(statistics):
+    """
+    Display the statistics computed by compute_statistics.
+    
+    Args:
+    statistics: Dictionary returned by compute_statistics
+    """
+    display_multi_class_stats(statistics['metrics'], statistics['intervals'], statistics['labels'], statistics['detailed'])
+    st.download_button("Download Statistics (CSV)", data=statistics['summary_csv'],
+                       file_name="coding_statistics.csv", mime="text/csv")
+    display_confusion_viewer(statistics['cm'], statistics['labels'], statistics['domains'], statistics['figure'])
+
+def show_reliability(reliability):
+    """
+    Display the inter-coder reliability computed by compute_reliability.
+    
+    Args:
+    reliability: Tuple returned by compute_reliability
+    """
+    display_reliability_stats(*reliability)
+
+def show_background_result(name, show, waiting_message):
+    """
+    Show the latest result of a background task, noting when a newer one is being computed.
+    
+    Args:
+    name: Task name
+    show: Function displaying the result
+    waiting_message: Message shown until the first result is ready
+    """
+    background = st.session_state.background
+    result = background.result(name)
+    if result is None:
+        st.info(waiting_message)
+        return
+    if background.pending(name):
+        st.caption("Updating…")
+    show(result[1])
+
+@st.fragment(run_every=BACKGROUND_POLL_SECONDS)
+@profiled(rerun=True)
+def polling_background_panel(name, show, waiting_message):
+    """
+    Background result panel that reruns on its own until the result is ready (see background_panel).
+    """
+    show_background_result(name, show, waiting_message)
+
+@st.fragment
+@profiled(rerun=True)
+def background_panel_fragment(name, show, waiting_message):
+    """
+    Background result panel that only reruns with its parent or its own widgets (see background_panel).
+    """
+    show_background_result(name, show, waiting_message)
+
+def background_panel(name, show, waiting_message):
+    """
+    Show the result of a background task in a nested fragment, so Submit never waits for it.
+    
+    While the task runs, the panel polls every BACKGROUND_POLL_SECONDS and
+    shows the result as soon as it is ready. The polling fragment is a
+    different fragment from the idle one, so the next rerun of the coding
+    interface drops it and its timer stops.
+    
+    Args:
+    name: Task name
+    show: Function displaying the result
+    waiting_message: Message shown until the first result is ready
+    """
+    panel = polling_background_panel if st.session_state.background.pending(name) else background_panel_fragment
+    panel(name, show, waiting_message)
+
+@st.fragment
+@profiled(rerun=True)
+def coding_interface(text_column, label_column, additional_columns, codebook, codebook_index):
+    """
+    Coding interface: current item, label selection, instructions, navigation, statistics and export.
+    
+    Runs as a fragment, so Previous, Next and Submit only re-execute this
+    function instead of the whole app (data loading, class distribution,
+    sampling setup and codebook sections are left untouched).
+    
+    Args:
+    text_column: Name of the text column
+    label_column: Name of the predicted label column
+    additional_columns: Additional columns to display
+    codebook: Dictionary containing the codebook or None
+    codebook_index: CodebookIndex or None
+    """
+    unique_labels = st.session_state.unique_labels
+    label_to_code_mapping = codebook_index.label_mapping(unique_labels) if codebook_index else None
+
+    st.subheader("Coding Interface")
+    if st.session_state.resumed_items:
+        st.info(f"Resumed {st.session_state.resumed_items:,} coded items from the coding journal.")
+        st.session_state.resumed_items = 0
+    current_row = st.session_state.coded_data.row(st.session_state.current_index, named=True)
+    # Draw the next batch of a sequential sample while the coder codes the last items of this one
+    drawn = len(st.session_state.coded_data)
+    if st.session_state.sequential and drawn - st.session_state.current_index <= PREFETCH_ITEMS:
+        st.session_state.background.submit('next_batch', drawn, st.session_state.sequential['sampler'].extend, drawn)
+
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        st.markdown(f"**Text to Code ({st.session_state.current_index + 1}/{len(st.session_state.coded_data)}):**")
+        st.write(current_row[text_column])
+        if additional_columns:
+            st.markdown("**Additional Information:**")
+            for col in additional_columns:
+                st.write(f"{col}: {current_row[col]}")
+    with col2:
+        predicted_label = current_row[label_column]
+        st.markdown(f"**Predicted Label:** {predicted_label}")
+
+        # The first codes of the store's label dictionary are the selectable labels, in order
+        default_index = st.session_state.coding_store.label_codes.get(predicted_label, 0)
+        if default_index >= len(unique_labels):
+            default_index = 0
+        manual_label = st.selectbox("Select Manual Label", options=st.session_state.unique_labels, index=default_index,
+                                    key=f"manual_label_{st.session_state.current_index}")
+
+        # Display coding instructions if available and codebook is used
+        if codebook and label_to_code_mapping:
+            matching_code = label_to_code_mapping.get(manual_label)
+            if matching_code and matching_code in codebook:
+                st.markdown("**Coding Instructions:**")
+                st.markdown(f"**Domain:** {codebook[matching_code]['domain']}")
+                st.markdown(f"**Code:** {matching_code}")
+                st.markdown(f"**{codebook[matching_code]['name']}**")
+                st.markdown(codebook[matching_code]['description'])
+            else:
+                st.warning("No matching coding instructions found for this label.")
+
+        # Full-text search over code names and descriptions
+        if codebook_index:
+            search_query = st.text_input("Search coding instructions", placeholder="e.g. military expenditure")
+            for code, _ in codebook_index.search(search_query):
+                with st.expander(f"{code}: {codebook[code]['name']}"):
+                    st.markdown(f"**Domain:** {codebook[code]['domain']}")
+                    st.markdown(codebook[code]['description'])
+
+    # Add toggle for calculating statistics
+    calculate_stats = st.toggle("Calculate and display statistics", value=False)
+
+    # Navigation and submission; callbacks update the state before the fragment re-renders
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.button("⬅️ Previous", on_click=go_to_item, args=(adjacent_item(-1),))
+    with col2:
+        st.button("Submit", on_click=submit_label,
+                  args=(st.session_state.current_index, predicted_label))
+        if st.session_state.pop('coding_completed', False):
+            st.success("Coding completed!")
+        if st.session_state.pop('queue_conflict', False):
+            st.warning("Your lease on that item expired and another coder took it over, so your label was not recorded.")
+    with col3:
+        st.button("Next ➡️", on_click=go_to_item, args=(adjacent_item(1),))
+
+    # Precision of a sequential sample so far
+    if st.session_state.sequential:
+        sequential = st.session_state.sequential
+        estimate, lower, upper, reached = sequential_precision()
+        coded = st.session_state.metrics_accumulator.total()
+        st.write(f"Accuracy so far: {estimate:.3f} [{lower:.3f}, {upper:.3f}] at {sequential['confidence_level']:.0%} confidence "
+                 f"after {coded:,} items (target margin of error ±{sequential['margin_of_error']:.3f})")
+        if reached:
+            fixed_size = calculate_sample_size(sequential['confidence_level'], sequential['margin_of_error'], 1, 0.5)
+            st.success(f"Target precision reached after {coded:,} items; a fixed-size sample would have needed {fixed_size:,}. "
+                       "You can stop coding and save the results.")
+
+    # Statistics are computed in the background and shown when ready, so Submit never waits for them
+    background = st.session_state.background
+    with stage("statistics"):
+        if calculate_stats and len(st.session_state.coding_store) > 0:
+            accumulator = st.session_state.metrics_accumulator
+            if accumulator.weighted:
+                st.caption("Metrics are weighted by inverse inclusion probability and estimate the whole dataset. "
+                           "Bootstrap intervals are only available for unweighted samples.")
+                show_intervals = False
+            else:
+                show_intervals = st.checkbox("Show 95% bootstrap confidence intervals", value=False)
+            domains = (label_domains(accumulator.labels, codebook_index.label_mapping(accumulator.labels), codebook)
+                       if codebook_index else None)
+            background.submit('statistics', (accumulator.version, show_intervals), compute_statistics,
+                              accumulator.confusion_matrix(), list(accumulator.labels), show_intervals, domains)
+            background_panel('statistics', show_statistics, "Calculating statistics…")
+
+    # Inter-coder reliability across everyone who has coded this sample
+    with stage("reliability"):
+        if calculate_stats:
+            coder_journals = sample_journals(st.session_state.sample_fingerprint)
+            include_classifier = st.checkbox("Include the classifier as a coder", value=False)
+            if len(coder_journals) + include_classifier >= 2:
+                # Journals only grow, so their sizes tell whether any coder has coded or moved since the last result
+                journal_sizes = tuple((coder, path.stat().st_size) for coder, path in coder_journals.items())
+                classifier_labels = (st.session_state.coded_data.with_row_index('item_index')
+                                     .select(['item_index', label_column])
+                                     .rename({label_column: 'manual_label'})) if include_classifier else None
+                background.submit('reliability', (journal_sizes, include_classifier, len(st.session_state.coded_data)),
+                                  compute_reliability, coder_journals, classifier_labels, unique_labels,
+                                  len(st.session_state.coded_data))
+                background_panel('reliability', show_reliability, "Calculating inter-coder reliability…")
+            else:
+                st.info("Inter-coder reliability needs at least two coders. Enter another coder name to double-code this sample.")
+
+    # Save results with export options
+    export_format = st.radio("Choose export format:", list(EXPORT_FORMATS), horizontal=True)
+    extension, mime = EXPORT_FORMATS[export_format]
+    coded_data = st.session_state.coded_data
+    coding_store = st.session_state.coding_store
+    work_queue = st.session_state.work_queue
+    # The results of a shared sample hold the labels of the whole team
+    results_store = ((lambda: team_coding_store(work_queue, len(coded_data), unique_labels)) if work_queue is not None
+                     else coding_store.copy)
+    # Results are only built and written when the download is requested
+    st.download_button("💾 Save Results",
+                       data=lambda: results_file(build_results(coded_data, results_store(), label_column), export_format),
+                       file_name=f"manually_coded_sample.{extension}", mime=mime)
+    duplicates = st.session_state.duplicates
+    if duplicates is not None and DUPLICATE_GROUP_COLUMN in coded_data.columns:
+        full_data, groups = duplicates
+        st.download_button("💾 Save Results for All Duplicates",
+                           data=lambda: results_file(propagate_labels(full_data, groups, coded_group_labels(coded_data, results_store(), label_column),
+                                                                      label_column), export_format),
+                           file_name=f"manually_coded_duplicates.{extension}", mime=mime,
+                           help="Every row of the full dataset whose text is a duplicate of a coded item, with that item's manual label.")
+
+    # Progress bar
+    progress = min((len(st.session_state.coding_store) + 1) / len(st.session_state.coded_data), 1.0)
+    st.progress(progress)
+    st.write(f"Progress: {progress:.1%}")
+    if work_queue is not None:
+        team_progress = work_queue.progress()
+        st.write(f"Team progress: {team_progress['coded']:,} of {len(coded_data):,} items coded by {team_progress['coders']} coders, "
+                 f"{team_progress['leased']:,} leased, {team_progress['open']:,} open. "
+                 "Statistics cover your own items; Save Results holds the labels of the whole team.")
+
+    # Rendered inside the fragment so its timings include the fragment's own reruns
+    developer_panel()
+
+@profiled(rerun=True)
 def main():
     st.title("Comprehensive Manual Coding Validation Tool")
     
@@ -61,24 +617,62 @@ def main():
         "Choose data loading option:",
         ("Upload full dataset and sample", "Upload pre-sampled dataset")
     )
+    coder = st.text_input("Coder name (optional):",
+                          help="Coders who code the same sample under different names keep separate journals, which are compared for inter-coder reliability.")
+    shared = st.checkbox("Split the sample with other coders", value=False,
+                         help="Coders who generate the same sample share a work queue: each is handed batches of items nobody else is coding, "
+                              "and items left unfinished for 15 minutes go back to the queue. Not available for sequential samples.")
+    if shared and not coder_slug(coder):
+        st.warning("Enter a coder name to split the sample with other coders.")
+        shared = False
 
     if data_option == "Upload full dataset and sample":
         uploaded_file = st.file_uploader("Upload your full dataset (CSV)", type="csv")
-        full_data = load_data(uploaded_file, is_sample=False)
+        shard_source = SHARD_ROOT and st.text_input("Or read a directory or glob of shards below the server's shard root (optional):",
+                                                    placeholder="predictions/run-42/*.parquet",
+                                                    help="CSV, Parquet, Arrow IPC or JSON Lines shards with identical schemas. They are read in parallel and never concatenated in memory.")
+        lazy_loading = not shard_source and st.checkbox("Lazy loading for large datasets", value=False,
+                                                        help="Scan the file instead of reading it into memory. Only the label column and the sampled rows are materialized.")
+        if shard_source:
+            full_data = load_shards(shard_source)
+        elif lazy_loading:
+            full_data = scan_data(uploaded_file, is_sample=False)
+        else:
+            full_data = load_data(uploaded_file, is_sample=False)
         if full_data is None:
             st.stop()
-        st.success(f"Full dataset successfully loaded! Total population: {len(full_data):,} items")
 
         # Column selection for full dataset
-        text_column = st.selectbox("Select the column containing the text to be coded:", full_data.columns)
-        remaining_columns = [col for col in full_data.columns if col != text_column]
+        data_columns = get_columns(full_data)
+        text_column = st.selectbox("Select the column containing the text to be coded:", data_columns)
+        remaining_columns = [col for col in data_columns if col != text_column]
         label_column = st.selectbox("Select the column containing the predicted labels:", remaining_columns)
         additional_columns = st.multiselect("Select additional columns to display (optional):", 
                                             [col for col in remaining_columns if col != label_column])
 
-        # Get number of unique classes and their distribution
-        class_distribution = get_class_distribution(full_data, label_column)
+        # Sample one row per group of duplicate texts, so coders never see the same text twice
+        deduplication = st.radio("Duplicate texts:", ["Keep", "Skip exact duplicates", "Skip exact and near-duplicates"], horizontal=True,
+                                 help="Texts that only differ in case or whitespace are exact duplicates. Near-duplicates share most of their word sequences, e.g. boilerplate with small edits. "
+                                      "Each coded label can be saved for every duplicate of its text.")
+        duplicates = None
+        if deduplication != "Keep":
+            near_duplicates = deduplication == "Skip exact and near-duplicates"
+            threshold = st.slider("Near-duplicate similarity:", 0.5, 0.95, NEAR_DUPLICATE_THRESHOLD, 0.05, format="%0.2f",
+                                  help="Share of word sequences two texts must have in common to count as near-duplicates.") if near_duplicates else NEAR_DUPLICATE_THRESHOLD
+            groups = load_duplicate_groups(full_data, load_dataset_key(uploaded_file, shard_source=shard_source), text_column, near_duplicates, threshold)
+            if groups is None:
+                st.stop()
+            duplicates = (full_data, groups)
+            full_data = drop_duplicates(full_data, groups)
+            num_groups = groups[DUPLICATE_GROUP_COLUMN].n_unique()
+            st.write(f"{len(groups) - num_groups:,} duplicate texts skipped; sampling from {num_groups:,} distinct texts.")
+
+        # Get number of unique classes and their distribution, from the cached profile when available
+        class_distribution = None if shard_source or duplicates else class_distribution_from_profile(load_profile(uploaded_file, is_sample=False), label_column)
+        if class_distribution is None:
+            class_distribution = get_class_distribution(full_data, label_column)
         num_classes = len(class_distribution)
+        st.success(f"Full dataset successfully loaded! Total population: {class_distribution['counts'].sum():,} items")
         st.write(f"Number of unique classes detected: {num_classes}")
         
         # Visualize class distribution
@@ -102,13 +696,16 @@ def main():
             <li><strong>Binary Classification:</strong> Used when you have only two classes. It's simple and straightforward, but may not be suitable for complex multi-class problems.</li>
             <li><strong>Multi-class Random Sampling:</strong> Suitable for datasets with multiple classes where each class is well-represented. It ensures each item has an equal chance of being selected.</li>
             <li><strong>Stratified Sampling:</strong> Ideal for datasets with imbalanced class distributions. It ensures that the sample maintains the same class proportions as the full dataset.</li>
+            <li><strong>Uncertainty-weighted Sampling:</strong> Uses a confidence or probability column of the classifier to code more of its uncertain predictions. Every coded item is weighted by the inverse of its chance of being drawn, so accuracy and F1 still estimate the whole dataset.</li>
+            <li><strong>Sequential Sampling:</strong> Draws random items in small batches and tells you when the accuracy estimate has reached the target precision. When the classifier is very accurate this takes far fewer items than a fixed-size sample.</li>
         </ul>
         <p>The sample size is calculated based on your desired confidence level and margin of error. A larger sample size increases precision but requires more manual coding effort.</p>
         </div>
         """, unsafe_allow_html=True)
 
         sampling_method = st.radio("Choose sampling method:", 
-                                   ["Binary Classification", "Multi-class Random Sampling", "Stratified Sampling"],
+                                   ["Binary Classification", "Multi-class Random Sampling", "Stratified Sampling", "Sequential Sampling",
+                                    "Uncertainty-weighted Sampling"],
                                    index=["binary", "multi-class", "stratified"].index(suggested_method))
 
         if sampling_method == "Binary Classification" or sampling_method == "Multi-class Random Sampling":
@@ -122,39 +719,106 @@ def main():
             st.write(f"Calculated sample size: {sample_size}")
             
             if st.button("Generate Sample"):
-                st.session_state.coded_data = get_random_sample(full_data, sample_size)
-                st.session_state.unique_labels = sorted(full_data[label_column].unique().to_list())
-                st.session_state.current_index = 0
-                st.session_state.manual_labels = []
-                st.session_state.data_loaded = True
+                start_coding_session(get_random_sample(full_data, sample_size),
+                                     sorted(class_distribution[label_column].to_list()), text_column, label_column, coder,
+                                     duplicates=duplicates, shared=shared)
                 st.rerun()
 
         elif sampling_method == "Stratified Sampling":
-            min_samples_per_class = st.number_input("Minimum samples per class:", min_value=1, value=5,
-                                                    help="Set the minimum number of samples to include for each class.")
-            max_samples_per_class = st.number_input("Maximum samples per class:", min_value=min_samples_per_class, value=30,
-                                                    help="Set the maximum number of samples to include for each class.")
+            allocations = {
+                "Minimum/maximum per class": None,
+                "Neyman (fewest items)": "neyman",
+                "Cost-weighted": "cost",
+                "Proportional": "proportional"
+            }
+            allocation = allocations[st.radio("Stratum sizes:", list(allocations), horizontal=True,
+                                              help="Neyman allocation needs the fewest items for a target margin of error; with the results of an earlier sample it codes more items from the classes whose accuracy is most uncertain. "
+                                                   "Cost-weighted allocation also accounts for longer texts taking longer to code. "
+                                                   "Proportional allocation mirrors the class distribution.")]
+            if allocation is None:
+                min_samples_per_class = st.number_input("Minimum samples per class:", min_value=1, value=5,
+                                                        help="Set the minimum number of samples to include for each class.")
+                max_samples_per_class = st.number_input("Maximum samples per class:", min_value=min_samples_per_class, value=30,
+                                                        help="Set the maximum number of samples to include for each class.")
+                sample_sizes = None
+            else:
+                confidence_level = st.slider("Confidence level:", 0.80, 0.99, 0.95, 0.01, format="%0.2f")
+                margin_of_error = st.slider("Target margin of error of the accuracy:", 0.005, 0.10, 0.03, 0.005, format="%0.3f")
+                expected_accuracy = st.slider("Expected accuracy of the classifier:", 0.50, 0.99, 0.80, 0.01,
+                                              help="Used for classes without coded items in an earlier sample. 0.5 is the most conservative choice.")
+                earlier_results = st.file_uploader("Results of an earlier coded sample (optional)", type="csv",
+                                                   help="Results saved by this tool for the same classifier. Each class's accuracy in them sets how uncertain it is, "
+                                                        "so Neyman and cost-weighted allocation code more items from the classes the classifier gets wrong more often.")
+                if earlier_results is not None:
+                    earlier_coded = pl.read_csv(earlier_results).filter(pl.col('labels_match').is_not_null())
+                    class_accuracies = get_class_accuracies(earlier_coded, label_column, expected_accuracy)
+                    expected_accuracy = {label: class_accuracies.get(label, expected_accuracy) for label in class_distribution[label_column]}
+                min_samples_per_class = st.number_input("Minimum samples per class:", min_value=1, value=2,
+                                                        help="Every class gets at least this many items (or all of its items).")
+                max_samples_per_class = None
+                costs = get_class_text_lengths(full_data, label_column, text_column) if allocation == "cost" else None
+                sample_sizes = allocate_sample(class_distribution, label_column, margin_of_error, confidence_level, allocation,
+                                               expected_accuracy, costs, min_samples_per_class)
+                expected_margin = design_margin_of_error(class_distribution, label_column, sample_sizes, confidence_level, expected_accuracy)
+                st.write(f"Planned sample size: {sum(sample_sizes.values()):,} items "
+                         f"(expected margin of error ±{expected_margin:.3f} at {confidence_level:.0%} confidence)")
+                with st.expander("Per-class sample sizes"):
+                    st.write(class_distribution.select([label_column, 'counts']).with_columns(
+                        class_distribution[label_column].replace_strict(sample_sizes).alias('sample_size')))
 
             if st.button("Generate Stratified Sample"):
-                st.session_state.coded_data = get_stratified_sample(full_data, label_column, min_samples_per_class, max_samples_per_class, class_distribution)
-                st.session_state.unique_labels = sorted(full_data[label_column].unique().to_list())
-                st.session_state.current_index = 0
-                st.session_state.manual_labels = []
-                st.session_state.data_loaded = True
+                start_coding_session(get_stratified_sample(full_data, label_column, min_samples_per_class, max_samples_per_class, class_distribution,
+                                                           sample_sizes=sample_sizes),
+                                     sorted(class_distribution[label_column].to_list()), text_column, label_column, coder,
+                                     duplicates=duplicates, shared=shared)
                 st.write(f"Stratified sample generated. Total samples: {len(st.session_state.coded_data)}")
                 st.write("Sample class distribution:")
                 sample_distribution = get_class_distribution(st.session_state.coded_data, label_column)
                 st.write(sample_distribution)
                 st.rerun()
 
+        elif sampling_method == "Sequential Sampling":
+            confidence_level = st.slider("Confidence level:", 0.80, 0.99, 0.95, 0.01, format="%0.2f")
+            margin_of_error = st.slider("Target margin of error of the accuracy:", 0.005, 0.10, 0.05, 0.005, format="%0.3f")
+            # Every draw reads the drawn rows from the dataset (a full scan for lazy datasets), so batches are never tiny
+            batch_size = st.number_input("Items drawn per batch:", min_value=10, value=25,
+                                         help="Another random batch is drawn whenever the last drawn item is coded and the target precision is not reached yet.")
+            st.write(f"A fixed-size sample for this precision would need up to "
+                     f"{calculate_sample_size(confidence_level, margin_of_error, 1, 0.5):,} items.")
+
+            if st.button("Generate Sequential Sample"):
+                sampler = SequentialSampler(full_data, batch_size)
+                start_coding_session(sampler.extend(0), sorted(class_distribution[label_column].to_list()), text_column, label_column, coder,
+                                     sequential={'sampler': sampler, 'margin_of_error': margin_of_error,
+                                                 'confidence_level': confidence_level},
+                                     duplicates=duplicates, shared=shared)
+                st.rerun()
+
+        elif sampling_method == "Uncertainty-weighted Sampling":
+            numeric_columns = [col for col, dtype in full_data.collect_schema().items() if dtype.is_numeric() and col != label_column]
+            if not numeric_columns:
+                st.error("Uncertainty-weighted sampling needs a numeric confidence or probability column.")
+                st.stop()
+            confidence_column = st.selectbox("Select the column containing the classifier's confidence (0 to 1):", numeric_columns)
+            confidence_level = st.selectbox("Select confidence level:", [0.95, 0.99], format_func=lambda x: f"{x*100}%")
+            margin_of_error = st.slider("Select margin of error:", 0.01, 0.10, 0.05, 0.01, format="%0.2f")
+            min_weight = st.slider("Minimum sampling weight:", 0.01, 0.5, 0.05, 0.01,
+                                   help="Items are drawn with weight 1 - confidence, but never below this, so confident predictions are still checked.")
+            sample_size = calculate_sample_size(confidence_level, margin_of_error, 2, 0.5)
+            st.write(f"Calculated sample size: {sample_size}")
+
+            if st.button("Generate Weighted Sample"):
+                start_coding_session(get_weighted_sample(full_data, sample_size, confidence_column, min_weight),
+                                     sorted(class_distribution[label_column].to_list()), text_column, label_column, coder,
+                                     duplicates=duplicates, shared=shared)
+                st.rerun()
+
     else:  # "Upload pre-sampled dataset"
         uploaded_sample = st.file_uploader("Upload your pre-sampled dataset (CSV)", type="csv")
         working_data = load_data(uploaded_sample, is_sample=True)
         if working_data is None:
             st.stop()
         st.success(f"Pre-sampled dataset successfully loaded! Total samples: {len(working_data):,}")
-        st.session_state.data_loaded = True
-        st.session_state.coded_data = working_data
 
         # Column selection for pre-sampled dataset
         text_column = st.selectbox("Select the column containing the text to be coded:", working_data.columns)
@@ -163,9 +827,12 @@ def main():
         additional_columns = st.multiselect("Select additional columns to display (optional):", 
                                             [col for col in remaining_columns if col != label_column])
 
-        st.session_state.unique_labels = sorted(working_data[label_column].unique().to_list())
-        st.session_state.current_index = 0
-        st.session_state.manual_labels = []
+        # Only start over when a different file or label column is selected, not on every rerun
+        sample_key = (uploaded_sample.file_id if uploaded_sample is not None else None, label_column)
+        if st.session_state.get('sample_key') != sample_key:
+            st.session_state.sample_key = sample_key
+            start_coding_session(working_data, sorted(working_data[label_column].unique().to_list()), text_column, label_column, coder,
+                                 shared=shared)
 
     # Codebook section
     st.subheader("Codebook")
@@ -230,6 +897,7 @@ def main():
         
         # Load the codebook (custom if uploaded, otherwise default)
         codebook = load_codebook(codebook_file)
+        codebook_index = load_codebook_index(codebook_file)
         if codebook is None:
             st.warning("No codebook available. Please check if the default codebook is present or upload a custom codebook.")
         else:
@@ -240,128 +908,18 @@ def main():
                 display_codebook(codebook)
     else:
         codebook = None
+        codebook_index = None
         st.info("No codebook will be used for this session.")
 
-    # Create label to code mapping
     if 'data_loaded' in st.session_state and st.session_state.data_loaded:
-        unique_labels = st.session_state.unique_labels
-        label_to_code_mapping = create_label_to_code_mapping(unique_labels, codebook)
-
+        # Switching coders keeps the sample but opens the new coder's journal
+        if st.session_state.coder != coder or (st.session_state.work_queue is not None) != (shared and not st.session_state.sequential):
+            start_coding_session(st.session_state.coded_data, st.session_state.unique_labels, text_column, label_column, coder,
+                                 st.session_state.sequential, st.session_state.duplicates, shared)
         # Main coding interface
-        st.subheader("Coding Interface")
-        current_row = st.session_state.coded_data.row(st.session_state.current_index, named=True)
-        
-        col1, col2 = st.columns([2, 1])
-        with col1:
-            st.markdown(f"**Text to Code ({st.session_state.current_index + 1}/{len(st.session_state.coded_data)}):**")
-            st.write(current_row[text_column])
-            if additional_columns:
-                st.markdown("**Additional Information:**")
-                for col in additional_columns:
-                    st.write(f"{col}: {current_row[col]}")
-        with col2:
-            predicted_label = current_row[label_column]
-            st.markdown(f"**Predicted Label:** {predicted_label}")
-            
-            default_index = st.session_state.unique_labels.index(predicted_label) if predicted_label in st.session_state.unique_labels else 0
-            manual_label = st.selectbox("Select Manual Label", options=st.session_state.unique_labels, index=default_index)
-            
-            # Display coding instructions if available and codebook is used
-            if codebook and label_to_code_mapping:
-                matching_code = label_to_code_mapping.get(manual_label)
-                if matching_code and matching_code in codebook:
-                    st.markdown("**Coding Instructions:**")
-                    st.markdown(f"**Domain:** {codebook[matching_code]['domain']}")
-                    st.markdown(f"**Code:** {matching_code}")
-                    st.markdown(f"**{codebook[matching_code]['name']}**")
-                    st.markdown(codebook[matching_code]['description'])
-                else:
-                    st.warning("No matching coding instructions found for this label.")
-
-        # Add toggle for calculating statistics
-        calculate_stats = st.toggle("Calculate and display statistics", value=False)
-
-        # Navigation and submission
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            if st.button("⬅️ Previous") and st.session_state.current_index > 0:
-                st.session_state.current_index -= 1
-                st.rerun()
-        with col2:
-            if st.button("Submit"):
-                st.session_state.manual_labels.append({
-                    'text': current_row[text_column],
-                    'predicted_label': predicted_label,
-                    'manual_label': manual_label
-                })
-
-                if st.session_state.current_index < len(st.session_state.coded_data) - 1:
-                    if st.session_state.current_index < len(st.session_state.coded_data) - 1:
-                        st.session_state.current_index += 1
-                        st.rerun()
-                else:
-                    st.success("Coding completed!")
-        with col3:
-            if st.button("Next ➡️") and st.session_state.current_index < len(st.session_state.coded_data) - 1:
-                st.session_state.current_index += 1
-                st.rerun()
-
-        # Calculate and display statistics
-        if calculate_stats and len(st.session_state.manual_labels) > 0:
-            true_labels = [item['manual_label'] for item in st.session_state.manual_labels]
-            predicted_labels = [item['predicted_label'] for item in st.session_state.manual_labels]
-            metrics = calculate_metrics(true_labels, predicted_labels)
-            display_multi_class_stats(metrics)
-            
-            cm = get_confusion_matrix(true_labels, predicted_labels, st.session_state.unique_labels)
-            fig = plot_confusion_matrix(cm, st.session_state.unique_labels)
-            st.plotly_chart(fig, use_container_width=True)
-
-        # Save results with export options
-        if st.button("💾 Save Results"):
-            # Create a DataFrame with all columns from the original sample
-            results_df = st.session_state.coded_data.clone()
-            
-            # Create a dictionary to map text to manual labels
-            manual_label_dict = {item['text']: item['manual_label'] for item in st.session_state.manual_labels}
-            
-            # Add manual labels and comparison column
-            results_df = results_df.with_columns([
-                pl.col(text_column).map_dict(manual_label_dict).alias('manual_label'),
-                (pl.col(label_column) == pl.col(text_column).map_dict(manual_label_dict)).alias('labels_match')
-            ])
-            
-            # Replace None values in manual_label column with original label
-            results_df = results_df.with_columns([
-                pl.when(pl.col('manual_label').is_null()).then(pl.col(label_column)).otherwise(pl.col('manual_label')).alias('manual_label')
-            ])
-            
-            # Offer different export formats
-            export_format = st.radio("Choose export format:", ["CSV", "Excel", "JSON"])
-            
-            if export_format == "CSV":
-                csv = results_df.write_csv()
-                b64 = base64.b64encode(csv.encode()).decode()
-                href = f'<a href="data:file/csv;base64,{b64}" download="manually_coded_sample.csv">Download CSV File</a>'
-                st.markdown(href, unsafe_allow_html=True)
-            elif export_format == "Excel":
-                buffer = io.BytesIO()
-                results_df.write_excel(buffer)
-                b64 = base64.b64encode(buffer.getvalue()).decode()
-                href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="manually_coded_sample.xlsx">Download Excel File</a>'
-                st.markdown(href, unsafe_allow_html=True)
-            else:  # JSON
-                json_str = results_df.write_json()
-                b64 = base64.b64encode(json_str.encode()).decode()
-                href = f'<a href="data:file/json;base64,{b64}" download="manually_coded_sample.json">Download JSON File</a>'
-                st.markdown(href, unsafe_allow_html=True)
-            
-            st.success("Results ready for download")
-
-        # Progress bar
-        progress = min((len(st.session_state.manual_labels) + 1) / len(st.session_state.coded_data), 1.0)
-        st.progress(progress)
-        st.write(f"Progress: {progress:.1%}")
+        coding_interface(text_column, label_column, additional_columns, codebook, codebook_index)
+    else:
+        developer_panel()
 
     # Citation information
     st.subheader("📚 How to Cite")
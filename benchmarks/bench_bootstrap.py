@@ -0,0 +1,45 @@
+"""
+Time the vectorized bootstrap against per-replicate sklearn metrics.
+
+Usage:
+python benchmarks/bench_bootstrap.py --items 1000 5000 --replicates 10000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.statistics import bootstrap_confidence_intervals, calculate_metrics, confusion_matrix_from_codes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--classes", type=int, default=56)
+    parser.add_argument("--replicates", type=int, default=10000)
+    parser.add_argument("--accuracy", type=float, default=0.8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'items':>8}{'replicates':>12}{'vectorized s':>14}{'sklearn loop s (est.)':>23}")
+    for items in args.items:
+        true_codes = rng.integers(0, args.classes, items)
+        predicted_codes = np.where(rng.random(items) < args.accuracy, true_codes, rng.integers(0, args.classes, items))
+        cm = confusion_matrix_from_codes(true_codes, predicted_codes, args.classes)
+
+        start = time.perf_counter()
+        bootstrap_confidence_intervals(cm, n_replicates=args.replicates)
+        vectorized = time.perf_counter() - start
+
+        # Extrapolate the loop from 50 replicates
+        start = time.perf_counter()
+        for _ in range(50):
+            sample = rng.integers(0, items, items)
+            calculate_metrics(true_codes[sample], predicted_codes[sample])
+        loop = (time.perf_counter() - start) / 50 * args.replicates
+        print(f"{items:>8,}{args.replicates:>12,}{vectorized:>14.3f}{loop:>23.1f}")
+
+if __name__ == "__main__":
+    main()
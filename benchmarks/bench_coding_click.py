@@ -0,0 +1,120 @@
+"""
+Measure the work done per Previous/Next/Submit click on a large dataset.
+
+Before the coding interface became a fragment, every click re-executed the
+whole app: class distribution over the full dataset, the class distribution
+figure, the label-to-code mapping and then the coding interface. Now a click
+only re-executes the coding interface. The script times both paths and fails
+if the fragment path exceeds the latency target.
+
+Usage:
+python benchmarks/bench_coding_click.py --rows 1000000 --target-ms 10
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.codebook_index import CodebookIndex
+from src.metrics_accumulator import ConfusionAccumulator
+from src.sampling import get_stratified_sample
+from src.statistics import get_class_distribution, create_label_to_code_mapping
+from src.visualization import plot_class_distribution
+from synthetic import make_dataset
+
+CODEBOOK_PATH = Path(__file__).parent.parent / "data" / "default_codebook.json"
+
+def fragment_click(sample, index, unique_labels, codebook, codebook_index, accumulator):
+    """
+    Work done by the coding interface fragment for one Submit.
+    
+    Args:
+    sample: Coded sample DataFrame
+    index: Index of the current item
+    unique_labels: Sorted list of label values
+    codebook: Dictionary containing the codebook
+    codebook_index: CodebookIndex
+    accumulator: ConfusionAccumulator
+    """
+    row = sample.row(index % len(sample), named=True)
+    mapping = codebook_index.label_mapping(unique_labels)
+    code = mapping.get(row['label'])
+    if code in codebook:
+        codebook[code]['description']
+    accumulator.add(row['label'], row['label'])
+    accumulator.metrics()
+    accumulator.confusion_matrix()
+
+def full_rerun_click(data, sample, index, unique_labels, codebook, codebook_index, accumulator):
+    """
+    Work done per click when the whole app re-executed.
+    
+    Args:
+    data: Full dataset
+    sample: Coded sample DataFrame
+    index: Index of the current item
+    unique_labels: Sorted list of label values
+    codebook: Dictionary containing the codebook
+    codebook_index: CodebookIndex
+    accumulator: ConfusionAccumulator
+    """
+    class_distribution = get_class_distribution(data, 'label')
+    plot_class_distribution(class_distribution, 'label').to_json()
+    create_label_to_code_mapping(unique_labels, codebook)
+    fragment_click(sample, index, unique_labels, codebook, codebook_index, accumulator)
+
+def percentiles(fn, clicks):
+    """
+    Time repeated clicks.
+    
+    Args:
+    fn: Callable taking the click number
+    clicks: Number of clicks
+    
+    Returns:
+    Tuple of (median, p95) latency in milliseconds
+    """
+    latencies = []
+    for click in range(clicks):
+        start = time.perf_counter()
+        fn(click)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.median(latencies)), float(np.percentile(latencies, 95))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--clicks", type=int, default=50)
+    parser.add_argument("--target-ms", type=float, default=10.0,
+                        help="Maximum p95 latency of the fragment path per click")
+    args = parser.parse_args()
+
+    data = make_dataset(args.rows, text_length=200)
+    codebook = json.loads(CODEBOOK_PATH.read_text())
+    codebook_index = CodebookIndex(codebook)
+    class_distribution = get_class_distribution(data, 'label')
+    unique_labels = sorted(class_distribution['label'].to_list())
+    sample = get_stratified_sample(data, 'label', 5, 30, class_distribution)
+    accumulator = ConfusionAccumulator(unique_labels)
+
+    before = percentiles(lambda click: full_rerun_click(data, sample, click, unique_labels, codebook,
+                                                        codebook_index, accumulator), min(args.clicks, 10))
+    after = percentiles(lambda click: fragment_click(sample, click, unique_labels, codebook,
+                                                     codebook_index, accumulator), args.clicks)
+
+    print(f"rows={args.rows:,} sample={len(sample):,}")
+    print(f"{'':<16}{'median ms':>11}{'p95 ms':>10}")
+    print(f"{'full rerun':<16}{before[0]:>11.2f}{before[1]:>10.2f}")
+    print(f"{'fragment':<16}{after[0]:>11.2f}{after[1]:>10.2f}")
+    if after[1] > args.target_ms:
+        print(f"FAIL: fragment p95 {after[1]:.2f} ms exceeds target {args.target_ms:.0f} ms")
+        sys.exit(1)
+    print(f"OK: fragment p95 within {args.target_ms:.0f} ms target")
+
+if __name__ == "__main__":
+    main()
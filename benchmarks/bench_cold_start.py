@@ -0,0 +1,86 @@
+"""
+Measure the cold-start import time of app.py in fresh interpreters.
+
+Each run imports the app in a new process with -X importtime and reports
+the cumulative import time of the app and of each module it imports
+directly. Fails if the median exceeds the budget or if a dependency that
+should load on first use (sklearn, plotly express, pandas, xlsxwriter) is
+imported at startup.
+
+Usage:
+python benchmarks/bench_cold_start.py --runs 5 --budget-ms 1000
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).parent.parent
+LAZY_MODULES = ["sklearn", "plotly.express", "pandas", "xlsxwriter"]
+
+def import_times(module):
+    """
+    Import a module in a fresh interpreter and parse its import-time report.
+
+    Args:
+    module: Module to import, e.g. "app"
+
+    Returns:
+    List of (module name, nesting level, cumulative microseconds) in report order
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # The report indents nested imports by two spaces per level
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        times.append((name.strip(), level, int(cumulative)))
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000.0,
+                        help="Fail if the median cumulative import time exceeds this")
+    args = parser.parse_args()
+
+    totals = []
+    direct = defaultdict(list)
+    loaded = set()
+    for _ in range(args.runs):
+        # The report lists nested imports before the module that triggered them
+        children = []
+        for name, level, cumulative in import_times(args.module):
+            loaded.add(name)
+            if level == 1:
+                children.append((name, cumulative))
+            elif level == 0:
+                if name == args.module:
+                    totals.append(cumulative / 1000)
+                    for child, child_cumulative in children:
+                        direct[child].append(child_cumulative / 1000)
+                children = []
+
+    print(f"{'module':<32}{'median ms':>11}")
+    for name, samples in sorted(direct.items(), key=lambda item: -statistics.median(item[1])):
+        print(f"{name:<32}{statistics.median(samples):>11.1f}")
+    median = statistics.median(totals)
+    print(f"{args.module:<32}{median:>11.1f}")
+
+    eager = [module for module in LAZY_MODULES if module in loaded]
+    if eager:
+        print(f"FAIL: imported at startup: {', '.join(eager)}")
+        sys.exit(1)
+    if median > args.budget_ms:
+        print(f"FAIL: median import time {median:.0f} ms exceeds budget {args.budget_ms:.0f} ms")
+        sys.exit(1)
+    print(f"OK: median import time within {args.budget_ms:.0f} ms budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Compare per-click dataset access before and after the shared dataset store.
+
+Before: st.cache_data keeps a pickled copy and unpickles a fresh DataFrame on
+every call, i.e. on every Streamlit rerun. After: DatasetStore hands every
+rerun and every session the same memory-mapped frame.
+
+Usage:
+python benchmarks/bench_dataset_store.py --rows 1000000 --sessions 4
+"""
+import argparse
+import pickle
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.dataset_store import DatasetStore
+from synthetic import make_dataset
+
+def session_bytes(frames):
+    """
+    Get the memory held by per-session frames, counting each distinct frame once.
+    
+    Args:
+    frames: Frames returned to each session
+    
+    Returns:
+    Average bytes per session beyond the one shared copy
+    """
+    distinct = {id(frame): frame for frame in frames}
+    return sum(frame.estimated_size() for frame in distinct.values()) * (len(distinct) - 1) / len(distinct) / len(frames) if len(distinct) > 1 else 0.0
+
+def time_calls(fn, clicks):
+    """
+    Time repeated calls of fn.
+    
+    Args:
+    fn: Zero-argument callable simulating one rerun
+    clicks: Number of calls
+    
+    Returns:
+    Median latency in milliseconds
+    """
+    latencies = []
+    for _ in range(clicks):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.median(latencies))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--clicks", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = Path(tmp) / "data.arrow"
+        make_dataset(args.rows).write_ipc(data_path, compression="uncompressed")
+
+        pickled = pickle.dumps(pl.read_ipc(data_path))
+        copies = [pickle.loads(pickled) for _ in range(args.sessions)]
+        cache_data_memory = session_bytes(copies)
+        cache_data_latency = time_calls(lambda: pickle.loads(pickled), args.clicks)
+        del copies
+
+        store = DatasetStore()
+        store.put("dataset", pl.read_ipc(data_path))
+        shared = [store.get("dataset") for _ in range(args.sessions)]
+        store_memory = session_bytes(shared)
+        store_latency = time_calls(lambda: store.get("dataset"), args.clicks)
+
+    print(f"rows={args.rows:,} sessions={args.sessions} clicks={args.clicks}")
+    print(f"{'':<16}{'per-click ms':>14}{'per-session MB':>16}")
+    print(f"{'st.cache_data':<16}{cache_data_latency:>14.2f}{cache_data_memory / 1e6:>16.1f}")
+    print(f"{'DatasetStore':<16}{store_latency:>14.4f}{store_memory / 1e6:>16.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+Time and memory-profile every pipeline stage on synthetic corpora.
+
+Covers loading (cold and warm), class distribution, random and stratified
+sampling, metrics, confusion matrix, label-to-code mapping and the Save
+Results export for each format, over a grid of row counts and class counts.
+Results are written as JSON; pass an earlier results file with --compare to
+see per-stage ratios and fail on regressions.
+
+Usage:
+python benchmarks/bench_pipeline.py --rows 10000 100000 1000000 --classes 50 500 --output pipeline.json
+python benchmarks/bench_pipeline.py --output new.json --compare pipeline.json --max-regression 1.5
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+# Keep the dataset cache of the benchmark away from the app's cache
+BENCH_CACHE_DIR = Path(tempfile.mkdtemp(prefix="mcv-bench-"))
+os.environ["MCV_CACHE_DIR"] = str(BENCH_CACHE_DIR)
+
+import numpy as np
+import polars as pl
+import streamlit.logger
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.coding_store import CodingStore
+from src.data_io import DEFAULT_CODEBOOK_PATH, read_codebook
+from src.data_loading import load_data, scan_data, _cache_entry, get_dataset_store
+from src.export import EXPORT_FORMATS, build_results, results_file
+from src.sampling import get_random_sample, get_stratified_sample, calculate_sample_size
+from src.statistics import get_class_distribution, calculate_metrics, get_confusion_matrix, create_label_to_code_mapping
+from synthetic import make_dataset
+
+# The cached loaders run outside a Streamlit session here; silence the bare-mode warnings
+streamlit.logger.set_log_level("error")
+
+RSS_POLL_INTERVAL = 0.005
+
+def _rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def profile_memory(fn):
+    """
+    Run fn once and record its peak memory use.
+
+    Polars allocates outside the Python heap, so resident memory is polled
+    from a background thread in addition to tracemalloc's Python peak.
+
+    Args:
+    fn: Zero-argument callable
+
+    Returns:
+    Tuple of (peak resident memory above the starting point in MB, peak traced Python memory in MB);
+    the resident figure is None where /proc is not available
+    """
+    peak_rss = None
+    stop = threading.Event()
+    if os.path.exists("/proc/self/statm"):
+        baseline = _rss_bytes()
+        peak_rss = baseline
+
+        def poll():
+            nonlocal peak_rss
+            while not stop.is_set():
+                peak_rss = max(peak_rss, _rss_bytes())
+                time.sleep(RSS_POLL_INTERVAL)
+
+        poller = threading.Thread(target=poll, daemon=True)
+        poller.start()
+    tracemalloc.start()
+    try:
+        fn()
+    finally:
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stop.set()
+    if peak_rss is not None:
+        poller.join()
+        peak_rss = max(peak_rss, _rss_bytes()) - baseline
+        peak_rss = peak_rss / 2**20
+    return peak_rss, python_peak / 2**20
+
+def measure(stage, fn, repeats, setup=None):
+    """
+    Time a stage and profile its memory.
+
+    One untimed warm-up run comes first, so lazily imported dependencies
+    (e.g. sklearn) do not count against the stage.
+
+    Args:
+    stage: Stage name
+    fn: Zero-argument callable running the stage
+    repeats: Number of timed runs
+    setup: Optional zero-argument callable run untimed before every run
+
+    Returns:
+    Dictionary with the stage name, timings in seconds and peak memory in MB
+    """
+    if setup:
+        setup()
+    fn()
+    timings = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    if setup:
+        setup()
+    peak_rss_mb, python_peak_mb = profile_memory(fn)
+    return {
+        'stage': stage,
+        'median_s': statistics.median(timings),
+        'min_s': min(timings),
+        'peak_rss_mb': peak_rss_mb,
+        'python_peak_mb': python_peak_mb
+    }
+
+def reset_caches():
+    """
+    Forget every cached dataset so the next load converts the CSV again.
+    """
+    _cache_entry.clear()
+    get_dataset_store().clear()
+    for path in BENCH_CACHE_DIR.iterdir():
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+
+def code_sample(sample, accuracy, seed=0):
+    """
+    Simulate manual coding: keep the predicted label for a share of items and pick another label otherwise.
+
+    Args:
+    sample: Polars DataFrame with a 'label' column
+    accuracy: Share of items whose manual label equals the predicted label
+    seed: Random seed
+
+    Returns:
+    CodingStore with a manual label for every row, as kept by the app
+    """
+    rng = np.random.default_rng(seed)
+    predicted = sample['label'].to_list()
+    labels = sorted(set(predicted))
+    store = CodingStore(len(sample), labels)
+    store.set_many(np.arange(len(sample)),
+                   [label if rng.random() < accuracy else labels[rng.integers(len(labels))] for label in predicted])
+    return store
+
+def run_grid(rows, num_classes, args, codebook, workdir):
+    """
+    Benchmark every stage on one synthetic corpus.
+
+    Args:
+    rows: Number of rows
+    num_classes: Number of distinct labels
+    args: Parsed command-line arguments
+    codebook: Codebook used for the label-to-code mapping
+    workdir: Directory for the generated CSV
+
+    Returns:
+    List of result dictionaries
+    """
+    csv_path = workdir / f"corpus-{rows}-{num_classes}.csv"
+    make_dataset(rows, text_length=args.text_length, num_classes=num_classes).write_csv(csv_path)
+    results = [
+        measure("load_data (cold)", lambda: load_data(csv_path), args.repeats, setup=reset_caches),
+        measure("load_data (warm)", lambda: load_data(csv_path), args.repeats)
+    ]
+    data = load_data(csv_path)
+    lazy_data = scan_data(csv_path)
+    results.append(measure("get_class_distribution", lambda: get_class_distribution(data, 'label'), args.repeats))
+    results.append(measure("get_class_distribution (lazy)", lambda: get_class_distribution(lazy_data, 'label'),
+                           args.repeats))
+    class_distribution = get_class_distribution(data, 'label')
+
+    sample_size = min(calculate_sample_size(0.95, 0.05, num_classes), rows)
+    results.append(measure("get_random_sample", lambda: get_random_sample(data, sample_size), args.repeats))
+    results.append(measure("get_stratified_sample",
+                           lambda: get_stratified_sample(data, 'label', args.min_per_class, args.max_per_class,
+                                                         class_distribution), args.repeats))
+    results.append(measure("get_stratified_sample (lazy)",
+                           lambda: get_stratified_sample(lazy_data, 'label', args.min_per_class, args.max_per_class,
+                                                         class_distribution), args.repeats))
+
+    sample = get_stratified_sample(data, 'label', args.min_per_class, args.max_per_class, class_distribution)
+    manual_labels = code_sample(sample, args.accuracy)
+    true_labels = manual_labels.to_frame()['manual_label'].to_list()
+    predicted_labels = sample['label'].to_list()
+    unique_labels = sorted(class_distribution['label'].to_list())
+    results.append(measure("calculate_metrics", lambda: calculate_metrics(true_labels, predicted_labels), args.repeats))
+    results.append(measure("get_confusion_matrix",
+                           lambda: get_confusion_matrix(true_labels, predicted_labels, unique_labels), args.repeats))
+    results.append(measure("create_label_to_code_mapping",
+                           lambda: create_label_to_code_mapping(unique_labels, codebook), args.repeats))
+    for export_format in EXPORT_FORMATS:
+        results.append(measure(f"save_results ({export_format})",
+                               lambda: results_file(build_results(sample, manual_labels, 'label'), export_format).close(),
+                               args.repeats))
+
+    csv_path.unlink()
+    for result in results:
+        result.update({'rows': rows, 'classes': num_classes, 'sample_items': len(sample)})
+    return results
+
+def git_revision():
+    """
+    Get the checked-out commit, if the benchmark runs from a git checkout.
+
+    Returns:
+    Commit hash or None
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=Path(__file__).parent, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path, max_regression):
+    """
+    Print per-stage time ratios against an earlier results file.
+
+    Args:
+    results: List of result dictionaries of this run
+    baseline_path: Path of the earlier results file
+    max_regression: Ratio above which a stage counts as a regression, or None
+
+    Returns:
+    List of regressed (stage, rows, classes, ratio) tuples
+    """
+    baseline = {
+        (result['stage'], result['rows'], result['classes']): result
+        for result in json.loads(Path(baseline_path).read_text())['results']
+    }
+    regressions = []
+    print(f"\n{'stage':<34}{'rows':>12}{'classes':>9}{'baseline s':>12}{'now s':>10}{'ratio':>8}")
+    for result in results:
+        key = (result['stage'], result['rows'], result['classes'])
+        if key not in baseline:
+            continue
+        ratio = result['median_s'] / max(baseline[key]['median_s'], 1e-9)
+        print(f"{key[0]:<34}{key[1]:>12,}{key[2]:>9}{baseline[key]['median_s']:>12.4f}{result['median_s']:>10.4f}"
+              f"{ratio:>7.2f}x")
+        if max_regression is not None and ratio > max_regression:
+            regressions.append((*key, ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="Row counts to generate (add 10000000 for the largest corpora)")
+    parser.add_argument("--classes", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--text-length", type=int, default=400)
+    parser.add_argument("--min-per-class", type=int, default=5)
+    parser.add_argument("--max-per-class", type=int, default=30)
+    parser.add_argument("--accuracy", type=float, default=0.8, help="Simulated agreement of manual and predicted labels")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default="pipeline_benchmark.json")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="With --compare, fail if a stage is slower than the baseline by more than this ratio")
+    args = parser.parse_args()
+
+    codebook = read_codebook(DEFAULT_CODEBOOK_PATH)
+    results = []
+    workdir = Path(tempfile.mkdtemp(prefix="mcv-bench-data-"))
+    try:
+        print(f"{'stage':<34}{'rows':>12}{'classes':>9}{'median s':>10}{'peak RSS MB':>13}{'Python MB':>11}")
+        for rows in args.rows:
+            for num_classes in args.classes:
+                for result in run_grid(rows, num_classes, args, codebook, workdir):
+                    rss = f"{result['peak_rss_mb']:.1f}" if result['peak_rss_mb'] is not None else "n/a"
+                    print(f"{result['stage']:<34}{rows:>12,}{num_classes:>9}{result['median_s']:>10.4f}{rss:>13}"
+                          f"{result['python_peak_mb']:>11.1f}")
+                    results.append(result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        shutil.rmtree(BENCH_CACHE_DIR, ignore_errors=True)
+
+    Path(args.output).write_text(json.dumps({
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'polars': pl.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'arguments': vars(args)
+        },
+        'results': results
+    }, indent=2))
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.max_regression)
+        if regressions:
+            for stage, rows, num_classes, ratio in regressions:
+                print(f"FAIL: {stage} at {rows:,} rows / {num_classes} classes is {ratio:.2f}x slower")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Compare the single-pass stratified sampler against the per-class filter loop it replaced.
+
+The loop runs one filter over the full frame per class (O(classes x rows));
+the single-pass sampler ranks a seeded random key within each class once.
+Also checks that the weighted accuracy of a Neyman-allocated sample
+recovers the population accuracy, and exits non-zero if it does not.
+
+Usage:
+python benchmarks/bench_stratified_sampling.py --rows 1000000 10000000 --classes 56
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.sampling import SAMPLE_WEIGHT_COLUMN, get_stratified_sample, get_stratum_sizes, stratified_reservoir_sample, allocate_sample
+from src.statistics import get_class_distribution
+from src.metrics_accumulator import ConfusionAccumulator
+from synthetic import make_dataset
+
+def per_class_loop_sample(data, label_column, sample_sizes):
+    """
+    The previous implementation: one filter and sample per class.
+    
+    Args:
+    data: Polars DataFrame
+    label_column: Name of the label column
+    sample_sizes: Dictionary mapping labels to their sample size
+    
+    Returns:
+    Polars DataFrame with stratified samples
+    """
+    sampled_data = []
+    for label, size in sample_sizes.items():
+        class_data = data.filter(pl.col(label_column) == label).sample(n=size, seed=42)
+        sampled_data.append(class_data)
+    return pl.concat(sampled_data)
+
+def best_of(fn, repeats):
+    """
+    Run fn several times and keep the fastest wall time.
+    
+    Args:
+    fn: Zero-argument callable
+    repeats: Number of runs
+    
+    Returns:
+    Fastest wall time in seconds
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def check_allocation_weights(rows, num_classes, margin_of_error=0.01, seed=0):
+    """
+    Code a Neyman-allocated sample of a skewed dataset whose classes differ in accuracy.
+    
+    Args:
+    rows: Number of rows
+    num_classes: Number of classes
+    margin_of_error: Target margin of error of the allocation
+    seed: Random seed of the simulated manual labels
+    
+    Returns:
+    Tuple of (population accuracy, weighted sample accuracy, unweighted sample accuracy)
+    """
+    data = make_dataset(rows, text_length=8, num_classes=num_classes)
+    class_distribution = get_class_distribution(data, 'label')
+    labels = class_distribution['label'].to_list()
+    # The frequent classes are predicted well, the rare ones poorly
+    accuracy = dict(zip(labels, np.linspace(0.99, 0.55, len(labels))))
+    rng = np.random.default_rng(seed)
+    correct = rng.random(rows) < data['label'].replace_strict(accuracy, return_dtype=pl.Float64).to_numpy()
+    data = data.with_columns(pl.when(pl.Series(correct)).then(pl.col('label')).otherwise(pl.lit('other')).alias('manual_label'))
+    sample_sizes = allocate_sample(class_distribution, 'label', margin_of_error, 0.95, "neyman", accuracy)
+    sample = get_stratified_sample(data, 'label', None, None, class_distribution, sample_sizes=sample_sizes)
+    results = []
+    for weights in (sample[SAMPLE_WEIGHT_COLUMN], None):
+        accumulator = ConfusionAccumulator(labels + ['other'], weighted=weights is not None)
+        accumulator.add_many(sample['manual_label'], sample['label'], weights)
+        results.append(accumulator.metrics()['accuracy'])
+    return float(correct.mean()), results[0], results[1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--classes", type=int, default=56)
+    parser.add_argument("--text-length", type=int, default=40)
+    parser.add_argument("--min-per-class", type=int, default=5)
+    parser.add_argument("--max-per-class", type=int, default=30)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>12}{'classes':>9}{'loop s':>10}{'single-pass s':>15}{'reservoir s':>13}{'speedup':>9}")
+    for rows in args.rows:
+        data = make_dataset(rows, text_length=args.text_length, num_classes=args.classes)
+        class_distribution = get_class_distribution(data, 'label')
+        sample_sizes = get_stratum_sizes(class_distribution, 'label', args.min_per_class, args.max_per_class)
+
+        loop_time = best_of(lambda: per_class_loop_sample(data, 'label', sample_sizes), args.repeats)
+        single_pass_time = best_of(lambda: get_stratified_sample(data, 'label', args.min_per_class, args.max_per_class,
+                                                                 class_distribution), args.repeats)
+        reservoir_time = best_of(lambda: stratified_reservoir_sample(data.iter_slices(500_000), 'label', sample_sizes),
+                                 args.repeats)
+        print(f"{rows:>12,}{args.classes:>9}{loop_time:>10.3f}{single_pass_time:>15.3f}{reservoir_time:>13.3f}"
+              f"{loop_time / single_pass_time:>8.1f}x")
+
+    margin_of_error = 0.01
+    population, weighted, unweighted = check_allocation_weights(args.rows[0], args.classes, margin_of_error)
+    print(f"Neyman allocation: population accuracy {population:.4f}, weighted sample {weighted:.4f}, "
+          f"unweighted sample {unweighted:.4f}")
+    # Three times the 95% margin of error, so a correct estimator practically never fails the check
+    if abs(weighted - population) > 3 * margin_of_error:
+        print(f"FAIL: weighted accuracy is off by more than {3 * margin_of_error}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
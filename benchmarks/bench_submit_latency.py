@@ -0,0 +1,129 @@
+"""
+Measure the time from Submit to the next text with statistics switched on.
+
+With the statistics panel open, every Submit used to recompute the metrics,
+per-class metrics, the statistics CSV and the confusion matrix figure before
+the next text was shown, and every last item of a sequential batch drew the
+next batch from the full dataset. Now both run in a background thread: the
+Submit only updates the confusion matrix, hands a copy of it to the
+background pool and takes the next batch that was drawn while the coder
+read the last items of the previous one. The script codes a sequential
+sample of every dataset size both ways, compares the Submit latency of the
+first and last coded items, and fails if the background path exceeds the
+latency target.
+
+Usage:
+python benchmarks/bench_submit_latency.py --rows 100000 1000000 --items 200 --target-ms 10
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.background import BackgroundTasks
+from src.confusion import MAX_HEATMAP_LABELS
+from src.export import metrics_summary
+from src.metrics_accumulator import ConfusionAccumulator, metrics_from_confusion_matrix, hierarchical_metrics
+from src.sampling import SequentialSampler
+from src.visualization import plot_confusion_matrix
+from synthetic import make_dataset
+
+PREFETCH_ITEMS = 10
+
+def statistics(cm, labels):
+    """
+    Work done for the statistics panel after every Submit (as compute_statistics in app.py, without intervals).
+
+    Args:
+    cm: Confusion matrix
+    labels: Label values in matrix order
+    """
+    metrics = metrics_from_confusion_matrix(cm)
+    detailed = hierarchical_metrics(cm, labels)
+    metrics_summary(metrics, None, labels, detailed).write_csv()
+    if len(labels) <= MAX_HEATMAP_LABELS:
+        plot_confusion_matrix(cm, labels).to_json()
+
+def code_sample(sampler, unique_labels, items, background=None, think_ms=0.0):
+    """
+    Code a sequential sample and time every Submit.
+
+    Args:
+    sampler: SequentialSampler over the dataset
+    unique_labels: Sorted list of label values
+    items: Number of items to code
+    background: BackgroundTasks to compute statistics and draw batches in, or None to do both in the Submit
+    think_ms: Pause between Submits, in which the coder reads the next text
+
+    Returns:
+    Array of Submit latencies in milliseconds
+    """
+    rng = np.random.default_rng(0)
+    accumulator = ConfusionAccumulator(unique_labels)
+    sample = sampler.extend(0)
+    latencies = []
+    for item_index in range(items):
+        drawn = len(sample)
+        if background is not None and drawn - item_index <= PREFETCH_ITEMS:
+            background.submit('next_batch', drawn, sampler.extend, drawn)
+        predicted_label = sample['label'][item_index]
+        manual_label = predicted_label if rng.random() < 0.8 else unique_labels[int(rng.integers(len(unique_labels)))]
+        if think_ms:
+            time.sleep(think_ms / 1000)
+
+        start = time.perf_counter()
+        accumulator.add(manual_label, predicted_label)
+        if item_index == drawn - 1:
+            if background is None:
+                batch = sampler.extend(drawn)
+            else:
+                batch = background.get('next_batch', drawn, sampler.extend, drawn)
+            sample = sample.vstack(batch)
+        if background is None:
+            statistics(accumulator.confusion_matrix(), list(accumulator.labels))
+        else:
+            background.submit('statistics', accumulator.version, statistics,
+                              accumulator.confusion_matrix(), list(accumulator.labels))
+        sample.row(item_index + 1, named=True)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.asarray(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--items", type=int, default=200, help="Items coded per dataset size")
+    parser.add_argument("--classes", type=int, default=40)
+    parser.add_argument("--batch-size", type=int, default=25)
+    parser.add_argument("--think-ms", type=float, default=100.0, help="Pause between Submits on the background path")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--target-ms", type=float, default=10.0, help="Maximum p95 Submit latency of the background path")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'rows':>12}{'path':>12}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'first p95':>11}{'last p95':>10}")
+    with ThreadPoolExecutor(args.workers) as executor:
+        for rows in args.rows:
+            data = make_dataset(rows, text_length=200, num_classes=args.classes)
+            unique_labels = sorted(data['label'].unique().to_list())
+            for path in ("sync", "background"):
+                background = BackgroundTasks(executor) if path == "background" else None
+                latencies = code_sample(SequentialSampler(data, args.batch_size), unique_labels, args.items,
+                                        background, args.think_ms if background is not None else 0.0)
+                quarter = max(len(latencies) // 4, 1)
+                p50, p95 = np.percentile(latencies, [50, 95])
+                first, last = np.percentile(latencies[:quarter], 95), np.percentile(latencies[-quarter:], 95)
+                print(f"{rows:>12,}{path:>12}{p50:>9.2f}{p95:>9.2f}{latencies.max():>9.2f}{first:>11.2f}{last:>10.2f}")
+                if background is not None and p95 > args.target_ms:
+                    failures.append(f"background p95 {p95:.2f} ms at {rows:,} rows exceeds target {args.target_ms:.0f} ms")
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print(f"OK: background Submit p95 within {args.target_ms:.0f} ms target at every dataset size")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Load-test the shared work queue with many coders submitting at once.
+
+Every simulated coder opens its own connection to one SQLite queue, leases
+batches of items and submits them as fast as it can (or with --think-ms
+between Submits), like the Streamlit sessions of a team splitting a sample.
+Some coders can abandon their first batch (--abandon) to exercise lease
+expiry: their items must be reclaimed by the others. The script reports
+throughput and Submit latency percentiles, checks that every item was coded
+exactly once and fails if the p99 Submit latency exceeds the target.
+
+Usage:
+python benchmarks/bench_work_queue.py --items 20000 --coders 48 --target-ms 50
+python benchmarks/bench_work_queue.py --coders 24 --processes --abandon 0.1
+"""
+import argparse
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.work_queue import WorkQueue
+
+LABELS = [f"{code} label" for code in (101, 102, 103, 201, 202, 301, 401, 501)]
+
+def run_coder(path, coder, num_items, batch_size, lease_seconds, think_ms, abandon, start_at):
+    """
+    Code items from the queue until every item of the sample is coded.
+
+    Args:
+    path: Path of the queue database
+    coder: Coder name
+    num_items: Number of items in the sample
+    batch_size: Items leased at once
+    lease_seconds: Lease duration
+    think_ms: Pause before every Submit, in milliseconds
+    abandon: Leave after leasing the first batch, without submitting or releasing it
+    start_at: Wall-clock time at which all coders start
+
+    Returns:
+    Tuple of (Submit latencies in ms, lease latencies in ms, accepted Submits, rejected Submits)
+    """
+    queue = WorkQueue(path, num_items, lease_seconds=lease_seconds)
+    rng = np.random.default_rng(abs(hash(coder)) % 2**32)
+    submit_latencies, lease_latencies = [], []
+    accepted = rejected = 0
+    time.sleep(max(start_at - time.time(), 0))
+    while True:
+        start = time.perf_counter()
+        items = queue.lease(coder, batch_size)
+        lease_latencies.append((time.perf_counter() - start) * 1000)
+        if abandon:
+            break
+        if not items:
+            if queue.progress()['coded'] >= num_items:
+                break
+            # Everything left is leased to others; wait for their Submits or for an abandoned lease to expire
+            time.sleep(min(lease_seconds / 4, 0.5))
+            continue
+        for item_index in items:
+            if think_ms:
+                time.sleep(rng.exponential(think_ms) / 1000)
+            start = time.perf_counter()
+            if queue.submit(coder, item_index, LABELS[int(rng.integers(len(LABELS)))]):
+                accepted += 1
+            else:
+                rejected += 1
+            submit_latencies.append((time.perf_counter() - start) * 1000)
+    queue.close()
+    return submit_latencies, lease_latencies, accepted, rejected
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=20_000)
+    parser.add_argument("--coders", type=int, default=48)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--lease-seconds", type=float, default=2.0,
+                        help="Lease duration; short, so abandoned batches are reclaimed during the run")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Mean pause before every Submit")
+    parser.add_argument("--abandon", type=float, default=0.0, help="Share of coders who abandon their first batch")
+    parser.add_argument("--processes", action="store_true",
+                        help="Run every coder in its own process instead of a thread of one server process")
+    parser.add_argument("--target-ms", type=float, default=50.0, help="Maximum p99 Submit latency")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "queue.sqlite"
+        WorkQueue(path, args.items).close()
+        abandoning = int(round(args.coders * args.abandon))
+        start_at = time.time() + 1.0
+        executor = ProcessPoolExecutor if args.processes else ThreadPoolExecutor
+        with executor(args.coders) as pool:
+            futures = [pool.submit(run_coder, path, f"coder-{coder:03d}", args.items, args.batch_size, args.lease_seconds,
+                                   args.think_ms, coder < abandoning, start_at)
+                       for coder in range(args.coders)]
+            results = [future.result() for future in futures]
+        elapsed = time.time() - start_at
+
+        queue = WorkQueue(path, args.items)
+        decisions = queue.decisions()
+        queue.close()
+
+    submit_latencies = np.concatenate([np.asarray(submits, dtype=float) for submits, _, _, _ in results])
+    lease_latencies = np.concatenate([np.asarray(leases, dtype=float) for _, leases, _, _ in results])
+    accepted = sum(result[2] for result in results)
+    rejected = sum(result[3] for result in results)
+    mode = "processes" if args.processes else "threads"
+
+    print(f"items={args.items:,} coders={args.coders} ({abandoning} abandoning) batch={args.batch_size} in {mode}")
+    print(f"{accepted:,} Submits in {elapsed:.2f} s: {accepted / elapsed:,.0f} Submits/s, {rejected:,} rejected")
+    print(f"{'':<10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, latencies in (("submit", submit_latencies), ("lease", lease_latencies)):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"{name:<10}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}{latencies.max():>9.2f}")
+
+    failures = []
+    if len(decisions) != args.items or decisions['item_index'].n_unique() != args.items:
+        failures.append(f"{len(decisions):,} of {args.items:,} items coded")
+    if accepted != args.items:
+        failures.append(f"{accepted:,} accepted Submits for {args.items:,} items")
+    p99 = np.percentile(submit_latencies, 99)
+    if p99 > args.target_ms:
+        failures.append(f"Submit p99 {p99:.2f} ms exceeds target {args.target_ms:.0f} ms")
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print(f"OK: every item coded once, Submit p99 within {args.target_ms:.0f} ms target")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Synthetic corpora shaped like manifesto/social media coding data for the benchmarks.
+"""
+import numpy as np
+import polars as pl
+
+def make_dataset(rows, text_length=400, num_classes=56, seed=0):
+    """
+    Generate a synthetic corpus with long text and a skewed label column.
+    
+    Args:
+    rows: Number of rows
+    text_length: Approximate number of characters per text
+    num_classes: Number of distinct labels
+    seed: Random seed
+    
+    Returns:
+    Polars DataFrame with 'text' and 'label' columns
+    """
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, num_classes + 1)
+    labels = rng.choice([f"per{100 + i}" for i in range(num_classes)], size=rows, p=weights / weights.sum())
+    words = np.array(["policy", "government", "economy", "military", "welfare", "education", "freedom", "market"])
+    base = " ".join(rng.choice(words, size=text_length // 8))
+    return pl.DataFrame({
+        'text': pl.Series([base] * rows) + pl.Series(np.arange(rows).astype(str)),
+        'label': labels
+    })
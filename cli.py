@@ -0,0 +1,269 @@
+"""
+Headless command line for sampling, metrics and export.
+
+Runs the same loading, sampling and statistics code as the app without
+importing Streamlit or Plotly, so samples can be drawn and coded results
+re-scored in batch pipelines, one dataset per worker process.
+
+Usage:
+python cli.py sample data/preprocessed_data.csv --label-column label --method stratified --output sample.parquet
+python cli.py sample "predictions/run-42/*.parquet" --label-column label --method stratified --output sample.parquet
+python cli.py metrics manually_coded_sample.csv --label-column label --output metrics.csv --confusion-matrix confusion.csv
+python cli.py propagate data/preprocessed_data.csv manually_coded_sample.csv --text-column text --label-column label --dedup near --output all_duplicates.csv
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import polars as pl
+
+from src.data_io import default_dataset_path, open_dataset, scan_table, read_codebook
+from src.dataset_cache import class_distribution_from_profile
+from src.shards import ShardedDataset, find_shards, is_shard_source
+from src.sampling import SAMPLE_WEIGHT_COLUMN, get_random_sample, get_weighted_sample, get_stratified_sample, calculate_sample_size, allocate_sample, ALLOCATION_METHODS
+from src.statistics import get_class_distribution, get_class_text_lengths, get_class_accuracies, suggest_sampling_method, bootstrap_confidence_intervals, create_label_to_code_mapping, label_domains
+from src.metrics_accumulator import ConfusionAccumulator
+from src.export import format_for_path, write_results, metrics_summary
+from src.confusion import confusion_cells
+from src.dedup import DUPLICATE_GROUP_COLUMN, NEAR_DUPLICATE_THRESHOLD, find_duplicate_groups, drop_duplicates, propagate_labels
+
+def load_dataset(path, label_column, lazy=False):
+    """
+    Load a dataset and its class distribution.
+
+    CSV files go through the dataset cache, so the distribution comes from the
+    cached profile; other formats are scanned directly. Directories and glob
+    patterns are opened as sharded datasets.
+
+    Args:
+    path: Path of the dataset, or a directory or glob pattern of shards
+    label_column: Name of the predicted label column
+    lazy: Keep the dataset lazy and only materialize the sampled rows
+
+    Returns:
+    Tuple of (Polars DataFrame, LazyFrame or ShardedDataset, class distribution DataFrame)
+    """
+    if is_shard_source(path):
+        data = ShardedDataset(find_shards(path))
+        class_distribution = None
+    elif Path(path).suffix.lower() == ".csv":
+        data, profile = open_dataset(path, lazy=lazy)
+        class_distribution = class_distribution_from_profile(profile, label_column)
+    else:
+        data = scan_table(path)
+        if not lazy:
+            data = data.collect()
+        class_distribution = None
+    if class_distribution is None:
+        class_distribution = get_class_distribution(data, label_column)
+    return data, class_distribution
+
+def duplicate_groups(data, args):
+    """
+    Group the duplicate texts of a dataset as requested by --dedup.
+
+    Args:
+    data: Polars DataFrame, LazyFrame or ShardedDataset
+    args: Parsed command-line arguments with text_column, dedup and similarity
+
+    Returns:
+    Polars DataFrame returned by find_duplicate_groups
+    """
+    if args.text_column is None:
+        raise ValueError("Skipping duplicates needs --text-column")
+    return find_duplicate_groups(data, args.text_column, args.dedup == "near", args.similarity)
+
+def draw_sample(args):
+    """
+    Draw a random, stratified or uncertainty-weighted sample and write it to a file.
+
+    Args:
+    args: Parsed command-line arguments of the sample command
+    """
+    export_format = format_for_path(args.output)
+    data, class_distribution = load_dataset(args.dataset, args.label_column, args.lazy)
+    if args.dedup:
+        groups = duplicate_groups(data, args)
+        data = drop_duplicates(data, groups)
+        class_distribution = get_class_distribution(data, args.label_column)
+        print(f"{len(groups) - groups[DUPLICATE_GROUP_COLUMN].n_unique():,} duplicate texts skipped")
+    num_classes = len(class_distribution)
+    method = args.method or suggest_sampling_method(num_classes, class_distribution)
+    if method == "stratified":
+        sample_sizes = None
+        if args.allocation != "minmax":
+            if args.allocation == "cost" and args.text_column is None:
+                raise ValueError("Cost-weighted allocation needs --text-column")
+            costs = get_class_text_lengths(data, args.label_column, args.text_column) if args.allocation == "cost" else None
+            expected_accuracy = args.expected_accuracy
+            if args.earlier_results:
+                class_accuracies = get_class_accuracies(coded_rows(args.earlier_results, 'manual_label'), args.label_column,
+                                                        args.expected_accuracy)
+                expected_accuracy = {label: class_accuracies.get(label, args.expected_accuracy)
+                                     for label in class_distribution[args.label_column]}
+            sample_sizes = allocate_sample(class_distribution, args.label_column, args.margin_of_error, args.confidence_level,
+                                           args.allocation, expected_accuracy, costs, args.min_per_class)
+        sample = get_stratified_sample(data, args.label_column, args.min_per_class, args.max_per_class, class_distribution,
+                                       sample_sizes=sample_sizes)
+    elif method == "weighted":
+        if args.confidence_column is None:
+            raise ValueError("Uncertainty-weighted sampling needs --confidence-column")
+        sample_size = args.sample_size or calculate_sample_size(args.confidence_level, args.margin_of_error, 2,
+                                                                args.expected_proportion)
+        sample = get_weighted_sample(data, sample_size, args.confidence_column, args.min_weight)
+    else:
+        sample_size = args.sample_size or calculate_sample_size(args.confidence_level, args.margin_of_error,
+                                                                num_classes if method == "multi-class" else 2,
+                                                                args.expected_proportion)
+        sample = get_random_sample(data, sample_size)
+    write_results(sample.lazy(), args.output, export_format)
+    print(f"{method} sample of {len(sample):,} items (population {class_distribution['counts'].sum():,}) written to {args.output}")
+
+def coded_rows(path, manual_column):
+    """
+    Read the coded rows of a results file.
+
+    App exports fill the manual label of uncoded rows with the predicted
+    label, so their coded rows are the ones with a labels_match value. Other
+    files count every row with a manual label as coded.
+
+    Args:
+    path: Path of the results file
+    manual_column: Name of the manual label column
+
+    Returns:
+    Polars DataFrame with the coded rows
+    """
+    results = scan_table(path)
+    coded = 'labels_match' if 'labels_match' in results.collect_schema().names() else manual_column
+    return results.filter(pl.col(coded).is_not_null()).collect()
+
+def score_results(args):
+    """
+    Calculate metrics and the confusion matrix of a coded results file.
+
+    Args:
+    args: Parsed command-line arguments of the metrics command
+    """
+    output_formats = [format_for_path(path) if path else None for path in (args.output, args.confusion_matrix)]
+    coded = coded_rows(args.results, args.manual_column)
+    labels = sorted(pl.concat([coded[args.label_column], coded[args.manual_column]]).unique().to_list())
+    weight_column = args.weight_column or (SAMPLE_WEIGHT_COLUMN if SAMPLE_WEIGHT_COLUMN in coded.columns else None)
+    if weight_column and args.intervals:
+        raise ValueError("Bootstrap intervals are only available for unweighted samples")
+    accumulator = ConfusionAccumulator(labels, weighted=weight_column is not None)
+    accumulator.add_many(coded[args.manual_column], coded[args.label_column],
+                         coded[weight_column] if weight_column else None)
+    metrics = accumulator.metrics()
+    intervals = bootstrap_confidence_intervals(accumulator.counts) if args.intervals else None
+    domains = None
+    if args.codebook:
+        codebook = read_codebook(args.codebook)
+        domains = label_domains(accumulator.labels, create_label_to_code_mapping(accumulator.labels, codebook), codebook)
+    detailed = accumulator.hierarchical_metrics(domains) if args.per_class or domains else None
+    summary = metrics_summary(metrics, intervals, accumulator.labels, detailed)
+    print(f"{accumulator.total():,} coded items" + (f", weighted by {weight_column}" if weight_column else ""))
+    print(summary)
+    if args.output:
+        write_results(summary.lazy(), args.output, output_formats[0])
+    if args.confusion_matrix:
+        cm = accumulator.confusion_matrix()
+        if args.sparse:
+            confusion = confusion_cells(cm, accumulator.labels)
+        else:
+            confusion = pl.DataFrame({
+                'true_label': [str(label) for label in accumulator.labels],
+                **{str(label): cm[:, code] for code, label in enumerate(accumulator.labels)}
+            })
+        write_results(confusion.lazy(), args.confusion_matrix, output_formats[1])
+
+def propagate_results(args):
+    """
+    Write the manual labels of a deduplicated sample for every duplicate of its texts in the full dataset.
+
+    The duplicate groups are found again with the settings the sample was
+    drawn with, which yields the same group ids.
+
+    Args:
+    args: Parsed command-line arguments of the propagate command
+    """
+    export_format = format_for_path(args.output)
+    coded = coded_rows(args.results, args.manual_column)
+    if DUPLICATE_GROUP_COLUMN not in coded.columns:
+        raise ValueError(f"{args.results} has no {DUPLICATE_GROUP_COLUMN} column; draw the sample with --dedup")
+    data, _ = load_dataset(args.dataset, args.label_column, lazy=True)
+    labels = coded.select([DUPLICATE_GROUP_COLUMN, pl.col(args.manual_column).alias('manual_label')])
+    results = propagate_labels(data, duplicate_groups(data, args), labels, args.label_column).collect()
+    write_results(results.lazy(), args.output, export_format)
+    print(f"Labels of {len(labels):,} coded items propagated to {len(results):,} rows, written to {args.output}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sample = commands.add_parser('sample', help="Draw a random, stratified or uncertainty-weighted sample for manual coding")
+    sample.add_argument('dataset', nargs='?', default=default_dataset_path(),
+                        help="CSV, Parquet, Arrow IPC, JSON Lines or Excel file, or a directory or quoted glob of shards "
+                             "(default: the bundled example dataset)")
+    sample.add_argument('--label-column', required=True, help="Column containing the predicted labels")
+    sample.add_argument('--method', choices=["binary", "multi-class", "stratified", "weighted"],
+                        help="Sampling method (default: the suggested method for the class distribution)")
+    sample.add_argument('--sample-size', type=int, help="Random sample size (default: calculated from the options below)")
+    sample.add_argument('--confidence-level', type=float, default=0.95)
+    sample.add_argument('--margin-of-error', type=float, default=0.05)
+    sample.add_argument('--expected-proportion', type=float, default=0.5)
+    sample.add_argument('--allocation', choices=["minmax"] + ALLOCATION_METHODS, default="minmax",
+                        help="Stratum sizes: clipped class counts (minmax) or sized for --margin-of-error of the accuracy")
+    sample.add_argument('--expected-accuracy', type=float, default=0.8,
+                        help="Expected classifier accuracy of classes without coded items (allocations)")
+    sample.add_argument('--earlier-results',
+                        help="Coded results of an earlier sample, whose per-class accuracy sizes the strata (allocations)")
+    sample.add_argument('--text-column', help="Column containing the text, whose length is the coding cost (cost allocation)")
+    sample.add_argument('--min-per-class', type=int, default=5, help="Minimum samples per class (stratified)")
+    sample.add_argument('--max-per-class', type=int, default=30, help="Maximum samples per class (minmax allocation)")
+    sample.add_argument('--confidence-column', help="Column containing the classifier's confidence, 0 to 1 (weighted)")
+    sample.add_argument('--min-weight', type=float, default=0.05, help="Smallest sampling weight (weighted)")
+    sample.add_argument('--dedup', choices=["exact", "near"],
+                        help="Sample one row per group of duplicate (or also near-duplicate) texts; needs --text-column")
+    sample.add_argument('--similarity', type=float, default=NEAR_DUPLICATE_THRESHOLD,
+                        help="Shared share of word sequences from which texts are near-duplicates")
+    sample.add_argument('--lazy', action='store_true', help="Scan the dataset instead of reading it into memory")
+    sample.add_argument('--output', required=True, help="Output file; the format is taken from the extension")
+    sample.set_defaults(run=draw_sample)
+
+    metrics = commands.add_parser('metrics', help="Calculate metrics from a coded results file")
+    metrics.add_argument('results', help="Coded results file, e.g. an export of the app")
+    metrics.add_argument('--label-column', required=True, help="Column containing the predicted labels")
+    metrics.add_argument('--manual-column', default='manual_label', help="Column containing the manual labels")
+    metrics.add_argument('--weight-column',
+                         help="Column of inverse-probability sample weights (default: sample_weight if present)")
+    metrics.add_argument('--intervals', action='store_true', help="Add 95%% bootstrap confidence intervals")
+    metrics.add_argument('--per-class', action='store_true',
+                         help="Add per-class metrics and micro, macro and weighted averages")
+    metrics.add_argument('--codebook', help="Codebook JSON file; adds per-domain metrics (implies --per-class)")
+    metrics.add_argument('--output', help="Write the metrics to this file")
+    metrics.add_argument('--confusion-matrix', help="Write the confusion matrix to this file")
+    metrics.add_argument('--sparse', action='store_true',
+                         help="Write only the non-zero cells of the confusion matrix (true_label, predicted_label, count)")
+    metrics.set_defaults(run=score_results)
+
+    propagate = commands.add_parser('propagate', help="Give every duplicate of a coded text its manual label")
+    propagate.add_argument('dataset', help="Dataset the sample was drawn from")
+    propagate.add_argument('results', help="Coded results of a sample drawn with --dedup")
+    propagate.add_argument('--text-column', required=True, help="Column containing the text")
+    propagate.add_argument('--label-column', required=True, help="Column containing the predicted labels")
+    propagate.add_argument('--manual-column', default='manual_label', help="Column containing the manual labels")
+    propagate.add_argument('--dedup', choices=["exact", "near"], default="exact", help="Duplicates the sample was drawn without")
+    propagate.add_argument('--similarity', type=float, default=NEAR_DUPLICATE_THRESHOLD,
+                           help="Similarity the sample was drawn with (near)")
+    propagate.add_argument('--output', required=True, help="Output file; the format is taken from the extension")
+    propagate.set_defaults(run=propagate_results)
+
+    args = parser.parse_args(argv)
+    try:
+        args.run(args)
+    except (ValueError, OSError, pl.exceptions.PolarsError) as e:
+        sys.exit(f"Error: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import contextvars
+import threading
+
+from src.instrumentation import stage
+
+class BackgroundTasks:
+    """
+    Results of one session that are computed off the script thread.
+
+    Every task has a name and a key describing its inputs (e.g. the number
+    of coded items). Submitting a task whose key is already running or done
+    does nothing, so a rerun can submit unconditionally; the latest finished
+    result of each name stays available while a newer one is computed, so
+    the app can show it until the update is ready. Tasks run in the calling
+    thread's context, so an active profiler records them as
+    background.<name> stages.
+
+    The executor is usually a thread pool shared by all sessions of the
+    server: the tasks are mostly NumPy and Polars work that releases the
+    GIL, and their results (DataFrames, figures) are used in place without
+    pickling, which a process pool would need.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._generation = 0
+        self._tasks = {}
+        self._results = {}
+
+    def submit(self, name, key, fn, *args):
+        """
+        Start computing a result in the background unless the same key is already running or done.
+
+        Args:
+        name: Task name
+        key: Hashable description of the inputs
+        fn: Function computing the result
+        *args: Arguments of fn
+
+        Returns:
+        concurrent.futures.Future of the result
+        """
+        with self._lock:
+            task = self._tasks.get(name)
+            if task is not None and task[0] == key:
+                return task[1]
+            self._submitted += 1
+            future = self.executor.submit(contextvars.copy_context().run, self._run, name, key, self._submitted, self._generation,
+                                          fn, *args)
+            self._tasks[name] = (key, future)
+            return future
+
+    def _run(self, name, key, sequence, generation, fn, *args):
+        with stage(f"background.{name}"):
+            value = fn(*args)
+        with self._lock:
+            # A task submitted earlier may finish later; it never replaces a newer result,
+            # and a task that was running when its results were forgotten stores nothing
+            if generation == self._generation and (name not in self._results or self._results[name][0] < sequence):
+                self._results[name] = (sequence, key, value)
+        return value
+
+    def get(self, name, key, fn, *args):
+        """
+        Get a result, waiting for it if it is being computed and computing it here if it was never submitted.
+
+        Args:
+        name: Task name
+        key: Hashable description of the inputs
+        fn: Function computing the result
+        *args: Arguments of fn
+
+        Returns:
+        Result of fn(*args)
+        """
+        with self._lock:
+            task = self._tasks.get(name)
+        if task is not None and task[0] == key and not task[1].cancelled():
+            return task[1].result()
+        return fn(*args)
+
+    def pending(self, name):
+        """
+        Check whether the latest submitted task of a name is still running.
+
+        Args:
+        name: Task name
+
+        Returns:
+        True if the task is queued or running
+        """
+        with self._lock:
+            task = self._tasks.get(name)
+        return task is not None and not task[1].done()
+
+    def result(self, name):
+        """
+        Get the latest finished result of a name.
+
+        Raises the exception of the latest submitted task if it failed.
+
+        Args:
+        name: Task name
+
+        Returns:
+        Tuple of (key, result) or None if no task of the name has finished yet
+        """
+        with self._lock:
+            task = self._tasks.get(name)
+            result = self._results.get(name)
+        if task is not None and task[1].done() and not task[1].cancelled() and task[1].exception() is not None:
+            raise task[1].exception()
+        return None if result is None else result[1:]
+
+    def cancel(self):
+        """
+        Cancel the tasks that have not started and forget all results, e.g. when a new sample is coded.
+
+        Tasks that are already running finish, but their results are discarded.
+        """
+        with self._lock:
+            self._generation += 1
+            for _, future in self._tasks.values():
+                future.cancel()
+            self._tasks = {}
+            self._results = {}
@@ -0,0 +1,113 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+from src.statistics import create_label_to_code_mapping
+from src.instrumentation import instrumented
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+NAME_WEIGHT = 2
+
+def tokenize(text):
+    """
+    Split text into lowercase alphanumeric tokens.
+
+    Args:
+    text: String to tokenize
+
+    Returns:
+    List of tokens
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+class CodebookIndex:
+    """
+    Precomputed lookups over a codebook: label-to-code mapping, domain
+    hierarchy and an inverted full-text index over code names and
+    descriptions.
+
+    Built once per codebook; every lookup afterwards is a dictionary access
+    or a binary search over the sorted vocabulary.
+    """
+
+    def __init__(self, codebook):
+        self.codebook = codebook
+        self.domains = defaultdict(list)
+        self.postings = defaultdict(dict)
+        for code, details in codebook.items():
+            self.domains[details.get('domain')].append(code)
+            for token in tokenize(details.get('description', '')):
+                self.postings[token][code] = max(self.postings[token].get(code, 0), 1)
+            for token in tokenize(details.get('name', '')):
+                self.postings[token][code] = NAME_WEIGHT
+        self.domains = dict(self.domains)
+        self.postings = dict(self.postings)
+        self.vocabulary = sorted(self.postings)
+        self._label_mappings = {}
+
+    @instrumented
+    def label_mapping(self, unique_labels):
+        """
+        Map labels to codebook codes, computing each distinct label set only once.
+
+        Args:
+        unique_labels: List of unique labels
+
+        Returns:
+        Dictionary mapping labels to codebook codes
+        """
+        key = tuple(unique_labels)
+        if key not in self._label_mappings:
+            self._label_mappings[key] = create_label_to_code_mapping(unique_labels, self.codebook)
+        return self._label_mappings[key]
+
+    def domain_of(self, code):
+        """
+        Get the domain of a code.
+
+        Args:
+        code: Codebook code
+
+        Returns:
+        Domain name or None
+        """
+        return self.codebook.get(code, {}).get('domain')
+
+    @instrumented
+    def search(self, query, limit=10):
+        """
+        Find codes whose name or description contains every query term.
+
+        The last term also matches as a prefix, so results update while
+        typing. Matches in the name rank above matches in the description.
+
+        Args:
+        query: Free-text query, e.g. "military expenditure"
+        limit: Maximum number of results
+
+        Returns:
+        List of (code, score) tuples, best match first
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        scores = None
+        for position, token in enumerate(tokens):
+            matches = self._prefix_postings(token) if position == len(tokens) - 1 else self.postings.get(token, {})
+            if scores is None:
+                scores = dict(matches)
+            else:
+                scores = {code: score + matches[code] for code, score in scores.items() if code in matches}
+            if not scores:
+                return []
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def _prefix_postings(self, prefix):
+        matches = {}
+        start = bisect_left(self.vocabulary, prefix)
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            for code, weight in self.postings[token].items():
+                matches[code] = max(matches.get(code, 0), weight)
+        return matches
@@ -0,0 +1,136 @@
+import numpy as np
+import polars as pl
+
+from src.instrumentation import instrumented
+
+UNCODED = -1
+
+class CodingStore:
+    """
+    Array-backed manual labels of a coding sample.
+
+    Keeps one int32 label code per item of the sample (UNCODED until the
+    item is submitted) and a single label dictionary shared by all items, so
+    a session holds 4 bytes per item instead of a dictionary with a copy of
+    the text. Texts and predicted labels are read from the sample itself
+    when needed. Looking up a label's code is a dictionary lookup, and
+    replays and exports are vectorized over the code array.
+    """
+
+    def __init__(self, num_items, labels=()):
+        self.labels = list(labels)
+        self.label_codes = {label: code for code, label in enumerate(self.labels)}
+        self.manual_codes = np.full(num_items, UNCODED, dtype=np.int32)
+        self.coded = 0
+
+    def __len__(self):
+        return self.coded
+
+    def __contains__(self, item_index):
+        return self.manual_codes[item_index] != UNCODED
+
+    def code(self, label):
+        """
+        Get the code of a label, adding it to the label dictionary if it is new.
+
+        Args:
+        label: Label value
+
+        Returns:
+        Integer code
+        """
+        if label not in self.label_codes:
+            self.label_codes[label] = len(self.labels)
+            self.labels.append(label)
+        return self.label_codes[label]
+
+    def get(self, item_index):
+        """
+        Get the manual label of an item.
+
+        Args:
+        item_index: Index of the item in the sample
+
+        Returns:
+        Label value or None if the item has not been coded
+        """
+        code = self.manual_codes[item_index]
+        return None if code == UNCODED else self.labels[code]
+
+    def set(self, item_index, manual_label):
+        """
+        Record the manual label of an item.
+
+        Args:
+        item_index: Index of the item in the sample
+        manual_label: Manually assigned label
+
+        Returns:
+        The item's previous manual label, or None if it had not been coded
+        """
+        previous = self.get(item_index)
+        self.manual_codes[item_index] = self.code(manual_label)
+        self.coded += previous is None
+        return previous
+
+    @instrumented
+    def set_many(self, item_indices, manual_labels):
+        """
+        Record the manual labels of many items in one vectorized update, e.g. when replaying a journal.
+
+        Args:
+        item_indices: Sequence of distinct item indices
+        manual_labels: Sequence of manually assigned labels
+        """
+        if len(item_indices) == 0:
+            return
+        manual_labels = pl.Series(manual_labels)
+        for label in manual_labels.unique().sort():
+            self.code(label)
+        codes = manual_labels.replace_strict(pl.Series(list(self.label_codes)), pl.Series(list(self.label_codes.values())),
+                                             return_dtype=pl.Int32).to_numpy()
+        item_indices = np.asarray(item_indices, dtype=np.int64)
+        self.coded += int((self.manual_codes[item_indices] == UNCODED).sum())
+        self.manual_codes[item_indices] = codes
+
+    def resize(self, num_items):
+        """
+        Make room for more items, e.g. when a sequential sample draws another batch.
+
+        Args:
+        num_items: New number of items in the sample
+        """
+        if num_items > len(self.manual_codes):
+            self.manual_codes = np.concatenate([
+                self.manual_codes, np.full(num_items - len(self.manual_codes), UNCODED, dtype=np.int32)
+            ])
+
+    def copy(self):
+        """
+        Snapshot the store, e.g. for a deferred export.
+
+        Returns:
+        CodingStore with copies of the codes and the label dictionary
+        """
+        store = CodingStore(0, self.labels)
+        store.manual_codes = self.manual_codes.copy()
+        store.coded = self.coded
+        return store
+
+    @instrumented
+    def to_frame(self, label_dtype=None):
+        """
+        Get the coded items and their manual labels.
+
+        Args:
+        label_dtype: Polars dtype of the labels, e.g. that of the predicted label column
+
+        Returns:
+        Polars DataFrame with item_index (UInt32) and manual_label columns, ordered by item
+        """
+        item_indices = np.flatnonzero(self.manual_codes != UNCODED)
+        labels = pl.Series(self.labels, dtype=label_dtype)
+        return pl.DataFrame({
+            'item_index': pl.Series(item_indices, dtype=pl.UInt32),
+            'manual_label': labels.gather(self.manual_codes[item_indices])
+        })
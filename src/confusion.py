@@ -0,0 +1,111 @@
+import numpy as np
+import polars as pl
+
+from src.instrumentation import instrumented
+
+MAX_HEATMAP_LABELS = 50
+
+@instrumented
+def confusion_cells(cm, labels):
+    """
+    Convert a confusion matrix to its non-zero cells.
+
+    With hundreds of classes most of the matrix is empty, so the cells are a
+    compact representation for storage and export.
+
+    Args:
+    cm: Square confusion matrix (rows: true labels, columns: predicted labels)
+    labels: Label values in matrix order
+
+    Returns:
+    Polars DataFrame with true_label, predicted_label and count columns
+    """
+    cm = np.asarray(cm)
+    true_codes, predicted_codes = np.nonzero(cm)
+    labels = pl.Series(labels)
+    return pl.DataFrame({
+        'true_label': labels.gather(true_codes),
+        'predicted_label': labels.gather(predicted_codes),
+        'count': cm[true_codes, predicted_codes]
+    })
+
+@instrumented
+def top_confusions(cm, labels, k=20):
+    """
+    Find the most frequent off-diagonal cells of a confusion matrix.
+
+    Args:
+    cm: Square confusion matrix (rows: true labels, columns: predicted labels)
+    labels: Label values in matrix order
+    k: Number of label pairs
+
+    Returns:
+    Polars DataFrame with true_label, predicted_label, count and share_of_true (share of the true label's items),
+    most frequent first
+    """
+    cm = np.asarray(cm)
+    errors = cm.astype(np.float64)
+    np.fill_diagonal(errors, 0)
+    flat = errors.ravel()
+    k = min(k, int(np.count_nonzero(flat)))
+    cells = np.argpartition(flat, flat.size - k)[flat.size - k:] if k else np.array([], dtype=np.int64)
+    cells = cells[np.argsort(-flat[cells], kind='stable')]
+    true_codes, predicted_codes = np.divmod(cells, cm.shape[1])
+    support = cm.sum(axis=1)
+    labels = pl.Series(labels)
+    return pl.DataFrame({
+        'true_label': labels.gather(true_codes),
+        'predicted_label': labels.gather(predicted_codes),
+        'count': cm[true_codes, predicted_codes],
+        'share_of_true': cm[true_codes, predicted_codes] / support[true_codes]
+    })
+
+def confused_labels(cm, labels, k=20):
+    """
+    Get the labels involved in the most frequent confusions, e.g. as the default zoom.
+
+    Args:
+    cm: Square confusion matrix (rows: true labels, columns: predicted labels)
+    labels: Label values in matrix order
+    k: Number of label pairs to consider
+
+    Returns:
+    List of at most MAX_HEATMAP_LABELS labels, in matrix order
+    """
+    pairs = top_confusions(cm, labels, k)
+    involved = set(pairs['true_label']) | set(pairs['predicted_label'])
+    return [label for label in labels if label in involved][:MAX_HEATMAP_LABELS]
+
+def confusion_submatrix(cm, labels, selected):
+    """
+    Cut the rows and columns of some labels out of a confusion matrix.
+
+    Args:
+    cm: Square confusion matrix (rows: true labels, columns: predicted labels)
+    labels: Label values in matrix order
+    selected: Labels to keep
+
+    Returns:
+    Tuple of (confusion matrix of the selected labels, selected labels in matrix order)
+    """
+    selected = set(selected)
+    codes = [code for code, label in enumerate(labels) if label in selected]
+    return np.asarray(cm)[np.ix_(codes, codes)], [labels[code] for code in codes]
+
+@instrumented
+def domain_confusion(cm, domains):
+    """
+    Aggregate a confusion matrix from labels to their codebook domains.
+
+    Args:
+    cm: Square confusion matrix (rows: true labels, columns: predicted labels)
+    domains: Domain name of every label, in matrix order (see label_domains)
+
+    Returns:
+    Tuple of (domain confusion matrix, sorted domain names)
+    """
+    cm = np.asarray(cm)
+    names, domain_codes = np.unique(np.asarray(domains, dtype=object), return_inverse=True)
+    membership = np.zeros((len(domains), len(names)), dtype=cm.dtype)
+    membership[np.arange(len(domains)), domain_codes] = 1
+    return membership.T @ cm @ membership, list(names)
@@ -0,0 +1,77 @@
+import polars as pl
+from pathlib import Path
+import json
+
+from src.dataset_cache import cache_dataset
+from src.instrumentation import instrumented
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+DEFAULT_CODEBOOK_PATH = DATA_DIR / "default_codebook.json"
+
+def default_dataset_path(is_sample=False):
+    """
+    Get the path of the bundled example dataset.
+
+    Args:
+    is_sample: Boolean indicating if the pre-sampled dataset is wanted
+
+    Returns:
+    Path to the default dataset (which may not exist)
+    """
+    return DATA_DIR / ("sample_data.csv" if is_sample else "preprocessed_data.csv")
+
+@instrumented
+def open_dataset(source, lazy=False):
+    """
+    Open a CSV dataset through the dataset cache.
+
+    Args:
+    source: Path or file-like object containing CSV data
+    lazy: Return a LazyFrame scanning the cached file instead of a memory-mapped DataFrame
+
+    Returns:
+    Tuple of (Polars DataFrame or LazyFrame, profile dictionary)
+    """
+    data_path, profile = cache_dataset(source)
+    data = pl.scan_ipc(data_path) if lazy else pl.read_ipc(data_path)
+    return data, profile
+
+@instrumented
+def scan_table(path):
+    """
+    Lazily scan a CSV, Parquet, Arrow IPC, JSON Lines or Excel file.
+
+    Args:
+    path: Path of the file; the format is taken from its extension
+
+    Returns:
+    Polars LazyFrame
+    """
+    extension = Path(path).suffix.lower()
+    if extension == ".csv":
+        return pl.scan_csv(path)
+    if extension == ".parquet":
+        return pl.scan_parquet(path)
+    if extension in (".arrow", ".ipc", ".feather"):
+        return pl.scan_ipc(path)
+    if extension in (".jsonl", ".ndjson"):
+        return pl.scan_ndjson(path)
+    if extension == ".xlsx":
+        return pl.read_excel(path).lazy()
+    raise ValueError(f"Unsupported file extension: {extension or path}")
+
+@instrumented
+def read_codebook(file):
+    """
+    Parse a codebook JSON file.
+
+    Args:
+    file: Path or file-like object
+
+    Returns:
+    Dictionary containing the codebook
+    """
+    if isinstance(file, (str, Path)):
+        with open(file, 'r') as f:
+            return json.load(f)
+    return json.load(file)
@@ -1,13 +1,73 @@
 import polars as pl
 import streamlit as st
+import os
 from pathlib import Path
-import json
+from streamlit.runtime.uploaded_file_manager import UploadedFile
 
-@st.cache_data
+from src.dataset_cache import cache_dataset
+from src.data_io import default_dataset_path, read_codebook, DEFAULT_CODEBOOK_PATH
+from src.dataset_store import DatasetStore, DEFAULT_MAX_BYTES
+from src.shards import ShardedDataset, find_shards
+from src.codebook_index import CodebookIndex
+from src.dedup import NEAR_DUPLICATE_THRESHOLD, find_duplicate_groups
+from src.instrumentation import instrumented
+
+_UPLOAD_HASH_FUNCS = {UploadedFile: lambda file: file.file_id}
+# Sharded datasets can only be read from below this directory; the app hides the option if it is not set
+SHARD_ROOT = os.environ.get("MCV_SHARD_ROOT")
+
+def _resolve_source(file, is_sample):
+    """
+    Resolve the uploaded file, or the default dataset if nothing was uploaded.
+    
+    Args:
+    file: Uploaded file or None for default file
+    is_sample: Boolean indicating if the file is a pre-sampled dataset
+    
+    Returns:
+    Uploaded file, path to the default dataset, or None if it does not exist
+    """
+    if file is not None:
+        return file
+    default_file_path = default_dataset_path(is_sample)
+    
+    if not default_file_path.exists():
+        st.error(f"Default dataset not found at {default_file_path}. Please upload a CSV file.")
+        return None
+    return default_file_path
+
+@st.cache_resource(hash_funcs=_UPLOAD_HASH_FUNCS)
+def _cache_entry(source):
+    """
+    Get the on-disk cache entry of a dataset, keyed by upload id so reruns skip re-hashing the upload.
+    
+    Args:
+    source: Uploaded file or path to a local dataset
+    
+    Returns:
+    Tuple of (path to the Arrow IPC file, profile dictionary)
+    """
+    return cache_dataset(source)
+
+@st.cache_resource
+def get_dataset_store():
+    """
+    Get the process-wide dataset store shared by all sessions.
+    
+    Returns:
+    DatasetStore capped at MCV_STORE_MAX_BYTES (default 4 GiB)
+    """
+    return DatasetStore(int(os.environ.get("MCV_STORE_MAX_BYTES", DEFAULT_MAX_BYTES)))
+
+@instrumented
 def load_data(file, is_sample=False):
     """
     Load data from a file into a Polars DataFrame.
     
+    The CSV is parsed once per distinct content and cached as Arrow IPC.
+    The memory-mapped frame is kept in the shared dataset store, so reruns
+    and other sessions get the same read-only frame without copying it.
+    
     Args:
     file: Uploaded file or None for default file
     is_sample: Boolean indicating if the file is a pre-sampled dataset
@@ -16,26 +76,198 @@ def load_data(file, is_sample=False):
     Polars DataFrame
     """
     try:
-        if file is None:
-            current_dir = Path(__file__).parent.parent
-            default_file_path = current_dir / "data" / ("sample_data.csv" if is_sample else "preprocessed_data.csv")
-            
-            if not default_file_path.exists():
-                st.error(f"Default dataset not found at {default_file_path}. Please upload a CSV file.")
-                return None
-            
-            return pl.read_csv(default_file_path)
-        else:
-            return pl.read_csv(file)
+        source = _resolve_source(file, is_sample)
+        if source is None:
+            return None
+        data_path, profile = _cache_entry(source)
+        store = get_dataset_store()
+        data = store.get(profile['content_hash'])
+        if data is None:
+            data = store.put(profile['content_hash'], pl.read_ipc(data_path))
+        return data
+    except Exception as e:
+        st.error(f"Error loading file: {str(e)}")
+        return None
+
+@instrumented
+def scan_data(file, is_sample=False):
+    """
+    Lazily scan data from a file into a Polars LazyFrame.
+    
+    Nothing is read until the frame is collected, so aggregations over the
+    label column and sample draws only materialize what they need.
+    
+    Args:
+    file: Uploaded file or None for default file
+    is_sample: Boolean indicating if the file is a pre-sampled dataset
+    
+    Returns:
+    Polars LazyFrame
+    """
+    try:
+        source = _resolve_source(file, is_sample)
+        if source is None:
+            return None
+        data_path, _ = _cache_entry(source)
+        return pl.scan_ipc(data_path)
     except Exception as e:
         st.error(f"Error loading file: {str(e)}")
         return None
 
-@st.cache_data
+@instrumented
+def load_profile(file, is_sample=False):
+    """
+    Load the cached profile of a dataset.
+    
+    Args:
+    file: Uploaded file or None for default file
+    is_sample: Boolean indicating if the file is a pre-sampled dataset
+    
+    Returns:
+    Dictionary with row count, columns and per-column class distributions, or None
+    """
+    try:
+        source = _resolve_source(file, is_sample)
+        if source is None:
+            return None
+        _, profile = _cache_entry(source)
+        return profile
+    except Exception:
+        return None
+
+@st.cache_resource
+def _open_shards(shard_files):
+    """
+    Open a sharded dataset once per set of shard files, shared across reruns and sessions.
+    
+    Args:
+    shard_files: Tuple of (path, size, modification time) per shard, so changed shards are opened again
+    
+    Returns:
+    ShardedDataset
+    """
+    return ShardedDataset([path for path, _, _ in shard_files])
+
+def _shard_files(source):
+    """
+    List the shard files of a directory or glob below SHARD_ROOT.
+    
+    Args:
+    source: Directory or glob pattern relative to SHARD_ROOT
+    
+    Returns:
+    Tuple of (path, size, modification time) per shard
+    """
+    if not SHARD_ROOT:
+        raise ValueError("Reading shards on the server is disabled; set MCV_SHARD_ROOT to enable it")
+    root = Path(SHARD_ROOT).resolve()
+    pattern = root / source
+    paths = find_shards(pattern) if pattern.resolve().is_relative_to(root) else []
+    # Resolved paths also catch symlinks pointing out of the root
+    if not paths or not all(path.resolve().is_relative_to(root) for path in paths):
+        raise ValueError(f"{source} is not a directory or glob of shards below the shard root")
+    return tuple((str(path), path.stat().st_size, path.stat().st_mtime_ns) for path in paths)
+
+@instrumented
+def load_shards(source):
+    """
+    Open a directory or glob of CSV, Parquet, Arrow IPC or JSON Lines shards as one lazy dataset.
+    
+    Args:
+    source: Directory or glob pattern relative to SHARD_ROOT
+    
+    Returns:
+    ShardedDataset or None if no shards were found or their schemas differ
+    """
+    try:
+        return _open_shards(_shard_files(source))
+    except Exception as e:
+        st.error(f"Error loading shards: {str(e)}")
+        return None
+
+@instrumented
+def load_dataset_key(file, is_sample=False, shard_source=None):
+    """
+    Identify a dataset by its content, for caching results derived from it.
+    
+    Args:
+    file: Uploaded file or None for default file
+    is_sample: Boolean indicating if the file is a pre-sampled dataset
+    shard_source: Directory or glob of shards, used instead of the file if given
+    
+    Returns:
+    Content hash of the file, tuple of (path, size, modification time) per shard, or None
+    """
+    try:
+        if shard_source:
+            return _shard_files(shard_source)
+        profile = load_profile(file, is_sample)
+        return profile['content_hash'] if profile else None
+    except Exception:
+        return None
+
+@instrumented
+def get_columns(data):
+    """
+    Get the column names of an eager, lazy or sharded dataset.
+    
+    Args:
+    data: Polars DataFrame, LazyFrame or ShardedDataset
+    
+    Returns:
+    List of column names
+    """
+    if isinstance(data, (pl.LazyFrame, ShardedDataset)):
+        return data.collect_schema().names()
+    return data.columns
+
+@st.cache_resource(max_entries=8)
+def _duplicate_groups(dataset_key, _data, text_column, near_duplicates, threshold):
+    """
+    Find the duplicate groups of a dataset once per dataset and settings, shared across reruns and sessions.
+    
+    Args:
+    dataset_key: Key returned by load_dataset_key; the dataset itself is not hashed
+    _data: Polars DataFrame, LazyFrame or ShardedDataset
+    text_column: Name of the text column
+    near_duplicates: Also group near-duplicates
+    threshold: Similarity threshold of near-duplicates
+    
+    Returns:
+    Polars DataFrame returned by find_duplicate_groups
+    """
+    return find_duplicate_groups(_data, text_column, near_duplicates, threshold)
+
+@instrumented
+def load_duplicate_groups(data, dataset_key, text_column, near_duplicates=False, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """
+    Group the duplicate and near-duplicate texts of a dataset.
+    
+    Args:
+    data: Polars DataFrame, LazyFrame or ShardedDataset
+    dataset_key: Key returned by load_dataset_key, or None to skip the cache
+    text_column: Name of the text column
+    near_duplicates: Also group near-duplicates
+    threshold: Similarity threshold of near-duplicates
+    
+    Returns:
+    Polars DataFrame with duplicate_group and duplicate_count per row, or None if the texts could not be read
+    """
+    try:
+        if dataset_key is None:
+            return find_duplicate_groups(data, text_column, near_duplicates, threshold)
+        return _duplicate_groups(dataset_key, data, text_column, near_duplicates, threshold)
+    except Exception as e:
+        st.error(f"Error finding duplicate texts: {str(e)}")
+        return None
+
+@st.cache_resource
 def load_codebook(file):
     """
     Load codebook from a JSON file.
     
+    The parsed codebook is shared across reruns and sessions and must not be modified.
+    
     Args:
     file: Uploaded JSON file
     
@@ -44,17 +276,27 @@ def load_codebook(file):
     """
     try:
         if file is None:
-            current_dir = Path(__file__).parent.parent
-            default_file_path = current_dir / "data" / "default_codebook.json"
-            st.info(f"Loading default codebook from {default_file_path}")
-            if not default_file_path.exists():
-                st.warning(f"Default codebook not found at {default_file_path}. No codebook will be used.")
+            st.info(f"Loading default codebook from {DEFAULT_CODEBOOK_PATH}")
+            if not DEFAULT_CODEBOOK_PATH.exists():
+                st.warning(f"Default codebook not found at {DEFAULT_CODEBOOK_PATH}. No codebook will be used.")
                 return None
-            
-            with open(default_file_path, 'r') as f:
-                return json.load(f)
+            return read_codebook(DEFAULT_CODEBOOK_PATH)
         else:
-            return json.load(file)
+            return read_codebook(file)
     except Exception as e:
         st.error(f"Error loading codebook: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+@st.cache_resource
+def load_codebook_index(file):
+    """
+    Build the search and lookup index of a codebook once per codebook file.
+    
+    Args:
+    file: Uploaded JSON file
+    
+    Returns:
+    CodebookIndex or None if no codebook is available
+    """
+    codebook = load_codebook(file)
+    return CodebookIndex(codebook) if codebook is not None else None
@@ -0,0 +1,184 @@
+import polars as pl
+from pathlib import Path
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from src.instrumentation import instrumented
+
+CACHE_DIR = Path(os.environ.get("MCV_CACHE_DIR", Path(__file__).parent.parent / ".cache" / "datasets"))
+PROFILE_MAX_CLASSES = 1000
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+@instrumented
+def hash_file(file):
+    """
+    Compute the content hash of a file.
+
+    Args:
+    file: Path or file-like object
+
+    Returns:
+    Hex digest of the file content
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    if isinstance(file, (str, Path)):
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    else:
+        file.seek(0)
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        file.seek(0)
+    return digest.hexdigest()
+
+def _path_key(path):
+    """
+    Look up the content hash of a local file without re-reading it when its size and mtime are unchanged.
+
+    Args:
+    path: Path to a local file
+
+    Returns:
+    Hex digest of the file content
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    index_path = CACHE_DIR / "paths" / (hashlib.blake2b(str(path).encode(), digest_size=20).hexdigest() + ".json")
+    if index_path.exists():
+        entry = json.loads(index_path.read_text())
+        if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['content_hash']
+    content_hash = hash_file(path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    _write_atomic(index_path, json.dumps({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'content_hash': content_hash}))
+    return content_hash
+
+def _partial_path(path):
+    """
+    Create a temporary file next to a cache file that no other process or thread writes to.
+
+    Streamlit sessions are threads of one process, so the name cannot be
+    derived from the process id alone.
+
+    Args:
+    path: Final path of the cache file
+
+    Returns:
+    Path to write to before renaming into place
+    """
+    fd, partial_path = tempfile.mkstemp(prefix=f"{path.name}.", suffix=".partial", dir=path.parent)
+    os.close(fd)
+    return Path(partial_path)
+
+def _write_atomic(path, text):
+    """
+    Write a text file so that concurrent readers see either the old or the complete new content.
+
+    Args:
+    path: Path of the file
+    text: File content
+    """
+    partial_path = _partial_path(path)
+    partial_path.write_text(text)
+    os.replace(partial_path, path)
+
+@instrumented
+def build_profile(data, content_hash):
+    """
+    Profile a dataset: row count, column types and the class distribution of every low-cardinality column.
+
+    Args:
+    data: Polars LazyFrame
+    content_hash: Content hash of the source file
+
+    Returns:
+    Dictionary with the dataset profile
+    """
+    schema = data.collect_schema()
+    row_count = data.select(pl.len()).collect(engine="streaming").item()
+    cardinalities = data.select(pl.all().approx_n_unique()).collect(engine="streaming").row(0, named=True)
+    class_distributions = {}
+    for column, cardinality in cardinalities.items():
+        if cardinality > PROFILE_MAX_CLASSES:
+            continue
+        counts = data.group_by(column).agg(pl.len().alias('counts')).collect(engine="streaming")
+        class_distributions[column] = [
+            [label if isinstance(label, (str, int, float, bool, type(None))) else str(label), count]
+            for label, count in counts.iter_rows()
+        ]
+    return {
+        'content_hash': content_hash,
+        'row_count': row_count,
+        'columns': {name: str(dtype) for name, dtype in schema.items()},
+        'class_distributions': class_distributions
+    }
+
+@instrumented
+def cache_dataset(file):
+    """
+    Convert a CSV file to a content-addressed Arrow IPC file with a profile sidecar.
+
+    The conversion runs once per distinct file content; later calls only hash
+    the file and return the existing cache entry.
+
+    Args:
+    file: Path or file-like object containing CSV data
+
+    Returns:
+    Tuple of (path to the Arrow IPC file, profile dictionary)
+    """
+    content_hash = _path_key(file) if isinstance(file, (str, Path)) else hash_file(file)
+    data_path = CACHE_DIR / f"{content_hash}.arrow"
+    profile_path = CACHE_DIR / f"{content_hash}.profile.json"
+    if data_path.exists() and profile_path.exists():
+        return data_path, json.loads(profile_path.read_text())
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    if isinstance(file, (str, Path)):
+        source_path = file
+    else:
+        file.seek(0)
+        with tempfile.NamedTemporaryFile(suffix=".csv", dir=CACHE_DIR, delete=False) as spill:
+            shutil.copyfileobj(file, spill)
+        source_path = spill.name
+    try:
+        # Parallel workers and sessions may convert the same file; each writes its own partial file
+        partial_path = _partial_path(data_path)
+        pl.scan_csv(source_path).sink_ipc(partial_path, compression="uncompressed")
+        os.replace(partial_path, data_path)
+    finally:
+        if source_path != file:
+            os.unlink(source_path)
+
+    profile = build_profile(pl.scan_ipc(data_path), content_hash)
+    _write_atomic(profile_path, json.dumps(profile))
+    return data_path, profile
+
+@instrumented
+def class_distribution_from_profile(profile, label_column):
+    """
+    Build the class distribution of a column from a dataset profile.
+
+    Args:
+    profile: Dictionary with the dataset profile
+    label_column: Name of the label column
+
+    Returns:
+    Polars DataFrame shaped like get_class_distribution, or None if the column was not profiled
+    """
+    counts = profile['class_distributions'].get(label_column) if profile else None
+    if counts is None:
+        return None
+    distribution = pl.DataFrame(counts, schema=[label_column, 'counts'], orient='row', strict=False)
+    total_count = distribution['counts'].sum()
+    return (
+        distribution
+        .sort(['counts', label_column], descending=[True, False])
+        .with_columns([
+            (pl.col('counts') / total_count * 100).alias('percentage')
+        ])
+    )
@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+
+class DatasetStore:
+    """
+    Process-wide, size-capped LRU store of loaded datasets.
+
+    Every session receives the same DataFrame object for the same dataset, so
+    reruns and concurrent sessions share one copy of the Arrow buffers instead
+    of each unpickling their own. Callers must treat the returned frames as
+    read-only; Polars operations return new frames, so this holds as long as
+    nobody mutates them in place.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Look up a dataset and mark it as recently used.
+
+        Args:
+        key: Content hash of the dataset
+
+        Returns:
+        Stored object or None if it is not in the store
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, data):
+        """
+        Store a dataset, evicting the least recently used ones to stay under the size cap.
+
+        Args:
+        key: Content hash of the dataset
+        data: Polars DataFrame
+
+        Returns:
+        The stored object
+        """
+        size = data.estimated_size()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            self._entries[key] = (data, size)
+            while len(self._entries) > 1 and self.total_bytes() > self.max_bytes:
+                self._evict_oldest()
+            return data
+
+    def evict(self, key):
+        """
+        Remove a dataset from the store.
+
+        Args:
+        key: Content hash of the dataset
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Remove all datasets from the store.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def total_bytes(self):
+        """
+        Get the estimated size of all stored datasets.
+
+        Returns:
+        Size in bytes
+        """
+        return sum(size for _, size in self._entries.values())
+
+    def _evict_oldest(self):
+        self._entries.popitem(last=False)
@@ -0,0 +1,279 @@
+import numpy as np
+import polars as pl
+
+from src.instrumentation import instrumented
+from src.shards import ShardedDataset
+
+DUPLICATE_GROUP_COLUMN = "duplicate_group"
+DUPLICATE_COUNT_COLUMN = "duplicate_count"
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+_ROW = "__dedup_row"
+_TEXT_HASH = "__text_hash"
+_SHINGLE = "__shingle"
+_BAND = "__band"
+_BAND_KEY = "__band_key"
+_REPRESENTATIVE = "__representative"
+
+def _normalized_text(text_column):
+    """
+    Text with case and runs of whitespace normalized, so texts differing only in those count as exact duplicates.
+
+    Args:
+    text_column: Name of the text column
+
+    Returns:
+    Polars expression
+    """
+    return pl.col(text_column).cast(pl.String).str.to_lowercase().str.replace_all(r"\s+", " ").str.strip_chars()
+
+def _text_hashes(frame, text_column, seed):
+    """
+    Hash the normalized texts of a lazy dataset with the streaming engine.
+
+    Args:
+    frame: Polars LazyFrame
+    text_column: Name of the text column
+    seed: Hash seed
+
+    Returns:
+    Polars UInt64 Series with one hash per row
+    """
+    return frame.select(_normalized_text(text_column).hash(seed).alias(_TEXT_HASH)).collect(engine="streaming")[_TEXT_HASH]
+
+def _lsh_bands(num_perm, threshold):
+    """
+    Choose the LSH banding whose candidate threshold (1/bands)^(1/rows) is closest to, but not above, the similarity threshold.
+
+    Args:
+    num_perm: Number of MinHash values per text
+    threshold: Jaccard similarity threshold
+
+    Returns:
+    Tuple of (number of bands, rows per band)
+    """
+    bandings = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    below = [(bands, rows) for bands, rows in bandings if (1 / bands) ** (1 / rows) <= threshold]
+    return max(below, key=lambda banding: (1 / banding[0]) ** (1 / banding[1])) if below else bandings[0]
+
+def _minhash_signatures(frame, text_column, rows, offset, num_perm, shingle_size, seed):
+    """
+    Compute the MinHash signatures of some rows of a lazy dataset.
+
+    Texts are split into word shingles, every shingle is hashed once and
+    the num_perm hash functions are cheap integer rehashes of that hash.
+
+    Args:
+    frame: Polars LazyFrame
+    text_column: Name of the text column
+    rows: Global row positions to compute signatures for
+    offset: Global position of the frame's first row
+    num_perm: Number of MinHash values per text
+    shingle_size: Number of words per shingle
+    seed: Hash seed
+
+    Returns:
+    Polars DataFrame with the row position and num_perm UInt32 MinHash columns, sorted by row
+    """
+    return (
+        frame.select(_normalized_text(text_column).str.extract_all(r"\w+"))
+        .with_row_index(_ROW, offset)
+        .filter(pl.col(_ROW).is_in(rows.implode()))
+        .explode(text_column)
+        .select([
+            _ROW,
+            pl.concat_str([pl.col(text_column).shift(-shift).over(_ROW) for shift in range(shingle_size)],
+                          separator=" ", ignore_nulls=True).hash(seed).alias(_SHINGLE)
+        ])
+        .group_by(_ROW)
+        .agg([(pl.col(_SHINGLE).hash(seed + permutation) // 2**32).min().cast(pl.UInt32).alias(f"{permutation}")
+              for permutation in range(1, num_perm + 1)])
+        .sort(_ROW)
+        .collect(engine="streaming")
+    )
+
+def _connected_components(num_nodes, first, second):
+    """
+    Label the connected components of a graph by their smallest node.
+
+    Args:
+    num_nodes: Number of nodes
+    first: Array of edge start nodes
+    second: Array of edge end nodes
+
+    Returns:
+    Array with the smallest node of every node's component
+    """
+    labels = np.arange(num_nodes)
+    while True:
+        merged = labels.copy()
+        np.minimum.at(merged, first, labels[second])
+        np.minimum.at(merged, second, labels[first])
+        merged = merged[merged]
+        if np.array_equal(merged, labels):
+            return labels
+        labels = merged
+
+def _near_duplicate_components(signatures, num_perm, threshold, seed):
+    """
+    Group texts whose MinHash signatures are similar.
+
+    Texts sharing any LSH band are candidates. Each candidate is compared to
+    the first text of its bucket, and only pairs whose estimated Jaccard
+    similarity reaches the threshold are linked, so large buckets of
+    boilerplate cost one comparison per member rather than one per pair.
+
+    Args:
+    signatures: Polars DataFrame returned by _minhash_signatures
+    num_perm: Number of MinHash values per text
+    threshold: Jaccard similarity threshold
+    seed: Hash seed
+
+    Returns:
+    Polars DataFrame mapping the row position of every near-duplicate to the smallest row position of its group
+    """
+    bands, rows_per_band = _lsh_bands(num_perm, threshold)
+    minhashes = [f"{permutation}" for permutation in range(1, num_perm + 1)]
+    candidates = (
+        pl.concat([
+            signatures.lazy().select([
+                _ROW,
+                pl.lit(band, dtype=pl.UInt16).alias(_BAND),
+                pl.struct(minhashes[band * rows_per_band:(band + 1) * rows_per_band]).hash(seed).alias(_BAND_KEY)
+            ])
+            for band in range(bands)
+        ])
+        .with_columns(pl.col(_ROW).min().over([_BAND, _BAND_KEY]).alias(_REPRESENTATIVE))
+        .filter(pl.col(_ROW) != pl.col(_REPRESENTATIVE))
+        .select([_ROW, _REPRESENTATIVE])
+        .unique()
+        .collect()
+    )
+    if candidates.is_empty():
+        return pl.DataFrame(schema={_ROW: pl.UInt32, DUPLICATE_GROUP_COLUMN: pl.UInt32})
+    rows = signatures[_ROW].to_numpy()
+    matrix = signatures.select(minhashes).to_numpy()
+    first = np.searchsorted(rows, candidates[_ROW].to_numpy())
+    second = np.searchsorted(rows, candidates[_REPRESENTATIVE].to_numpy())
+    similar = (matrix[first] == matrix[second]).mean(axis=1) >= threshold
+    components = _connected_components(len(rows), first[similar], second[similar])
+    linked = np.flatnonzero(components != np.arange(len(rows)))
+    return pl.DataFrame({
+        _ROW: pl.Series(rows[linked], dtype=pl.UInt32),
+        DUPLICATE_GROUP_COLUMN: pl.Series(rows[components[linked]], dtype=pl.UInt32)
+    })
+
+@instrumented
+def find_duplicate_groups(data, text_column, near_duplicates=False, threshold=NEAR_DUPLICATE_THRESHOLD, num_perm=64,
+                          shingle_size=3, seed=42):
+    """
+    Group the rows of a dataset whose texts are duplicates or near-duplicates.
+
+    Exact duplicates (ignoring case and whitespace) are found by hashing the
+    text column. Near-duplicates are found among the remaining distinct texts
+    with MinHash signatures of word shingles and locality-sensitive hashing,
+    computed in batch with the streaming engine; the signatures take num_perm
+    32-bit values per distinct text. Sharded inputs are processed shard by
+    shard in parallel.
+
+    Args:
+    data: Polars DataFrame, LazyFrame or ShardedDataset
+    text_column: Name of the text column
+    near_duplicates: Also group near-duplicates
+    threshold: Estimated Jaccard similarity of word shingles from which texts are near-duplicates
+    num_perm: Number of MinHash values per text
+    shingle_size: Number of words per shingle
+    seed: Hash seed
+
+    Returns:
+    Polars DataFrame with one row per dataset row: duplicate_group (position of the group's first row) and
+    duplicate_count (number of rows in the group)
+    """
+    if isinstance(data, ShardedDataset):
+        hashes = pl.concat(data.map(lambda shard: _text_hashes(data.frames[shard], text_column, seed)))
+    else:
+        hashes = _text_hashes(data.lazy(), text_column, seed)
+    groups = (
+        pl.DataFrame({_TEXT_HASH: hashes})
+        .with_row_index(_ROW)
+        .with_columns(pl.col(_ROW).min().over(_TEXT_HASH).alias(DUPLICATE_GROUP_COLUMN))
+    )
+
+    if near_duplicates:
+        distinct = groups.filter(pl.col(_ROW) == pl.col(DUPLICATE_GROUP_COLUMN))[_ROW]
+        if isinstance(data, ShardedDataset):
+            def signatures_of(shard):
+                start, count = data.offsets[shard], data.row_counts[shard]
+                rows = distinct.filter((distinct >= start) & (distinct < start + count))
+                return _minhash_signatures(data.frames[shard], text_column, rows, start, num_perm, shingle_size, seed)
+            signatures = pl.concat(data.map(signatures_of))
+        else:
+            signatures = _minhash_signatures(data.lazy(), text_column, distinct, 0, num_perm, shingle_size, seed)
+        near = _near_duplicate_components(signatures, num_perm, threshold, seed)
+        groups = groups.with_columns(
+            pl.col(DUPLICATE_GROUP_COLUMN).replace(near[_ROW], near[DUPLICATE_GROUP_COLUMN])
+        )
+
+    return groups.select([
+        DUPLICATE_GROUP_COLUMN,
+        pl.len().over(DUPLICATE_GROUP_COLUMN).cast(pl.UInt32).alias(DUPLICATE_COUNT_COLUMN)
+    ])
+
+@instrumented
+def drop_duplicates(data, groups):
+    """
+    Keep the first row of every duplicate group, e.g. before sampling, so coders never see the same text twice.
+
+    The kept rows carry duplicate_group and duplicate_count, so samples
+    drawn from them record the group each coded label belongs to.
+
+    Args:
+    data: Polars DataFrame, LazyFrame or ShardedDataset
+    groups: Polars DataFrame returned by find_duplicate_groups
+
+    Returns:
+    Polars DataFrame for eager inputs, otherwise a LazyFrame
+    """
+    first_rows = pl.int_range(pl.len(), dtype=pl.UInt32) == pl.col(DUPLICATE_GROUP_COLUMN)
+    if isinstance(data, pl.DataFrame):
+        return data.hstack(groups).filter(first_rows)
+    return pl.concat([data.lazy(), groups.lazy()], how="horizontal").filter(first_rows)
+
+def coded_group_labels(coded_data, manual_labels, label_column):
+    """
+    Get the duplicate group and manual label of every coded item of a deduplicated sample.
+
+    Args:
+    coded_data: Polars DataFrame with the coded sample, including duplicate_group
+    manual_labels: CodingStore with the manual labels of the sample
+    label_column: Name of the predicted label column
+
+    Returns:
+    Polars DataFrame with duplicate_group and manual_label columns
+    """
+    return (
+        manual_labels.to_frame(coded_data.schema[label_column])
+        .join(coded_data.select(DUPLICATE_GROUP_COLUMN).with_row_index('item_index'), on='item_index')
+        .select([DUPLICATE_GROUP_COLUMN, 'manual_label'])
+    )
+
+@instrumented
+def propagate_labels(data, groups, labels, label_column):
+    """
+    Give every row of a coded duplicate group the manual label of the group's coded item.
+
+    Args:
+    data: Polars DataFrame, LazyFrame or ShardedDataset the sample was drawn from
+    groups: Polars DataFrame returned by find_duplicate_groups
+    labels: Polars DataFrame with duplicate_group and manual_label columns (see coded_group_labels)
+    label_column: Name of the predicted label column
+
+    Returns:
+    Polars LazyFrame with the rows of all coded groups, their group columns, manual_label and labels_match
+    """
+    labels = labels.select([DUPLICATE_GROUP_COLUMN, 'manual_label']).unique(DUPLICATE_GROUP_COLUMN, keep='first')
+    return (
+        pl.concat([data.lazy(), groups.lazy()], how="horizontal")
+        .join(labels.lazy(), on=DUPLICATE_GROUP_COLUMN, how='inner', maintain_order='left')
+        .with_columns((pl.col(label_column) == pl.col('manual_label')).alias('labels_match'))
+    )
@@ -0,0 +1,155 @@
+import polars as pl
+import numpy as np
+import tempfile
+from pathlib import Path
+
+from src.instrumentation import instrumented
+
+ROW_ID_COLUMN = "row_id"
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "JSON Lines": ("jsonl", "application/x-ndjson"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+}
+
+@instrumented
+def build_results(coded_data, manual_labels, label_column):
+    """
+    Join manual labels onto the coded sample by row id.
+
+    Rows are identified by their position in the sample, so duplicate texts
+    keep their own labels.
+
+    Args:
+    coded_data: Polars DataFrame with the coded sample
+    manual_labels: CodingStore with the manual labels of the sample
+    label_column: Name of the predicted label column
+
+    Returns:
+    Polars LazyFrame with row_id, the sample columns, manual_label and labels_match
+    """
+    labels = manual_labels.to_frame(coded_data.schema[label_column]).rename({'item_index': ROW_ID_COLUMN})
+    return (
+        coded_data.lazy()
+        .with_row_index(ROW_ID_COLUMN)
+        .join(labels.lazy(), on=ROW_ID_COLUMN, how='left', maintain_order='left')
+        .with_columns([
+            (pl.col(label_column) == pl.col('manual_label')).alias('labels_match'),
+            # Uncoded rows keep their predicted label
+            pl.col('manual_label').fill_null(pl.col(label_column))
+        ])
+    )
+
+def format_for_path(path):
+    """
+    Pick the export format matching a file extension.
+
+    Args:
+    path: Output path, e.g. "results.parquet"
+
+    Returns:
+    One of EXPORT_FORMATS
+    """
+    extension = Path(path).suffix.lstrip(".").lower()
+    for export_format, (format_extension, _) in EXPORT_FORMATS.items():
+        if extension == format_extension:
+            return export_format
+    raise ValueError(f"Unsupported file extension: {Path(path).suffix or path}")
+
+@instrumented
+def write_results(results, destination, export_format):
+    """
+    Write results to a file, streaming in chunks where the format allows it.
+
+    CSV, Parquet and JSON Lines are written batch by batch with the streaming
+    engine; Excel has to be materialized first.
+
+    Args:
+    results: Polars LazyFrame returned by build_results
+    destination: Path or binary file object
+    export_format: One of EXPORT_FORMATS
+
+    Returns:
+    The destination
+    """
+    if export_format == "CSV":
+        results.sink_csv(destination)
+    elif export_format == "Parquet":
+        results.sink_parquet(destination)
+    elif export_format == "JSON Lines":
+        results.sink_ndjson(destination)
+    elif export_format == "Excel":
+        results.collect().write_excel(destination)
+    else:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    return destination
+
+@instrumented
+def results_file(results, export_format):
+    """
+    Write results to an anonymous temporary file for download.
+
+    Args:
+    results: Polars LazyFrame returned by build_results
+    export_format: One of EXPORT_FORMATS
+
+    Returns:
+    Binary file object positioned at the start; the file is deleted when closed
+    """
+    buffer = tempfile.TemporaryFile()
+    write_results(results, buffer, export_format)
+    buffer.seek(0)
+    return buffer
+
+@instrumented
+def metrics_summary(metrics, intervals=None, labels=None, detailed=None):
+    """
+    Tabulate metrics and their confidence intervals for export.
+
+    Per-class and per-domain metrics are named like "recall[label]" and
+    "domain_f1[domain]".
+
+    Args:
+    metrics: Dictionary of calculated metrics
+    intervals: Optional dictionary of bootstrap confidence intervals (see bootstrap_confidence_intervals)
+    labels: Label values in confusion-matrix order, required for per-class intervals
+    detailed: Optional dictionary of per-class, per-domain and averaged metrics (see hierarchical_metrics)
+
+    Returns:
+    Polars DataFrame with metric, value, lower and upper columns
+    """
+    names = ['accuracy', 'precision', 'recall', 'f1']
+    summary = pl.DataFrame({
+        'metric': names,
+        'value': [float(metrics[name]) for name in names],
+        'lower': [intervals[name][0] if intervals else None for name in names],
+        'upper': [intervals[name][1] if intervals else None for name in names]
+    }, schema_overrides={'lower': pl.Float64, 'upper': pl.Float64})
+    if intervals is not None and labels is not None:
+        bounds = intervals['per_class_recall']
+        supported = ~np.isnan(bounds[:, 0])
+        per_class = pl.DataFrame({
+            'metric': [f"recall[{label}]" for label, keep in zip(labels, supported) if keep],
+            'value': bounds[supported, 0],
+            'lower': bounds[supported, 1],
+            'upper': bounds[supported, 2]
+        })
+        summary = pl.concat([summary, per_class])
+    if detailed is not None:
+        rows = [(name, value) for name, value in detailed['overall'].items() if name != 'accuracy']
+        for prefix, table, key in (("", detailed['per_class'], 'label'), ("domain_", detailed['per_domain'], 'domain')):
+            if table is None:
+                continue
+            table = table.filter(pl.col('support') > 0)
+            for name in [column for column in table.columns if column not in (key, 'domain', 'classes')]:
+                rows.extend((f"{prefix}{name}[{group}]", value) for group, value in zip(table[key], table[name]))
+        detail = pl.DataFrame({
+            'metric': [name for name, _ in rows],
+            'value': [float(value) for _, value in rows],
+            'lower': [None] * len(rows),
+            'upper': [None] * len(rows)
+        }, schema_overrides={'lower': pl.Float64, 'upper': pl.Float64})
+        # Per-class recall with bootstrap bounds is already in the summary
+        summary = pl.concat([summary, detail.filter(~pl.col('metric').is_in(summary['metric'].implode()))])
+    return summary
@@ -0,0 +1,161 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_MAX_EVENTS = 200_000
+_active_profiler = contextvars.ContextVar("active_profiler", default=None)
+
+def current_rss():
+    """
+    Get the resident memory of the process.
+
+    Returns:
+    Resident memory in bytes, or 0 where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+class Profiler:
+    """
+    Per-session recorder of stage timings.
+
+    Keeps call counts, wall time and the highest resident memory seen at
+    the end of a stage for the current rerun, plus a trace of every stage
+    of the session that can be exported in Chrome trace format (open it in
+    chrome://tracing or Perfetto). Resident memory is that of the whole
+    server process, so concurrent sessions show up in it.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.stages = {}
+        self.peak_rss = 0
+        self.events = []
+        self.rerun_finished = False
+        self._lock = threading.Lock()
+
+    def record(self, name, start, end, rss):
+        """
+        Record one completed stage.
+
+        The first record after finish_rerun starts the aggregates of a new
+        rerun, so widget callbacks count towards the rerun they trigger.
+
+        Args:
+        name: Stage name
+        start: perf_counter value at the start of the stage
+        end: perf_counter value at the end of the stage
+        rss: Resident memory in bytes at the end of the stage
+        """
+        with self._lock:
+            if self.rerun_finished:
+                self.stages = {}
+                self.peak_rss = 0
+                self.rerun_finished = False
+            calls, total, longest, peak = self.stages.get(name, (0, 0.0, 0.0, 0))
+            duration = end - start
+            self.stages[name] = (calls + 1, total + duration, max(longest, duration), max(peak, rss))
+            self.peak_rss = max(self.peak_rss, rss)
+            if len(self.events) < TRACE_MAX_EVENTS:
+                self.events.append({
+                    'name': name,
+                    'ph': 'X',
+                    'ts': (start - self.origin) * 1e6,
+                    'dur': duration * 1e6,
+                    'pid': os.getpid(),
+                    'tid': threading.get_ident(),
+                    'args': {'rss_mb': round(rss / 2**20, 1)}
+                })
+
+    def finish_rerun(self):
+        """
+        Mark the end of a rerun; its aggregates stay readable until the next stage is recorded.
+        """
+        with self._lock:
+            self.rerun_finished = True
+
+    def summary(self):
+        """
+        Summarize the stages of the current rerun.
+
+        Returns:
+        List of dictionaries with stage, calls, total_ms, max_ms and peak_rss_mb, slowest first
+        """
+        with self._lock:
+            stages = dict(self.stages)
+        return [
+            {'stage': name, 'calls': calls, 'total_ms': total * 1000, 'max_ms': longest * 1000,
+             'peak_rss_mb': peak / 2**20}
+            for name, (calls, total, longest, peak) in sorted(stages.items(), key=lambda item: -item[1][1])
+        ]
+
+    def chrome_trace(self):
+        """
+        Export the session trace in Chrome trace event format.
+
+        Returns:
+        JSON string
+        """
+        with self._lock:
+            events = list(self.events)
+        return json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'})
+
+def activate(profiler):
+    """
+    Make a profiler record the stages of the current thread, or stop recording.
+
+    Args:
+    profiler: Profiler or None to disable instrumentation
+    """
+    _active_profiler.set(profiler)
+
+@contextmanager
+def stage(name):
+    """
+    Time a block of code as a stage of the active profiler.
+
+    Args:
+    name: Stage name
+    """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.record(name, start, time.perf_counter(), current_rss())
+
+def instrumented(fn):
+    """
+    Decorate a function so that every call is timed as a stage of the active profiler.
+
+    Without an active profiler the only overhead is one context variable lookup.
+
+    Args:
+    fn: Function or method
+
+    Returns:
+    Wrapped function
+    """
+    name = f"{fn.__module__.removeprefix('src.')}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profiler = _active_profiler.get()
+        if profiler is None:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.record(name, start, time.perf_counter(), current_rss())
+    return wrapper
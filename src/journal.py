@@ -0,0 +1,259 @@
+import polars as pl
+import numpy as np
+from pathlib import Path
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import weakref
+
+from src.instrumentation import instrumented
+
+JOURNAL_DIR = Path(os.environ.get("MCV_JOURNAL_DIR", Path(__file__).parent.parent / ".cache" / "journals"))
+FSYNC_EVERY = 32
+FSYNC_INTERVAL = 2.0
+RECORD_DTYPE = np.dtype([('item_index', '<u4'), ('manual_code', '<u4'), ('predicted_code', '<u4'), ('current_index', '<u4')])
+POSITION_ONLY = np.iinfo(np.uint32).max
+
+@instrumented
+def sample_fingerprint(coded_data, text_column, label_column):
+    """
+    Identify a coding sample by its content and column selection.
+
+    Regenerating the same sample from the same dataset (sampling is seeded)
+    or re-uploading the same pre-sampled file yields the same fingerprint,
+    which is what lets a session find its journal again.
+
+    Args:
+    coded_data: Polars DataFrame with the items to code
+    text_column: Name of the text column
+    label_column: Name of the predicted label column
+
+    Returns:
+    Hex digest identifying the sample
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{text_column}\0{label_column}\0".encode())
+    digest.update(coded_data.select([text_column, label_column]).hash_rows(seed=0).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def coder_slug(coder):
+    """
+    Turn a coder name into a string that is safe to use in a file name.
+
+    Args:
+    coder: Coder name as entered
+
+    Returns:
+    Slug of letters, digits, dashes and underscores ("" for an unnamed coder)
+    """
+    return re.sub(r"[^A-Za-z0-9_-]+", "-", coder.strip()).strip("-")
+
+def journal_path(fingerprint, coder=""):
+    """
+    Get the journal file of one coder on a sample.
+
+    Args:
+    fingerprint: Sample fingerprint (see sample_fingerprint)
+    coder: Coder name; the unnamed coder keeps the single-coder journal
+
+    Returns:
+    Path of the journal
+    """
+    slug = coder_slug(coder)
+    return JOURNAL_DIR / (f"{fingerprint}.{slug}.journal" if slug else f"{fingerprint}.journal")
+
+def sample_journals(fingerprint):
+    """
+    Find the journals of every coder who has coded a sample.
+
+    Args:
+    fingerprint: Sample fingerprint (see sample_fingerprint)
+
+    Returns:
+    Dictionary mapping coder slugs ("" for the unnamed coder) to journal paths
+    """
+    return {
+        path.name[len(fingerprint) + 1:-len(".journal")]: path
+        for path in sorted(JOURNAL_DIR.glob(f"{fingerprint}*.journal"))
+    }
+
+@instrumented
+def read_decisions(path):
+    """
+    Read the latest decision per item and the last position from a journal file.
+
+    Does not open the journal for writing, so it can be used on other
+    coders' journals while they are coding.
+
+    Args:
+    path: Path of the journal
+
+    Returns:
+    Tuple of (Polars DataFrame with item_index, manual_label and predicted_label columns, current_index)
+    """
+    path = Path(path)
+    labels_path = path.with_suffix(".labels.json")
+    labels = json.loads(labels_path.read_text()) if labels_path.exists() else []
+    raw = path.read_bytes() if path.exists() else b""
+    return _decisions(raw, labels)
+
+def _decisions(raw, labels):
+    records = np.frombuffer(raw, dtype=RECORD_DTYPE, count=len(raw) // RECORD_DTYPE.itemsize)
+    current_index = int(records['current_index'][-1]) if len(records) else 0
+    submits = records[records['manual_code'] != POSITION_ONLY]
+    # Keep the last decision per item: first occurrence in the reversed log
+    _, last = np.unique(submits['item_index'][::-1], return_index=True)
+    latest = submits[::-1][last]
+    labels = pl.Series(labels)
+    decisions = pl.DataFrame({
+        'item_index': latest['item_index'].astype(np.int64),
+        'manual_label': labels.gather(latest['manual_code']),
+        'predicted_label': labels.gather(latest['predicted_code'])
+    })
+    return decisions, current_index
+
+class CodingJournal:
+    """
+    Append-only, crash-safe log of coding decisions.
+
+    Every Submit and every navigation appends one fixed-width 16-byte record
+    (item index, manual and predicted label codes, current position) with a
+    single O_APPEND write, so a crash of the app or the server never loses a
+    recorded decision. Records are fsynced in batches (every FSYNC_EVERY
+    records or FSYNC_INTERVAL seconds) to keep Submit latency low; a torn
+    record left by a power loss is ignored on replay and cut off when the
+    journal is reopened. Label values are kept in a small JSON dictionary
+    next to the log.
+    """
+
+    def __init__(self, path, labels=()):
+        self.path = Path(path)
+        self.labels_path = self.path.with_suffix(".labels.json")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.labels = json.loads(self.labels_path.read_text()) if self.labels_path.exists() else []
+        self.label_codes = {label: code for code, label in enumerate(self.labels)}
+        if any(label not in self.label_codes for label in labels):
+            self._extend_labels(labels)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # Drop a torn last record, so later appends stay aligned to the record width
+        size = os.fstat(self._fd).st_size
+        if size % RECORD_DTYPE.itemsize:
+            os.ftruncate(self._fd, size - size % RECORD_DTYPE.itemsize)
+        # Closes the descriptor if the journal is dropped without close(), e.g. when a session ends
+        self._finalizer = weakref.finalize(self, os.close, self._fd)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @classmethod
+    def for_sample(cls, coded_data, text_column, label_column, labels=(), coder=""):
+        """
+        Open a coder's journal on a coding sample.
+
+        Args:
+        coded_data: Polars DataFrame with the items to code
+        text_column: Name of the text column
+        label_column: Name of the predicted label column
+        labels: Label values to register up front
+        coder: Coder name; each coder of a sample has their own journal
+
+        Returns:
+        CodingJournal
+        """
+        return cls(journal_path(sample_fingerprint(coded_data, text_column, label_column), coder), labels)
+
+    def record_submit(self, item_index, manual_label, predicted_label, current_index):
+        """
+        Append a coding decision and the position the coder moves on to.
+
+        Args:
+        item_index: Index of the coded item in the sample
+        manual_label: Manually assigned label
+        predicted_label: Label predicted by the classifier
+        current_index: Index of the item shown next
+        """
+        with self._lock:
+            if manual_label not in self.label_codes or predicted_label not in self.label_codes:
+                self._extend_labels([manual_label, predicted_label])
+            self._append(item_index, self.label_codes[manual_label], self.label_codes[predicted_label], current_index)
+
+    def record_position(self, current_index):
+        """
+        Remember the item the coder navigated to.
+
+        Args:
+        current_index: Index of the item shown
+        """
+        with self._lock:
+            self._append(current_index, POSITION_ONLY, POSITION_ONLY, current_index)
+
+    @instrumented
+    def replay(self):
+        """
+        Read back the latest decision per item and the last position.
+
+        Returns:
+        Tuple of (Polars DataFrame with item_index, manual_label and predicted_label columns, current_index)
+        """
+        with self._lock:
+            raw = self.path.read_bytes()
+        return _decisions(raw, self.labels)
+
+    def sync(self):
+        """
+        Flush all appended records to disk.
+        """
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        """
+        Flush and close the journal. Closing it again has no effect.
+        """
+        with self._lock:
+            if self._finalizer.alive:
+                self._sync()
+                self._finalizer()
+
+    def _append(self, item_index, manual_code, predicted_code, current_index):
+        if not self._finalizer.alive:
+            # The descriptor number may already belong to another file
+            raise ValueError(f"Coding journal {self.path} is closed")
+        record = np.array([(item_index, manual_code, predicted_code, current_index)], dtype=RECORD_DTYPE)
+        os.write(self._fd, record.tobytes())
+        self._unsynced += 1
+        if self._unsynced >= FSYNC_EVERY or time.monotonic() - self._last_sync >= FSYNC_INTERVAL:
+            self._sync()
+
+    def _sync(self):
+        if self._unsynced:
+            os.fsync(self._fd)
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _extend_labels(self, labels):
+        for label in labels:
+            if label not in self.label_codes:
+                self.label_codes[label] = len(self.labels)
+                self.labels.append(label)
+        # The sidecar must be durable before any record using the new codes is written
+        partial_path = self.labels_path.with_suffix(".partial")
+        with open(partial_path, "w") as partial:
+            partial.write(json.dumps(self.labels))
+            partial.flush()
+            os.fsync(partial.fileno())
+        os.replace(partial_path, self.labels_path)
+        directory_fd = os.open(self.labels_path.parent, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
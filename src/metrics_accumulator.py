@@ -0,0 +1,226 @@
+import numpy as np
+import polars as pl
+
+from src.confusion import domain_confusion
+from src.instrumentation import instrumented
+
+def _class_scores(cm):
+    """
+    Calculate per-class precision, recall and F1 from a confusion matrix.
+
+    Args:
+    cm: Square float confusion matrix (rows: true labels, columns: predicted labels)
+
+    Returns:
+    Tuple of arrays (support, predicted, precision, recall, f1); 0 where a class was never predicted or has no support
+    """
+    true_positives = np.diag(cm)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted > 0, true_positives / predicted, 0.0)
+        recall = np.where(support > 0, true_positives / support, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return support, predicted, precision, recall, f1
+
+def metrics_from_confusion_matrix(cm):
+    """
+    Calculate classification metrics from a confusion matrix.
+
+    Matches calculate_metrics: accuracy plus support-weighted precision,
+    recall and F1, with 0 for classes that were never predicted.
+
+    Args:
+    cm: Square confusion matrix (rows: true labels, columns: predicted labels)
+
+    Returns:
+    Dictionary of calculated metrics
+    """
+    cm = np.asarray(cm, dtype=np.float64)
+    total = cm.sum()
+    if total == 0:
+        return {'accuracy': 0.0, 'precision': 0.0, 'recall': 0.0, 'f1': 0.0}
+    support, _, precision, recall, f1 = _class_scores(cm)
+    weights = support / total
+    return {
+        'accuracy': float(np.trace(cm) / total),
+        'precision': float(weights @ precision),
+        'recall': float(weights @ recall),
+        'f1': float(weights @ f1)
+    }
+
+@instrumented
+def hierarchical_metrics(cm, labels, domains=None):
+    """
+    Calculate per-class, per-domain and overall metrics from one confusion matrix.
+
+    Overall scores come as micro averages (equal to accuracy for single-label
+    coding), macro averages over the labels that occur as true or predicted
+    label, and support-weighted averages (as in calculate_metrics). Domains
+    are scored twice with group sums over their classes: on the matrix
+    collapsed to domains (only confusions across domains count as errors)
+    and as the macro F1 of their classes.
+
+    Args:
+    cm: Square confusion matrix (rows: true labels, columns: predicted labels)
+    labels: Label values in matrix order
+    domains: Optional domain name of every label, in matrix order (see label_domains)
+
+    Returns:
+    Dictionary with 'overall' (dictionary of scores), 'per_class' (Polars DataFrame with label, support,
+    precision, recall and f1, plus domain if given) and 'per_domain' (Polars DataFrame or None)
+    """
+    cm = np.asarray(cm, dtype=np.float64)
+    total = cm.sum()
+    support, predicted, precision, recall, f1 = _class_scores(cm)
+    present = (support + predicted) > 0
+    weights = support / total if total > 0 else support
+    accuracy = float(np.trace(cm) / total) if total > 0 else 0.0
+    overall = {'accuracy': accuracy, 'micro_precision': accuracy, 'micro_recall': accuracy, 'micro_f1': accuracy}
+    for name, scores in (('precision', precision), ('recall', recall), ('f1', f1)):
+        overall[f"macro_{name}"] = float(scores[present].mean()) if present.any() else 0.0
+        overall[f"weighted_{name}"] = float(weights @ scores)
+
+    per_class = pl.DataFrame({
+        'label': pl.Series(labels),
+        'support': support,
+        'precision': precision,
+        'recall': recall,
+        'f1': f1
+    })
+    per_domain = None
+    if domains is not None:
+        per_class = per_class.insert_column(1, pl.Series('domain', domains, dtype=pl.String))
+        domain_cm, names = domain_confusion(cm, domains)
+        domain_codes = np.unique(np.asarray(domains, dtype=object), return_inverse=True)[1]
+        domain_support, _, domain_precision, domain_recall, domain_f1 = _class_scores(domain_cm)
+        group_sum = lambda values: np.bincount(domain_codes, weights=values, minlength=len(names))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            per_domain = pl.DataFrame({
+                'domain': names,
+                'classes': group_sum(present).astype(np.int64),
+                'support': domain_support,
+                'accuracy': np.where(domain_support > 0, group_sum(np.diag(cm)) / domain_support, 0.0),
+                'precision': domain_precision,
+                'recall': domain_recall,
+                'f1': domain_f1,
+                'macro_f1': np.where(group_sum(present) > 0, group_sum(f1 * present) / group_sum(present), 0.0)
+            })
+    return {'overall': overall, 'per_class': per_class, 'per_domain': per_domain}
+
+class ConfusionAccumulator:
+    """
+    Integer-coded confusion matrix that is updated one coded item at a time.
+
+    Submitting or retracting an item is O(1), and metrics are derived from
+    the accumulated counts, so their cost depends on the number of classes
+    rather than on the number of coded items. Items of a weighted sample add
+    their inverse inclusion probability instead of 1, so the counts estimate
+    the confusion matrix of the whole dataset. The version increases with
+    every update, so results derived from the counts can be cached by it.
+    """
+
+    def __init__(self, labels, weighted=False):
+        self.labels = list(labels)
+        self.label_codes = {label: code for code, label in enumerate(self.labels)}
+        self.weighted = weighted
+        self.counts = np.zeros((len(self.labels), len(self.labels)), dtype=np.float64 if weighted else np.int64)
+        self.items = 0
+        self.version = 0
+
+    def add(self, true_label, predicted_label, weight=1):
+        """
+        Record a coded item.
+
+        Args:
+        true_label: Manually assigned label
+        predicted_label: Label predicted by the classifier
+        weight: Sample weight of the item (weighted accumulators only)
+        """
+        self.counts[self._code(true_label), self._code(predicted_label)] += weight
+        self.items += 1
+        self.version += 1
+
+    @instrumented
+    def add_many(self, true_labels, predicted_labels, weights=None):
+        """
+        Record many coded items in one vectorized update, e.g. when replaying a journal.
+
+        Args:
+        true_labels: Sequence of manually assigned labels
+        predicted_labels: Sequence of labels predicted by the classifier
+        weights: Optional sequence of sample weights (weighted accumulators only)
+        """
+        if len(true_labels) == 0:
+            return
+        true_labels = pl.Series(true_labels)
+        predicted_labels = pl.Series(predicted_labels)
+        for label in pl.concat([true_labels, predicted_labels]).unique().sort():
+            self._code(label)
+        label_codes = pl.Series(list(self.label_codes.values()))
+        known_labels = pl.Series(list(self.label_codes.keys()))
+        true_codes = true_labels.replace_strict(known_labels, label_codes).to_numpy()
+        predicted_codes = predicted_labels.replace_strict(known_labels, label_codes).to_numpy()
+        np.add.at(self.counts, (true_codes, predicted_codes), 1 if weights is None else np.asarray(weights, dtype=np.float64))
+        self.items += len(true_codes)
+        self.version += 1
+
+    def remove(self, true_label, predicted_label, weight=1):
+        """
+        Retract a previously recorded item, e.g. when a coder revises it.
+
+        Args:
+        true_label: Manually assigned label
+        predicted_label: Label predicted by the classifier
+        weight: Sample weight the item was recorded with
+        """
+        self.counts[self.label_codes[true_label], self.label_codes[predicted_label]] -= weight
+        self.items -= 1
+        self.version += 1
+
+    def total(self):
+        """
+        Get the number of recorded items.
+
+        Returns:
+        Number of items (not their summed weights)
+        """
+        return self.items
+
+    @instrumented
+    def metrics(self):
+        """
+        Calculate classification metrics from the accumulated counts.
+
+        Returns:
+        Dictionary of calculated metrics
+        """
+        return metrics_from_confusion_matrix(self.counts)
+
+    def hierarchical_metrics(self, domains=None):
+        """
+        Calculate per-class, per-domain and overall metrics from the accumulated counts.
+
+        Args:
+        domains: Optional domain name of every label, in accumulator label order (see label_domains)
+
+        Returns:
+        Dictionary of metrics (see hierarchical_metrics)
+        """
+        return hierarchical_metrics(self.counts, self.labels, domains)
+
+    def confusion_matrix(self):
+        """
+        Get the confusion matrix over all labels.
+
+        Returns:
+        Confusion matrix (rows: true labels, columns: predicted labels)
+        """
+        return self.counts.copy()
+
+    def _code(self, label):
+        if label not in self.label_codes:
+            self.label_codes[label] = len(self.labels)
+            self.labels.append(label)
+            self.counts = np.pad(self.counts, ((0, 1), (0, 1)))
+        return self.label_codes[label]
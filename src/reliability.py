@@ -0,0 +1,166 @@
+import numpy as np
+import polars as pl
+
+from src.instrumentation import instrumented
+
+MISSING = -1
+
+@instrumented
+def build_coder_matrix(codings, labels, num_items):
+    """
+    Build an integer-coded coder x item matrix from the coders' decisions.
+
+    Args:
+    codings: Dictionary mapping coder names to Polars DataFrames with item_index and manual_label columns
+    labels: Label values; position gives the code, labels not listed are appended
+    num_items: Number of items in the sample; decisions on later items (e.g. from a coder who drew
+    further batches of a sequential sample) are ignored
+
+    Returns:
+    Tuple of (list of label values, int matrix of shape (coders, items) with MISSING for uncoded items)
+    """
+    labels = list(labels)
+    known = set(labels)
+    for decisions in codings.values():
+        for label in decisions['manual_label'].unique().sort():
+            if label not in known:
+                known.add(label)
+                labels.append(label)
+    label_series = pl.Series(labels)
+    codes = pl.Series(np.arange(len(labels), dtype=np.int64))
+    matrix = np.full((len(codings), num_items), MISSING, dtype=np.int64)
+    for row, decisions in enumerate(codings.values()):
+        decisions = decisions.filter(pl.col('item_index') < num_items)
+        item_codes = decisions['manual_label'].replace_strict(label_series, codes, return_dtype=pl.Int64)
+        matrix[row, decisions['item_index'].to_numpy()] = item_codes.to_numpy()
+    return labels, matrix
+
+def cohens_kappa(first, second, num_classes):
+    """
+    Calculate Cohen's kappa between two coders over the items both coded.
+
+    Args:
+    first: Int array of codes from the first coder (MISSING for uncoded items)
+    second: Int array of codes from the second coder (MISSING for uncoded items)
+    num_classes: Number of label codes
+
+    Returns:
+    Kappa, or NaN if the coders share no items
+    """
+    return float(pairwise_cohens_kappa(np.stack([first, second]), num_classes)[0, 1])
+
+def pairwise_cohens_kappa(matrix, num_classes):
+    """
+    Calculate Cohen's kappa for every pair of coders.
+
+    The confusion matrices of all coder pairs are counted with a single
+    bincount over the stacked pairs.
+
+    Args:
+    matrix: Int matrix of shape (coders, items) with MISSING for uncoded items
+    num_classes: Number of label codes
+
+    Returns:
+    Symmetric float matrix of shape (coders, coders) with 1 on the diagonal and
+    NaN for pairs without shared items
+    """
+    first, second, pair_codes, both = _coder_pairs(matrix, num_classes)
+    num_pairs = len(first)
+    pair_ids = np.broadcast_to(np.arange(num_pairs)[:, None], both.shape)[both]
+    cells = pair_ids * num_classes**2 + pair_codes[both]
+    cm = np.bincount(cells, minlength=num_pairs * num_classes**2).reshape(num_pairs, num_classes, num_classes)
+    totals = cm.sum(axis=(1, 2)).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        observed = np.trace(cm, axis1=1, axis2=2) / totals
+        expected = np.einsum('pi,pi->p', cm.sum(axis=2), cm.sum(axis=1)) / totals**2
+        kappa = np.where(expected < 1, (observed - expected) / (1 - expected), 1.0)
+    kappa[totals == 0] = np.nan
+    kappas = np.eye(matrix.shape[0])
+    kappas[first, second] = kappas[second, first] = kappa
+    return kappas
+
+def fleiss_kappa(matrix, num_classes):
+    """
+    Calculate Fleiss' kappa, allowing a varying number of coders per item.
+
+    Items coded by fewer than two coders are ignored.
+
+    Args:
+    matrix: Int matrix of shape (coders, items) with MISSING for uncoded items
+    num_classes: Number of label codes
+
+    Returns:
+    Kappa, or NaN if no item was coded twice
+    """
+    coded = matrix != MISSING
+    raters = coded.sum(axis=0)
+    pairable = raters >= 2
+    if not pairable.any():
+        return np.nan
+    _, _, pair_codes, both = _coder_pairs(matrix, num_classes)
+    # Agreeing coder pairs per item, out of raters * (raters - 1) / 2; a pair
+    # agrees exactly when its pair code is a multiple of num_classes + 1
+    agreeing = (both & (pair_codes % (num_classes + 1) == 0)).sum(axis=0)[pairable]
+    raters = raters[pairable]
+    observed = (2 * agreeing / (raters * (raters - 1))).mean()
+    category_share = np.bincount(matrix[:, pairable][coded[:, pairable]], minlength=num_classes) / raters.sum()
+    expected = category_share @ category_share
+    return float((observed - expected) / (1 - expected)) if expected < 1 else 1.0
+
+def krippendorff_alpha(matrix, num_classes):
+    """
+    Calculate Krippendorff's alpha for nominal data.
+
+    The coincidence matrix is accumulated over all coder pairs at once, each
+    pair on an item weighted by 1 / (coders on the item - 1), so missing
+    codings need no special handling.
+
+    Args:
+    matrix: Int matrix of shape (coders, items) with MISSING for uncoded items
+    num_classes: Number of label codes
+
+    Returns:
+    Alpha, or NaN if no item was coded twice
+    """
+    raters = (matrix != MISSING).sum(axis=0)
+    if not (raters >= 2).any():
+        return np.nan
+    _, _, pair_codes, both = _coder_pairs(matrix, num_classes)
+    weights = np.broadcast_to(1 / np.maximum(raters - 1, 1), both.shape)[both]
+    coincidences = np.bincount(pair_codes[both], weights=weights, minlength=num_classes**2)
+    coincidences = coincidences.reshape(num_classes, num_classes)
+    # Each unordered pair stands for both orderings
+    coincidences = coincidences + coincidences.T
+    category_totals = coincidences.sum(axis=1)
+    total = category_totals.sum()
+    expected_disagreement = total**2 - category_totals @ category_totals
+    if expected_disagreement == 0:
+        return 1.0
+    return float(1 - (total - 1) * (total - np.trace(coincidences)) / expected_disagreement)
+
+@instrumented
+def calculate_reliability(matrix, num_classes):
+    """
+    Calculate inter-coder reliability statistics.
+
+    Args:
+    matrix: Int matrix of shape (coders, items) with MISSING for uncoded items
+    num_classes: Number of label codes
+
+    Returns:
+    Dictionary with 'fleiss_kappa', 'krippendorff_alpha', 'pairwise_cohens_kappa'
+    (coders x coders matrix) and 'items_coded_twice'
+    """
+    return {
+        'fleiss_kappa': fleiss_kappa(matrix, num_classes),
+        'krippendorff_alpha': krippendorff_alpha(matrix, num_classes),
+        'pairwise_cohens_kappa': pairwise_cohens_kappa(matrix, num_classes),
+        'items_coded_twice': int(((matrix != MISSING).sum(axis=0) >= 2).sum())
+    }
+
+def _coder_pairs(matrix, num_classes):
+    # Stack every coder pair (u < v) as one row: code_u * num_classes + code_v per item
+    first, second = np.triu_indices(matrix.shape[0], k=1)
+    both = (matrix[first] != MISSING) & (matrix[second] != MISSING)
+    pair_codes = matrix[first] * num_classes + matrix[second]
+    return first, second, pair_codes, both
@@ -1,48 +1,474 @@
 import polars as pl
+import numpy as np
 import math
+import heapq
+from statistics import NormalDist
 
+from src.instrumentation import instrumented
+from src.shards import ShardedDataset
+
+ROW_INDEX_COLUMN = "__row_index"
+SAMPLE_KEY_COLUMN = "__sample_key"
+SAMPLE_WEIGHT_COLUMN = "sample_weight"
+ALLOCATION_METHODS = ["neyman", "proportional", "cost"]
+
+def _collect_rows(data, row_indices):
+    """
+    Materialize only the given row positions of a lazy dataset.
+    
+    Args:
+    data: Polars LazyFrame
+    row_indices: Sequence of row positions to keep
+    
+    Returns:
+    Polars DataFrame with the selected rows
+    """
+    return (
+        data.with_row_index(ROW_INDEX_COLUMN)
+        .filter(pl.col(ROW_INDEX_COLUMN).is_in(pl.Series(row_indices, dtype=pl.UInt32)))
+        .drop(ROW_INDEX_COLUMN)
+        .collect(engine="streaming")
+    )
+
+def _collect_shard_rows(shards, row_indices):
+    """
+    Materialize only the given global row positions of a sharded dataset, reading the shards in parallel.
+    
+    Args:
+    shards: ShardedDataset
+    row_indices: Sequence of global row positions
+    
+    Returns:
+    Polars DataFrame with the selected rows in their original order
+    """
+    row_indices = pl.Series(row_indices, dtype=pl.UInt64).sort()
+    
+    def collect(shard):
+        start = shards.offsets[shard]
+        local = row_indices.filter((row_indices >= start) & (row_indices < start + shards.row_counts[shard])) - start
+        return _collect_rows(shards.frames[shard], local.cast(pl.UInt32)) if len(local) else None
+    
+    rows = [frame for frame in shards.map(collect) if frame is not None]
+    return pl.concat(rows) if rows else shards.frames[0].head(0).collect()
+
+def _merge_shard_keys(shards, keys, count, descending=False):
+    """
+    Compute per-shard candidates in parallel and keep the overall count rows with the smallest (or largest) key.
+    
+    Args:
+    shards: ShardedDataset
+    keys: Function of (shard LazyFrame, global offset) returning a LazyFrame with ROW_INDEX_COLUMN and SAMPLE_KEY_COLUMN
+    count: Number of rows to keep
+    descending: Keep the largest keys instead of the smallest
+    
+    Returns:
+    Polars DataFrame with the kept rows, sorted by key
+    """
+    select = (lambda frame: frame.top_k(count, by=SAMPLE_KEY_COLUMN)) if descending else (
+        lambda frame: frame.bottom_k(count, by=[SAMPLE_KEY_COLUMN, ROW_INDEX_COLUMN]))
+    candidates = shards.map(lambda shard: select(keys(shards.frames[shard], shards.offsets[shard])).collect(engine="streaming"))
+    return select(pl.concat(candidates).lazy()).collect().sort(SAMPLE_KEY_COLUMN, descending=descending)
+
+@instrumented
 def get_random_sample(data, sample_size):
     """
     Get a random sample from the dataset.
     
     Args:
-    data: Polars DataFrame
+    data: Polars DataFrame, LazyFrame or ShardedDataset
     sample_size: Number of samples to take
     
     Returns:
     Polars DataFrame with random samples
     """
+    if isinstance(data, ShardedDataset):
+        # The rows with the smallest seeded keys of each shard, merged
+        sampled = _merge_shard_keys(data, lambda frame, offset: frame.select([
+            (pl.int_range(pl.len(), dtype=pl.UInt64) + offset).alias(ROW_INDEX_COLUMN),
+            _random_key(42, offset).alias(SAMPLE_KEY_COLUMN)
+        ]), sample_size)
+        return _collect_shard_rows(data, sampled[ROW_INDEX_COLUMN])
+    if isinstance(data, pl.LazyFrame):
+        total_count = data.select(pl.len()).collect(engine="streaming").item()
+        rng = np.random.default_rng(42)
+        row_indices = rng.choice(total_count, size=min(sample_size, total_count), replace=False)
+        return _collect_rows(data, np.sort(row_indices))
     return data.sample(n=min(sample_size, len(data)), seed=42)
 
-def get_stratified_sample(data, label_column, min_samples_per_class, max_samples_per_class, class_distribution):
+def _random_key(seed, offset=0):
     """
-    Get a stratified sample from the dataset.
+    Seeded pseudo-random key per row, derived from the global row position.
+    
+    Hashing the position instead of drawing from a generator makes the key of
+    a row independent of how the data is chunked, so single-pass and
+    streaming samplers select the same rows for the same seed.
+    
+    Args:
+    seed: Random seed
+    offset: Global position of the first row
+    
+    Returns:
+    Polars expression with one UInt64 key per row
+    """
+    return (pl.int_range(pl.len(), dtype=pl.UInt64) + offset).hash(seed)
+
+def _stratum_selection(label_column, sample_sizes):
+    """
+    Select the rows with the smallest random keys within each stratum.
+    
+    The key must already be materialized in SAMPLE_KEY_COLUMN; computed inside
+    the window it would restart at every group.
     
     Args:
-    data: Polars DataFrame
+    label_column: Name of the label column
+    sample_sizes: Dictionary mapping labels to their sample size
+    
+    Returns:
+    Boolean Polars expression
+    """
+    return (
+        pl.col(SAMPLE_KEY_COLUMN).rank("ordinal").over(label_column)
+        <= pl.col(label_column).replace_strict(sample_sizes, default=0)
+    )
+
+@instrumented
+def get_stratum_sizes(class_distribution, label_column, min_samples_per_class, max_samples_per_class):
+    """
+    Get the number of samples to draw from each class.
+    
+    Args:
+    class_distribution: Class distribution DataFrame
     label_column: Name of the label column
     min_samples_per_class: Minimum number of samples per class
     max_samples_per_class: Maximum number of samples per class
-    class_distribution: Class distribution DataFrame
     
     Returns:
-    Polars DataFrame with stratified samples
+    Dictionary mapping labels to their sample size
     """
     min_class_count = class_distribution['counts'].min()
     min_samples_per_class = min(min_samples_per_class, min_class_count)
     
-    sample_sizes = {
+    return {
         label: min(max(min_samples_per_class, count), max_samples_per_class)
         for label, count in zip(class_distribution[label_column], class_distribution['counts'])
     }
+
+def _candidate_thresholds(class_distribution, label_column, sample_sizes):
+    """
+    Per-class upper bound on the random key that very likely leaves enough candidates.
+    
+    Keys are uniform over UInt64, so a class with n rows and sample size s
+    keeps about s + 3*sqrt(s) + 10 rows below its threshold. Ranking only
+    those candidates selects exactly the same rows as ranking the full class
+    whenever at least s of them remain.
+    
+    Args:
+    class_distribution: Class distribution DataFrame
+    label_column: Name of the label column
+    sample_sizes: Dictionary mapping labels to their sample size
+    
+    Returns:
+    Dictionary mapping labels to a UInt64 key threshold
+    """
+    thresholds = {}
+    for label, count in zip(class_distribution[label_column], class_distribution['counts']):
+        size = sample_sizes[label]
+        fraction = min(1.0, (size + 3 * math.sqrt(size) + 10) / count)
+        thresholds[label] = min(2**64 - 1, int(fraction * 2**64))
+    return thresholds
+
+def _select_strata(data, label_column, sample_sizes, thresholds, seed, offset=0):
+    """
+    Keep the rows with the smallest random keys within each class.
+    
+    Args:
+    data: Polars LazyFrame
+    label_column: Name of the label column
+    sample_sizes: Dictionary mapping labels to their sample size
+    thresholds: Dictionary mapping labels to a key threshold, or None to rank every row
+    seed: Random seed
+    offset: Global position of the first row
+    
+    Returns:
+    Polars LazyFrame with the selected rows and their SAMPLE_KEY_COLUMN
+    """
+    data = data.with_columns(_random_key(seed, offset).alias(SAMPLE_KEY_COLUMN))
+    if thresholds is not None:
+        data = data.filter(
+            pl.col(SAMPLE_KEY_COLUMN) <= pl.col(label_column).replace_strict(thresholds, default=0, return_dtype=pl.UInt64)
+        )
+    return data.filter(_stratum_selection(label_column, sample_sizes))
+
+def _select_shard_strata(shards, label_column, sample_sizes, thresholds, seed):
+    """
+    Select the strata of every shard in parallel and merge them.
+    
+    Each shard keeps at most the sample size of every class, so the merged
+    candidates are small; ranking them again gives the same rows as ranking
+    the concatenated shards.
+    
+    Args:
+    shards: ShardedDataset
+    label_column: Name of the label column
+    sample_sizes: Dictionary mapping labels to their sample size
+    thresholds: Dictionary mapping labels to a key threshold, or None to rank every row
+    seed: Random seed
+    
+    Returns:
+    Polars DataFrame with the label, global ROW_INDEX_COLUMN and SAMPLE_KEY_COLUMN of the selected rows
+    """
+    def select(shard):
+        offset = shards.offsets[shard]
+        rows = shards.frames[shard].select([
+            pl.col(label_column),
+            (pl.int_range(pl.len(), dtype=pl.UInt64) + offset).alias(ROW_INDEX_COLUMN)
+        ])
+        return _select_strata(rows, label_column, sample_sizes, thresholds, seed, offset).collect(engine="streaming")
+    
+    return pl.concat(shards.map(select)).filter(_stratum_selection(label_column, sample_sizes))
+
+@instrumented
+def get_stratified_sample(data, label_column, min_samples_per_class, max_samples_per_class, class_distribution, seed=42,
+                          sample_sizes=None):
+    """
+    Get a stratified sample from the dataset.
+    
+    All strata are drawn in one vectorized pass: every row gets a seeded
+    random key and the rows with the smallest keys within each class are
+    kept. Rows whose key is far above what their class needs are discarded
+    before ranking. For lazy inputs the strata are drawn from the label
+    column alone and only the selected rows are collected; sharded inputs
+    are drawn shard by shard in parallel.
+    
+    Args:
+    data: Polars DataFrame, LazyFrame or ShardedDataset
+    label_column: Name of the label column
+    min_samples_per_class: Minimum number of samples per class
+    max_samples_per_class: Maximum number of samples per class
+    class_distribution: Class distribution DataFrame
+    seed: Random seed
+    sample_sizes: Optional dictionary mapping labels to their sample size (see allocate_sample); replaces the min/max sizing
     
-    sampled_data = []
-    for label, size in sample_sizes.items():
-        class_data = data.filter(pl.col(label_column) == label).sample(n=size, seed=42)
-        sampled_data.append(class_data)
+    Returns:
+    Polars DataFrame with stratified samples, with a sample_weight column if sample_sizes is given
+    """
+    # Allocated strata are sized for the stratified estimator, so the sample carries its weights
+    weights = None if sample_sizes is None else stratum_weights(class_distribution, label_column, sample_sizes)
+    if sample_sizes is None:
+        sample_sizes = get_stratum_sizes(class_distribution, label_column, min_samples_per_class, max_samples_per_class)
+    thresholds = _candidate_thresholds(class_distribution, label_column, sample_sizes)
+    
+    if isinstance(data, ShardedDataset):
+        sampled = _select_shard_strata(data, label_column, sample_sizes, thresholds, seed)
+        if len(sampled) < sum(sample_sizes.values()):
+            sampled = _select_shard_strata(data, label_column, sample_sizes, None, seed)
+        sample = _collect_shard_rows(data, sampled[ROW_INDEX_COLUMN])
+    else:
+        if isinstance(data, pl.LazyFrame):
+            rows = data.select(label_column).with_row_index(ROW_INDEX_COLUMN)
+        else:
+            rows = data.lazy()
+        sampled = _select_strata(rows, label_column, sample_sizes, thresholds, seed).collect(engine="streaming")
+        if len(sampled) < sum(sample_sizes.values()):
+            # A class ran short of candidates below its threshold; rank every row instead
+            sampled = _select_strata(rows, label_column, sample_sizes, None, seed).collect(engine="streaming")
+        if isinstance(data, pl.LazyFrame):
+            sample = _collect_rows(data, sampled[ROW_INDEX_COLUMN].sort())
+        else:
+            sample = sampled.drop(SAMPLE_KEY_COLUMN)
     
-    return pl.concat(sampled_data)
+    if weights is not None:
+        sample = sample.with_columns(
+            pl.col(label_column).replace_strict(weights, default=None, return_dtype=pl.Float64).alias(SAMPLE_WEIGHT_COLUMN)
+        )
+    return sample
 
+def stratum_weights(class_distribution, label_column, sample_sizes):
+    """
+    Get the inverse inclusion probability N_h / n_h of the items of each stratum.
+    
+    Metrics weighted by them estimate the whole dataset however the strata
+    were allocated.
+    
+    Args:
+    class_distribution: Class distribution DataFrame
+    label_column: Name of the label column
+    sample_sizes: Dictionary mapping labels to their sample size
+    
+    Returns:
+    Dictionary mapping labels to their weight
+    """
+    return {
+        label: count / sample_sizes[label]
+        for label, count in zip(class_distribution[label_column], class_distribution['counts'])
+        if sample_sizes.get(label, 0) > 0
+    }
+
+@instrumented
+def stratified_reservoir_sample(batches, label_column, sample_sizes, seed=42):
+    """
+    Draw a stratified sample from a stream of DataFrame batches.
+    
+    Keeps a per-class reservoir of the rows with the smallest random keys, so
+    memory stays proportional to the sample plus one batch. Given the same
+    seed, the result equals get_stratified_sample on the concatenated data.
+    
+    Args:
+    batches: Iterable of Polars DataFrames with identical schemas
+    label_column: Name of the label column
+    sample_sizes: Dictionary mapping labels to their sample size (see get_stratum_sizes)
+    seed: Random seed
+    
+    Returns:
+    Polars DataFrame with stratified samples in their original order
+    """
+    reservoir = None
+    offset = 0
+    for batch in batches:
+        batch = batch.with_columns([
+            (pl.int_range(pl.len(), dtype=pl.UInt64) + offset).alias(ROW_INDEX_COLUMN),
+            _random_key(seed, offset).alias(SAMPLE_KEY_COLUMN)
+        ])
+        offset += len(batch)
+        reservoir = batch if reservoir is None else pl.concat([reservoir, batch])
+        reservoir = reservoir.filter(_stratum_selection(label_column, sample_sizes))
+    if reservoir is None:
+        return pl.DataFrame()
+    return reservoir.sort(ROW_INDEX_COLUMN).drop([ROW_INDEX_COLUMN, SAMPLE_KEY_COLUMN])
+
+def _uniform_key(seed, offset=0):
+    """
+    Seeded pseudo-random number in (0, 1] per row, from the top 53 bits of _random_key.
+    
+    Args:
+    seed: Random seed
+    offset: Global position of the first row
+    
+    Returns:
+    Polars Float64 expression
+    """
+    return ((_random_key(seed, offset) // 2048) + 1).cast(pl.Float64) * 2.0**-53
+
+@instrumented
+def get_weighted_sample(data, sample_size, confidence_column, min_weight=0.05, seed=42):
+    """
+    Draw a sample that oversamples low-confidence predictions.
+    
+    Each row gets the sampling weight 1 - confidence, floored at min_weight so
+    that confident predictions can still be drawn. Rows are drawn by priority
+    sampling: the priority weight / u with a seeded uniform u per row is one
+    vectorized expression, and the rows with the sample_size highest
+    priorities form the sample. With the next highest priority as threshold,
+    max(1, threshold / weight) is an exact inverse inclusion probability, so
+    metrics weighted by the returned sample_weight column are unbiased
+    estimates for the whole dataset.
+    
+    Args:
+    data: Polars DataFrame, LazyFrame or ShardedDataset
+    sample_size: Number of samples to take
+    confidence_column: Name of the column with the classifier's confidence (probability of the predicted label, 0 to 1)
+    min_weight: Smallest sampling weight; rows without a confidence get the largest weight (1)
+    seed: Random seed
+    
+    Returns:
+    Polars DataFrame with the sampled rows in their original order and a sample_weight column
+    """
+    uncertainty = (1 - pl.col(confidence_column).cast(pl.Float64)).fill_nan(None).fill_null(1.0).clip(min_weight, 1.0)
+    
+    def priorities_of(frame, offset=0):
+        return frame.lazy().select([
+            (pl.int_range(pl.len(), dtype=pl.UInt64) + offset).alias(ROW_INDEX_COLUMN),
+            uncertainty.alias(SAMPLE_WEIGHT_COLUMN),
+            (uncertainty / _uniform_key(seed, offset)).alias(SAMPLE_KEY_COLUMN)
+        ])
+    
+    if isinstance(data, ShardedDataset):
+        priorities = _merge_shard_keys(data, priorities_of, sample_size + 1, descending=True)
+    else:
+        priorities = (
+            priorities_of(data)
+            .top_k(sample_size + 1, by=SAMPLE_KEY_COLUMN)
+            .collect(engine="streaming")
+            .sort(SAMPLE_KEY_COLUMN, descending=True)
+        )
+    # Without an unsampled row every row is drawn with certainty
+    threshold = priorities[SAMPLE_KEY_COLUMN][sample_size] if len(priorities) > sample_size else 0.0
+    sampled = priorities.head(sample_size).sort(ROW_INDEX_COLUMN)
+    weights = (threshold / sampled[SAMPLE_WEIGHT_COLUMN]).clip(lower_bound=1.0)
+    if isinstance(data, ShardedDataset):
+        rows = _collect_shard_rows(data, sampled[ROW_INDEX_COLUMN])
+    elif isinstance(data, pl.LazyFrame):
+        rows = _collect_rows(data, sampled[ROW_INDEX_COLUMN])
+    else:
+        rows = data.select(pl.all().gather(sampled[ROW_INDEX_COLUMN]))
+    return rows.with_columns(weights.alias(SAMPLE_WEIGHT_COLUMN))
+
+class SequentialSampler:
+    """
+    Draw a random sample from a dataset in batches, in a fixed seeded order.
+    
+    Rows are visited in ascending order of a seeded hash of their position,
+    so the first k drawn rows are a simple random sample of size k for any k
+    and coding can stop as soon as the estimate is precise enough. The
+    sampler keeps no drawing state: the rows at any position of the order
+    can be drawn again, e.g. when a session resumes. The row positions are
+    hashed and sorted once when the sampler is created (4 bytes per row), so
+    each draw only slices the order and materializes the rows it returns.
+    """
+    
+    def __init__(self, data, batch_size=25, seed=42):
+        self.data = data.lazy() if isinstance(data, ShardedDataset) else data
+        self.batch_size = batch_size
+        self.seed = seed
+        if isinstance(data, pl.LazyFrame):
+            self.population = data.select(pl.len()).collect(engine="streaming").item()
+        else:
+            self.population = len(data)
+        self.order = (
+            pl.DataFrame({ROW_INDEX_COLUMN: pl.int_range(self.population, dtype=pl.UInt32, eager=True)})
+            .with_columns(_random_key(self.seed).alias(SAMPLE_KEY_COLUMN))
+            .sort([SAMPLE_KEY_COLUMN, ROW_INDEX_COLUMN])
+            .get_column(ROW_INDEX_COLUMN)
+        )
+    
+    @instrumented
+    def draw(self, start, stop):
+        """
+        Draw the rows at the given positions of the sampling order.
+        
+        Args:
+        start: First position
+        stop: Position after the last one
+        
+        Returns:
+        Polars DataFrame with the rows, in sampling order
+        """
+        start = max(start, 0)
+        order = self.order.slice(start, max(min(stop, self.population) - start, 0)).to_frame()
+        if isinstance(self.data, pl.LazyFrame):
+            rows = (
+                self.data.with_row_index(ROW_INDEX_COLUMN)
+                .filter(pl.col(ROW_INDEX_COLUMN).is_in(order[ROW_INDEX_COLUMN]))
+                .collect(engine="streaming")
+            )
+            return order.join(rows, on=ROW_INDEX_COLUMN, how='left', maintain_order='left').drop(ROW_INDEX_COLUMN)
+        return self.data.select(pl.all().gather(order[ROW_INDEX_COLUMN]))
+    
+    def extend(self, drawn, count=None):
+        """
+        Draw the rows that follow the ones drawn so far.
+        
+        Args:
+        drawn: Number of rows drawn so far
+        count: Total number of rows wanted; whole batches are drawn until it is reached (default: one batch)
+        
+        Returns:
+        Polars DataFrame with the new rows, in sampling order (empty once the population is exhausted)
+        """
+        batches = 1 if count is None else math.ceil(max(count - drawn, 0) / self.batch_size)
+        return self.draw(drawn, drawn + batches * self.batch_size)
+
+@instrumented
 def calculate_sample_size(confidence_level, margin_of_error, num_classes=2, expected_proportion=0.5):
     """
     Calculate required sample size based on confidence level, margin of error, and expected proportion.
@@ -56,6 +482,148 @@ def calculate_sample_size(confidence_level, margin_of_error, num_classes=2, expe
     Returns:
     Calculated sample size
     """
-    z_score = 1.96 if confidence_level == 0.95 else 2.576
-    sample_size = (z_score**2 * expected_proportion * (1 - expected_proportion) * num_classes) / (margin_of_error**2)
-    return math.ceil(sample_size)
\ No newline at end of file
+    sample_size = (z_score(confidence_level)**2 * expected_proportion * (1 - expected_proportion) * num_classes) / (margin_of_error**2)
+    return math.ceil(sample_size)
+
+def z_score(confidence_level):
+    """
+    Get the two-sided standard normal quantile for a confidence level.
+    
+    Args:
+    confidence_level: Confidence level, e.g. 0.95
+    
+    Returns:
+    z such that P(-z < Z < z) equals the confidence level
+    """
+    return NormalDist().inv_cdf(0.5 + confidence_level / 2)
+
+def _stratum_variances(class_distribution, expected_accuracy, label_column):
+    """
+    Per-stratum population variance of the agreement indicator.
+    
+    Args:
+    class_distribution: Class distribution DataFrame
+    expected_accuracy: Expected share of correct predictions, as a number or a dictionary per label
+    label_column: Name of the label column
+    
+    Returns:
+    Tuple of (stratum sizes, variances) as NumPy arrays
+    """
+    counts = class_distribution['counts'].to_numpy().astype(np.float64)
+    if isinstance(expected_accuracy, dict):
+        accuracy = np.array([expected_accuracy.get(label, 0.5) for label in class_distribution[label_column]])
+    else:
+        accuracy = np.full(len(counts), float(expected_accuracy))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variances = np.where(counts > 1, accuracy * (1 - accuracy) * counts / (counts - 1), 0.0)
+    return counts, variances
+
+def _design_variance(counts, variances, sizes):
+    """
+    Variance of the stratified accuracy estimate, with finite population correction.
+    
+    Args:
+    counts: Stratum sizes
+    variances: Stratum variances
+    sizes: Per-stratum sample sizes
+    
+    Returns:
+    Variance
+    """
+    weights = counts / counts.sum()
+    terms = weights**2 * variances
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_stratum = np.where(terms > 0, terms / sizes - terms / counts, 0.0)
+    return float(per_stratum.sum())
+
+def allocate_sample(class_distribution, label_column, margin_of_error, confidence_level=0.95, allocation="neyman",
+                    expected_accuracy=0.5, costs=None, min_samples_per_class=2):
+    """
+    Size each stratum so the stratified accuracy estimate reaches a target margin of error.
+    
+    Strata are the predicted classes and each coded item is a Bernoulli
+    trial (predicted label correct or not) with the expected accuracy of
+    its class. Allocations:
+    - "neyman": fewest coded items overall. Items are added one at a time to
+      the stratum with the largest variance reduction, which is the exact
+      integer optimum for a variance target.
+    - "cost": lowest total coding cost. Like "neyman", but the variance
+      reduction is divided by the stratum's cost per item (e.g. mean text
+      length).
+    - "proportional": sizes proportional to the class counts, scaled until
+      the target is met.
+    Every class gets at least min_samples_per_class items (or all of them);
+    if the target cannot be reached, every item of every class is coded.
+    
+    Args:
+    class_distribution: Class distribution DataFrame
+    label_column: Name of the label column
+    margin_of_error: Target half-width of the confidence interval of the accuracy
+    confidence_level: Confidence level, e.g. 0.95
+    allocation: One of ALLOCATION_METHODS
+    expected_accuracy: Expected share of correct predictions, as a number or a dictionary per label
+    costs: Dictionary mapping labels to the relative cost of coding one item, used by "cost"
+    min_samples_per_class: Minimum number of samples per class
+    
+    Returns:
+    Dictionary mapping labels to their sample size
+    """
+    if allocation not in ALLOCATION_METHODS:
+        raise ValueError(f"Unknown allocation: {allocation}")
+    labels = class_distribution[label_column].to_list()
+    counts, variances = _stratum_variances(class_distribution, expected_accuracy, label_column)
+    target = (margin_of_error / z_score(confidence_level))**2
+    lower = np.minimum(np.maximum(min_samples_per_class, 1), counts)
+
+    if allocation == "proportional":
+        # Smallest common sampling fraction that reaches the target
+        low, high = 0.0, 1.0
+        for _ in range(60):
+            fraction = (low + high) / 2
+            sizes = np.clip(np.ceil(fraction * counts), lower, counts)
+            if _design_variance(counts, variances, sizes) <= target:
+                high = fraction
+            else:
+                low = fraction
+        sizes = np.clip(np.ceil(high * counts), lower, counts)
+        return {label: int(size) for label, size in zip(labels, sizes)}
+
+    unit_costs = np.ones(len(labels))
+    if allocation == "cost" and costs is not None:
+        unit_costs = np.array([max(float(costs.get(label, 1.0)), 1e-9) for label in labels])
+    terms = (counts / counts.sum())**2 * variances
+    sizes = lower.copy()
+    variance = _design_variance(counts, variances, sizes)
+    # Max-heap of the variance reduction per unit cost of one more item in each stratum
+    heap = [(-terms[h] / (sizes[h] * (sizes[h] + 1)) / unit_costs[h], h)
+            for h in range(len(labels)) if terms[h] > 0 and sizes[h] < counts[h]]
+    heapq.heapify(heap)
+    while variance > target:
+        if not heap:
+            # No stratum has items left to add: the target is out of reach, so code every item
+            sizes = counts.copy()
+            break
+        _, h = heapq.heappop(heap)
+        variance -= terms[h] / (sizes[h] * (sizes[h] + 1))
+        sizes[h] += 1
+        if sizes[h] < counts[h]:
+            heapq.heappush(heap, (-terms[h] / (sizes[h] * (sizes[h] + 1)) / unit_costs[h], h))
+    return {label: int(size) for label, size in zip(labels, sizes)}
+
+def design_margin_of_error(class_distribution, label_column, sample_sizes, confidence_level=0.95, expected_accuracy=0.5):
+    """
+    Get the expected margin of error of the stratified accuracy estimate for given stratum sizes.
+    
+    Args:
+    class_distribution: Class distribution DataFrame
+    label_column: Name of the label column
+    sample_sizes: Dictionary mapping labels to their sample size
+    confidence_level: Confidence level, e.g. 0.95
+    expected_accuracy: Expected share of correct predictions, as a number or a dictionary per label
+    
+    Returns:
+    Margin of error
+    """
+    counts, variances = _stratum_variances(class_distribution, expected_accuracy, label_column)
+    sizes = np.array([sample_sizes.get(label, 0) for label in class_distribution[label_column]], dtype=np.float64)
+    return z_score(confidence_level) * math.sqrt(_design_variance(counts, variances, sizes))
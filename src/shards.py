@@ -0,0 +1,105 @@
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+from pathlib import Path
+
+import polars as pl
+
+from src.data_io import scan_table
+
+SHARD_EXTENSIONS = (".csv", ".parquet", ".arrow", ".ipc", ".feather", ".jsonl", ".ndjson")
+
+def is_shard_source(source):
+    """
+    Check whether a dataset source names several shards (a directory or a glob pattern) rather than one file.
+
+    Args:
+    source: Path or pattern
+
+    Returns:
+    Boolean
+    """
+    return Path(source).is_dir() or any(char in str(source) for char in "*?[")
+
+def find_shards(source):
+    """
+    List the shard files of a directory (recursively) or glob pattern.
+
+    Args:
+    source: Directory, glob pattern (** matches subdirectories) or single file
+
+    Returns:
+    Sorted list of paths
+    """
+    if Path(source).is_dir():
+        paths = [path for path in Path(source).rglob("*") if path.suffix.lower() in SHARD_EXTENSIONS]
+    elif is_shard_source(source):
+        paths = [Path(path) for path in glob.glob(str(source), recursive=True)]
+    else:
+        paths = [Path(source)]
+    paths = sorted(path for path in paths if path.is_file())
+    if not paths:
+        raise ValueError(f"No CSV, Parquet, Arrow IPC or JSON Lines shards found at {source}")
+    return paths
+
+class ShardedDataset:
+    """
+    A dataset split over many files, e.g. the output shards of a batch classifier.
+
+    Every shard is scanned lazily; schemas and row counts are read from all
+    shards in parallel when the dataset is opened. Class distributions and
+    samples are computed shard by shard on a thread pool (Polars releases the
+    GIL, so shards run on separate cores) and merged, so the full corpus is
+    never concatenated in memory. Rows are numbered globally in shard order,
+    which makes seeded samples identical to sampling the concatenated files.
+    """
+
+    def __init__(self, paths, workers=None):
+        self.paths = list(paths)
+        self.workers = workers or os.cpu_count()
+        self.frames = [scan_table(path) for path in self.paths]
+        schemas = self.map(lambda shard: self.frames[shard].collect_schema())
+        for path, schema in zip(self.paths[1:], schemas[1:]):
+            if schema != schemas[0]:
+                columns = [", ".join(f"{name} ({dtype})" for name, dtype in first.items() if (name, dtype) not in second.items())
+                           or "no other columns" for first, second in ((schema, schemas[0]), (schemas[0], schema))]
+                raise ValueError(f"Schema of shard {path} does not match {self.paths[0]}: it has {columns[0]} "
+                                 f"instead of {columns[1]}")
+        self.schema = schemas[0]
+        self.row_counts = self.map(lambda shard: self.frames[shard].select(pl.len()).collect().item())
+        self.offsets = list(accumulate(self.row_counts[:-1], initial=0))
+
+    def __len__(self):
+        return sum(self.row_counts)
+
+    def map(self, fn):
+        """
+        Run a function for every shard in parallel.
+
+        Args:
+        fn: Function of the shard number
+
+        Returns:
+        List of results in shard order
+        """
+        with ThreadPoolExecutor(self.workers) as pool:
+            return list(pool.map(fn, range(len(self.frames))))
+
+    def lazy(self):
+        """
+        Get all shards as one lazy dataset.
+
+        Returns:
+        Polars LazyFrame concatenating the shards
+        """
+        return pl.concat(self.frames, how="vertical")
+
+    def collect_schema(self):
+        """
+        Get the common schema of the shards.
+
+        Returns:
+        Polars Schema
+        """
+        return self.schema
@@ -1,47 +1,128 @@
 import polars as pl
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
+import numpy as np
 from difflib import get_close_matches
 
+from src.instrumentation import instrumented
+from src.sampling import SAMPLE_WEIGHT_COLUMN, z_score
+from src.shards import ShardedDataset
+
+BOOTSTRAP_CHUNK_ELEMENTS = 4_000_000
+NO_DOMAIN = "(no domain)"
+
+@instrumented
 def get_class_distribution(data, label_column):
     """
     Calculate class distribution in the dataset.
     
+    Lazy inputs are aggregated with the streaming engine, so only the label
+    column is ever read. Sharded inputs are counted shard by shard in
+    parallel and the counts merged.
+    
     Args:
-    data: Polars DataFrame
+    data: Polars DataFrame, LazyFrame or ShardedDataset
     label_column: Name of the label column
     
     Returns:
     Polars DataFrame with class distribution
     """
-    total_count = len(data)
+    if isinstance(data, ShardedDataset):
+        shard_counts = data.map(lambda shard: data.frames[shard].group_by(label_column).agg(pl.len().alias('counts'))
+                                .collect(engine="streaming"))
+        counts = pl.concat(shard_counts).group_by(label_column).agg(pl.col('counts').sum())
+    else:
+        counts = data.lazy().group_by(label_column).agg(pl.len().alias('counts')).collect(engine="streaming")
+    total_count = counts['counts'].sum()
     return (
-        data.group_by(label_column)
-        .agg(pl.count().alias('counts'))
-        .sort('counts', descending=True)
+        counts
+        .sort(['counts', label_column], descending=[True, False])
         .with_columns([
             (pl.col('counts') / total_count * 100).alias('percentage')
         ])
     )
 
-def calculate_metrics(true_labels, predicted_labels):
+@instrumented
+def get_class_text_lengths(data, label_column, text_column):
+    """
+    Calculate the mean text length per class, a proxy for the cost of coding one item.
+    
+    Args:
+    data: Polars DataFrame, LazyFrame or ShardedDataset
+    label_column: Name of the label column
+    text_column: Name of the text column
+    
+    Returns:
+    Dictionary mapping labels to their mean number of characters
+    """
+    lengths = (
+        data.lazy()
+        .group_by(label_column)
+        .agg(pl.col(text_column).cast(pl.String).str.len_chars().mean().alias('length'))
+        .collect(engine="streaming")
+    )
+    return dict(zip(lengths[label_column], lengths['length'].fill_null(1.0)))
+
+@instrumented
+def get_class_accuracies(coded, label_column, expected_accuracy, manual_column='manual_label', prior_items=2):
+    """
+    Estimate the accuracy of each predicted class from an earlier coded sample.
+    
+    Each class's share of correct predictions is shrunk toward the expected
+    accuracy as if prior_items items had been coded at that accuracy, so
+    classes with few coded items do not get an accuracy of exactly 0 or 1.
+    Items are weighted by their sample_weight column if the sample has one.
+    
+    Args:
+    coded: Polars DataFrame with the coded rows of a sample
+    label_column: Name of the predicted label column
+    expected_accuracy: Accuracy assumed for classes without coded items
+    manual_column: Name of the manual label column
+    prior_items: Weight of the expected accuracy, in coded items
+    
+    Returns:
+    Dictionary mapping labels to their expected accuracy
+    """
+    weight = pl.col(SAMPLE_WEIGHT_COLUMN).cast(pl.Float64) if SAMPLE_WEIGHT_COLUMN in coded.columns else pl.lit(1.0)
+    correct = (pl.col(label_column) == pl.col(manual_column)).cast(pl.Float64)
+    accuracies = (
+        coded.lazy()
+        .with_columns(weight.alias('weight'))
+        .group_by(label_column)
+        .agg([
+            (correct * pl.col('weight')).sum().alias('correct'),
+            pl.col('weight').sum().alias('total'),
+            pl.len().alias('items')
+        ])
+        # Shrink by item counts, so the weights only set the shares within a class
+        .with_columns(((pl.col('correct') / pl.col('total') * pl.col('items') + prior_items * expected_accuracy)
+                       / (pl.col('items') + prior_items)).alias('accuracy'))
+        .collect()
+    )
+    return dict(zip(accuracies[label_column], accuracies['accuracy']))
+
+@instrumented
+def calculate_metrics(true_labels, predicted_labels, sample_weight=None):
     """
     Calculate classification metrics.
     
     Args:
     true_labels: List of true labels
     predicted_labels: List of predicted labels
+    sample_weight: Optional inverse inclusion probabilities of a weighted sample (see get_weighted_sample)
     
     Returns:
     Dictionary of calculated metrics
     """
+    # Imported on first use: sklearn takes most of a cold start and the app's live statistics do not need it
+    from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
     return {
-        'accuracy': accuracy_score(true_labels, predicted_labels),
-        'precision': precision_score(true_labels, predicted_labels, average='weighted', zero_division=0),
-        'recall': recall_score(true_labels, predicted_labels, average='weighted', zero_division=0),
-        'f1': f1_score(true_labels, predicted_labels, average='weighted', zero_division=0)
+        'accuracy': accuracy_score(true_labels, predicted_labels, sample_weight=sample_weight),
+        'precision': precision_score(true_labels, predicted_labels, average='weighted', zero_division=0, sample_weight=sample_weight),
+        'recall': recall_score(true_labels, predicted_labels, average='weighted', zero_division=0, sample_weight=sample_weight),
+        'f1': f1_score(true_labels, predicted_labels, average='weighted', zero_division=0, sample_weight=sample_weight)
     }
 
-def get_confusion_matrix(true_labels, predicted_labels, unique_labels):
+@instrumented
+def get_confusion_matrix(true_labels, predicted_labels, unique_labels, sample_weight=None):
     """
     Calculate confusion matrix.
     
@@ -49,12 +130,15 @@ def get_confusion_matrix(true_labels, predicted_labels, unique_labels):
     true_labels: List of true labels
     predicted_labels: List of predicted labels
     unique_labels: List of unique label values
+    sample_weight: Optional inverse inclusion probabilities of a weighted sample (see get_weighted_sample)
     
     Returns:
-    Confusion matrix
+    Confusion matrix (estimated population counts when weighted)
     """
-    return confusion_matrix(true_labels, predicted_labels, labels=unique_labels)
+    from sklearn.metrics import confusion_matrix
+    return confusion_matrix(true_labels, predicted_labels, labels=unique_labels, sample_weight=sample_weight)
 
+@instrumented
 def suggest_sampling_method(num_classes, class_distribution):
     """
     Suggest an appropriate sampling method based on dataset characteristics.
@@ -73,6 +157,7 @@ def suggest_sampling_method(num_classes, class_distribution):
     else:
         return "multi-class"
 
+@instrumented
 def create_label_to_code_mapping(unique_labels, codebook):
     """
     Create a mapping between labels and codebook codes.
@@ -98,4 +183,136 @@ def create_label_to_code_mapping(unique_labels, codebook):
             closest_matches = get_close_matches(codebook_key, codebook.keys(), n=1, cutoff=0.6)
             mapping[label] = closest_matches[0] if closest_matches else None
     
-    return mapping
\ No newline at end of file
+    return mapping
+
+def label_domains(labels, label_to_code_mapping, codebook):
+    """
+    Look up the codebook domain of every label.
+    
+    Args:
+    labels: List of labels
+    label_to_code_mapping: Dictionary mapping labels to codebook codes (see create_label_to_code_mapping)
+    codebook: Dictionary containing the codebook
+    
+    Returns:
+    List of domain names in label order, NO_DOMAIN for labels without a code or domain
+    """
+    return [
+        codebook.get(label_to_code_mapping.get(label), {}).get('domain') or NO_DOMAIN
+        for label in labels
+    ]
+
+@instrumented
+def confusion_matrix_from_codes(true_codes, predicted_codes, num_classes):
+    """
+    Calculate a confusion matrix from integer-coded labels with a single bincount.
+    
+    Args:
+    true_codes: Array of true label codes (0 to num_classes - 1)
+    predicted_codes: Array of predicted label codes (0 to num_classes - 1)
+    num_classes: Number of label codes
+    
+    Returns:
+    Confusion matrix (rows: true labels, columns: predicted labels)
+    """
+    flat = np.asarray(true_codes, dtype=np.int64) * num_classes + np.asarray(predicted_codes, dtype=np.int64)
+    return np.bincount(flat, minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+
+@instrumented
+def bootstrap_confidence_intervals(cm, n_replicates=10000, confidence_level=0.95, seed=42):
+    """
+    Calculate percentile bootstrap confidence intervals for the metrics of calculate_metrics and per-class recall.
+    
+    Resampling coded items only changes how often each (true, predicted)
+    cell of the confusion matrix occurs, so every replicate is drawn as a
+    row of cell counts: item draws are mapped to their cell and counted with
+    one bincount per chunk of replicates. All metrics are then computed for
+    all replicates at once with matrix operations.
+    
+    Args:
+    cm: Confusion matrix of the coded items (rows: true labels, columns: predicted labels)
+    n_replicates: Number of bootstrap replicates
+    confidence_level: Confidence level of the intervals
+    seed: Random seed
+    
+    Returns:
+    Dictionary mapping 'accuracy', 'precision', 'recall' and 'f1' to (lower, upper) tuples,
+    and 'per_class_recall' to a (num_classes, 3) array of estimate, lower and upper bound
+    (NaN for classes without support)
+    """
+    cm = np.asarray(cm, dtype=np.int64)
+    num_classes = cm.shape[0]
+    total = int(cm.sum())
+    true_idx, predicted_idx = np.nonzero(cm)
+    item_cells = np.repeat(np.arange(len(true_idx), dtype=np.int32), cm[true_idx, predicted_idx])
+    num_cells = len(true_idx)
+    
+    rng = np.random.default_rng(seed)
+    cell_counts = np.empty((n_replicates, num_cells), dtype=np.int64)
+    chunk = max(1, BOOTSTRAP_CHUNK_ELEMENTS // max(total, 1))
+    for start in range(0, n_replicates, chunk):
+        size = min(chunk, n_replicates - start)
+        draws = item_cells[rng.integers(0, total, size=(size, total), dtype=np.int32)]
+        draws += (np.arange(size, dtype=np.int32) * num_cells)[:, None]
+        cell_counts[start:start + size] = np.bincount(draws.ravel(), minlength=size * num_cells).reshape(size, num_cells)
+    
+    # Counts stay exact: float64 holds integers up to 2**53, so only the final ratios round
+    cell_counts = cell_counts.astype(np.float64)
+    true_onehot = np.zeros((num_cells, num_classes), dtype=np.float64)
+    true_onehot[np.arange(num_cells), true_idx] = 1
+    predicted_onehot = np.zeros((num_cells, num_classes), dtype=np.float64)
+    predicted_onehot[np.arange(num_cells), predicted_idx] = 1
+    support = cell_counts @ true_onehot
+    predicted = cell_counts @ predicted_onehot
+    true_positives = cell_counts @ (true_onehot * (true_idx == predicted_idx)[:, None])
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted > 0, true_positives / predicted, 0.0)
+        recall = np.where(support > 0, true_positives / support, np.nan)
+        f1 = np.where(precision + np.nan_to_num(recall) > 0,
+                      2 * precision * recall / (precision + recall), 0.0)
+    weights = support / total
+    replicates = {
+        'accuracy': true_positives.sum(axis=1) / total,
+        'precision': (weights * precision).sum(axis=1),
+        'recall': np.nansum(weights * recall, axis=1),
+        'f1': np.nansum(weights * f1, axis=1)
+    }
+    
+    alpha = (1 - confidence_level) / 2
+    intervals = {
+        name: tuple(float(bound) for bound in np.quantile(values, [alpha, 1 - alpha]))
+        for name, values in replicates.items()
+    }
+    per_class_recall = np.full((num_classes, 3), np.nan)
+    supported = cm.sum(axis=1) > 0
+    per_class_recall[supported, 0] = np.diag(cm)[supported] / cm.sum(axis=1)[supported]
+    if supported.any():
+        per_class_recall[supported, 1:] = np.nanquantile(recall[:, supported], [alpha, 1 - alpha], axis=0).T
+    intervals['per_class_recall'] = per_class_recall
+    return intervals
+
+@instrumented
+def accuracy_interval(correct, total, confidence_level=0.95):
+    """
+    Calculate the Wilson score interval of an accuracy.
+    
+    Unlike the normal approximation it stays inside [0, 1] and keeps its
+    coverage for accuracies close to 1, which is where sequential coding
+    stops earliest.
+    
+    Args:
+    correct: Number of items whose predicted label was correct
+    total: Number of coded items
+    confidence_level: Confidence level, e.g. 0.95
+    
+    Returns:
+    Tuple of (estimate, lower bound, upper bound); (0, 0, 1) when nothing was coded
+    """
+    if total == 0:
+        return 0.0, 0.0, 1.0
+    z = z_score(confidence_level)
+    estimate = correct / total
+    center = (estimate + z**2 / (2 * total)) / (1 + z**2 / total)
+    half_width = z * np.sqrt(estimate * (1 - estimate) / total + z**2 / (4 * total**2)) / (1 + z**2 / total)
+    return estimate, float(center - half_width), float(center + half_width)
@@ -1,8 +1,10 @@
+import polars as pl
 import streamlit as st
-import plotly.express as px
-import plotly.graph_objects as go
-import pandas as pd
 
+from src.confusion import MAX_HEATMAP_LABELS, top_confusions, confused_labels, confusion_submatrix, domain_confusion
+from src.instrumentation import instrumented
+
+@instrumented
 def plot_class_distribution(class_distribution, label_column):
     """
     Create a bar plot of class distribution.
@@ -14,12 +16,15 @@ def plot_class_distribution(class_distribution, label_column):
     Returns:
     Plotly Figure
     """
+    # Plotly and pandas are imported when the first chart or table is drawn, not at app start
+    import plotly.express as px
     fig = px.bar(class_distribution.to_pandas(), x=label_column, y='counts', text='percentage',
                  labels={'counts': 'Count', label_column: 'Class'}, title="Class Distribution")
     fig.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
     fig.update_layout(uniformtext_minsize=8, uniformtext_mode='hide')
     return fig
 
+@instrumented
 def plot_confusion_matrix(cm, unique_labels):
     """
     Create a heatmap of the confusion matrix.
@@ -31,6 +36,7 @@ def plot_confusion_matrix(cm, unique_labels):
     Returns:
     Plotly Figure
     """
+    import plotly.express as px
     fig = px.imshow(cm, 
                     labels=dict(x="Predicted Label", y="True Label", color="Count"),
                     x=unique_labels,
@@ -39,17 +45,136 @@ def plot_confusion_matrix(cm, unique_labels):
     fig.update_layout(title='Confusion Matrix')
     return fig
 
-def display_multi_class_stats(metrics):
+@instrumented
+def display_confusion_viewer(cm, labels, domains=None, figure=None):
+    """
+    Display a confusion matrix whose size stays bounded however many classes there are.
+    
+    The full heatmap is only offered up to MAX_HEATMAP_LABELS labels. Beyond
+    that the viewer shows the most frequent confusions as a table, a zoomed
+    heatmap of chosen labels or the matrix aggregated to codebook domains.
+    
+    Args:
+    cm: Confusion matrix (rows: true labels, columns: predicted labels)
+    labels: Label values in matrix order
+    domains: Optional domain name of every label (see label_domains)
+    figure: Optional full heatmap built in advance with plot_confusion_matrix, e.g. in a background task
+    """
+    import pandas as pd
+    views = (["Full matrix"] if len(labels) <= MAX_HEATMAP_LABELS else []) + ["Top confusions", "Zoom"]
+    if domains is not None:
+        views.append("Domains")
+    view = st.radio("Confusion matrix view:", views, horizontal=True)
+    
+    if view == "Full matrix":
+        st.plotly_chart(figure if figure is not None else plot_confusion_matrix(cm, labels), use_container_width=True)
+    elif view == "Top confusions":
+        k = st.slider("Number of label pairs:", 5, 100, 20, 5)
+        pairs = top_confusions(cm, labels, k)
+        st.dataframe(pd.DataFrame({
+            'True Label': pairs['true_label'].to_list(),
+            'Predicted Label': pairs['predicted_label'].to_list(),
+            'Count': pairs['count'].to_list(),
+            'Share of True Label': (pairs['share_of_true'] * 100).to_list()
+        }), hide_index=True, column_config={'Share of True Label': st.column_config.NumberColumn(format="%.1f%%")})
+    elif view == "Zoom":
+        selected = st.multiselect(f"Labels to show (up to {MAX_HEATMAP_LABELS}):", labels,
+                                  default=confused_labels(cm, labels), max_selections=MAX_HEATMAP_LABELS)
+        if selected:
+            submatrix, selected = confusion_submatrix(cm, labels, selected)
+            st.plotly_chart(plot_confusion_matrix(submatrix, selected), use_container_width=True)
+    else:
+        domain_cm, domain_names = domain_confusion(cm, domains)
+        fig = plot_confusion_matrix(domain_cm, domain_names)
+        fig.update_layout(title='Confusion Matrix by Domain')
+        st.plotly_chart(fig, use_container_width=True)
+
+@instrumented
+def display_multi_class_stats(metrics, intervals=None, labels=None, detailed=None):
     """
     Display multi-class classification statistics.
     
     Args:
     metrics: Dictionary of calculated metrics
+    intervals: Optional dictionary of bootstrap confidence intervals (see bootstrap_confidence_intervals)
+    labels: Label values in confusion-matrix order, required for per-class intervals
+    detailed: Optional dictionary of per-class, per-domain and averaged metrics (see hierarchical_metrics)
     """
+    import pandas as pd
     st.subheader("Coding Statistics")
     stats_df = pd.DataFrame({
         'Metric': ['Accuracy', 'Weighted Precision', 'Weighted Recall', 'Weighted F1 Score'],
         'Value': [f"{metrics['accuracy']:.2f}", f"{metrics['precision']:.2f}", 
                   f"{metrics['recall']:.2f}", f"{metrics['f1']:.2f}"]
     })
-    st.table(stats_df)
\ No newline at end of file
+    if intervals is not None:
+        stats_df['Confidence Interval'] = [
+            f"[{intervals[name][0]:.2f}, {intervals[name][1]:.2f}]" for name in ['accuracy', 'precision', 'recall', 'f1']
+        ]
+    st.table(stats_df)
+    
+    if intervals is not None and labels is not None:
+        st.markdown("**Per-class recall:**")
+        st.dataframe(pd.DataFrame({
+            'Label': labels,
+            'Recall': intervals['per_class_recall'][:, 0],
+            'Lower': intervals['per_class_recall'][:, 1],
+            'Upper': intervals['per_class_recall'][:, 2]
+        }).dropna(), hide_index=True)
+    
+    if detailed is not None:
+        overall = detailed['overall']
+        st.markdown("**Averages:**")
+        st.table(pd.DataFrame({
+            'Average': ['Micro', 'Macro', 'Weighted'],
+            **{name.capitalize() if name != 'f1' else 'F1 Score': [f"{overall[f'{average}_{name}']:.2f}" for average in ['micro', 'macro', 'weighted']]
+               for name in ['precision', 'recall', 'f1']}
+        }))
+        with st.expander("Per-class metrics"):
+            st.dataframe(detailed['per_class'].filter(pl.col('support') > 0).to_pandas(), hide_index=True)
+        if detailed['per_domain'] is not None:
+            with st.expander("Per-domain metrics"):
+                st.caption("Precision, recall and F1 only count confusions between domains; "
+                           "accuracy and macro F1 are over the exact labels of the domain's classes.")
+                st.dataframe(detailed['per_domain'].to_pandas(), hide_index=True)
+
+@instrumented
+def display_reliability_stats(reliability, coders):
+    """
+    Display inter-coder reliability statistics and pairwise agreement.
+    
+    Args:
+    reliability: Dictionary returned by calculate_reliability
+    coders: Coder names in matrix order
+    """
+    import pandas as pd
+    import plotly.express as px
+    st.subheader("Inter-coder Reliability")
+    st.table(pd.DataFrame({
+        'Metric': ["Fleiss' Kappa", "Krippendorff's Alpha (nominal)", "Items Coded by 2+ Coders"],
+        'Value': [f"{reliability['fleiss_kappa']:.2f}", f"{reliability['krippendorff_alpha']:.2f}",
+                  f"{reliability['items_coded_twice']:,}"]
+    }))
+    fig = px.imshow(reliability['pairwise_cohens_kappa'],
+                    labels=dict(x="Coder", y="Coder", color="Cohen's Kappa"),
+                    x=coders,
+                    y=coders,
+                    zmin=-1, zmax=1,
+                    text_auto='.2f',
+                    color_continuous_scale='RdBu')
+    fig.update_layout(title="Pairwise Cohen's Kappa")
+    st.plotly_chart(fig, use_container_width=True)
+
+def display_stage_timings(summary, peak_rss_mb):
+    """
+    Display per-stage timings and memory of the current rerun.
+    
+    Args:
+    summary: List of stage dictionaries (see Profiler.summary)
+    peak_rss_mb: Highest resident memory of the server process seen during the rerun, in MB
+    """
+    import pandas as pd
+    st.markdown(f"**Peak RSS this rerun:** {peak_rss_mb:,.0f} MB (whole server process)")
+    st.dataframe(pd.DataFrame(summary, columns=['stage', 'calls', 'total_ms', 'max_ms', 'peak_rss_mb']).rename(columns={
+        'stage': 'Stage', 'calls': 'Calls', 'total_ms': 'Total (ms)', 'max_ms': 'Max (ms)', 'peak_rss_mb': 'Peak RSS (MB)'
+    }), hide_index=True)
@@ -0,0 +1,267 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import polars as pl
+
+from src.instrumentation import instrumented
+from src.journal import JOURNAL_DIR
+
+LEASE_BATCH_SIZE = 20
+LEASE_SECONDS = 15 * 60
+BUSY_TIMEOUT = 30.0
+_WRITE_LOCKS = {}
+_WRITE_LOCKS_LOCK = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    item_index INTEGER PRIMARY KEY,
+    coder TEXT,
+    lease_expires REAL,
+    manual_label,
+    coded_at REAL
+);
+CREATE INDEX IF NOT EXISTS open_items ON items (item_index) WHERE manual_label IS NULL;
+CREATE INDEX IF NOT EXISTS coder_items ON items (coder) WHERE manual_label IS NULL;
+"""
+
+def _write_lock(path):
+    """
+    Get the lock that serializes the writes of one process to a queue database.
+
+    SQLite's busy handler polls a taken lock with growing sleeps, which
+    shows up as tail latency when dozens of sessions of one server submit at
+    once. Sessions in the same process queue on this lock instead and take
+    SQLite's lock the moment it is free; other processes still wait under
+    busy_timeout.
+
+    Args:
+    path: Path of the queue database
+
+    Returns:
+    threading.Lock shared by all WorkQueue instances on the database
+    """
+    with _WRITE_LOCKS_LOCK:
+        return _WRITE_LOCKS.setdefault(Path(path).resolve(), threading.Lock())
+
+def queue_path(fingerprint):
+    """
+    Get the work queue database of a sample.
+
+    Args:
+    fingerprint: Sample fingerprint (see sample_fingerprint)
+
+    Returns:
+    Path of the SQLite database
+    """
+    return JOURNAL_DIR / f"{fingerprint}.queue.sqlite"
+
+class WorkQueue:
+    """
+    Work queue that splits a coding sample between coders, in a local SQLite database.
+
+    Coders lease batches of uncoded items; a lease that is not renewed
+    (by leasing again or submitting) within lease_seconds expires and its
+    items go back to the next coder who asks for work. The database runs in
+    WAL mode, so reading progress never blocks coders, and every lease or
+    Submit is one short write transaction that commits without an fsync
+    (synchronous=NORMAL): the write lock is held for microseconds, so many
+    sessions can submit at once. A session that finds the lock taken waits
+    for up to BUSY_TIMEOUT seconds instead of failing. Each coder's journal
+    still records their own decisions, so nothing is lost if the last
+    commits do not survive a power loss.
+
+    Every session opens its own WorkQueue; one instance may be shared by the
+    reruns of a session but is not meant for concurrent use.
+    """
+
+    def __init__(self, path, num_items, lease_seconds=LEASE_SECONDS, timeout=BUSY_TIMEOUT):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._write_lock = _write_lock(self.path)
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        self._connection = sqlite3.connect(self.path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction() as cursor:
+            for statement in _SCHEMA.split(";"):
+                if statement.strip():
+                    cursor.execute(statement)
+            # Register the items of the sample; existing rows keep their leases and labels
+            cursor.execute(
+                "INSERT OR IGNORE INTO items (item_index) "
+                "WITH RECURSIVE numbers(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM numbers WHERE n + 1 < ?) "
+                "SELECT n FROM numbers WHERE ? > 0",
+                (num_items, num_items)
+            )
+
+    def _transaction(self):
+        return _Transaction(self._connection, self._lock, self._write_lock)
+
+    @instrumented
+    def lease(self, coder, count=LEASE_BATCH_SIZE):
+        """
+        Renew a coder's leases and top them up to a batch of uncoded items.
+
+        Items whose lease has expired are handed out again, lowest item index first.
+
+        Args:
+        coder: Coder name
+        count: Number of items a coder holds at once
+
+        Returns:
+        Sorted list of the item indices leased to the coder
+        """
+        now = time.time()
+        expires = now + self.lease_seconds
+        with self._transaction() as cursor:
+            held = cursor.execute(
+                "UPDATE items SET lease_expires = ? WHERE coder = ? AND manual_label IS NULL AND lease_expires >= ?",
+                (expires, coder, now)
+            ).rowcount
+            if held < count:
+                cursor.execute(
+                    "UPDATE items SET coder = ?, lease_expires = ? WHERE item_index IN ("
+                    "SELECT item_index FROM items WHERE manual_label IS NULL AND (lease_expires IS NULL OR lease_expires < ?) "
+                    "ORDER BY item_index LIMIT ?)",
+                    (coder, expires, now, count - held)
+                )
+            rows = cursor.execute(
+                "SELECT item_index FROM items WHERE coder = ? AND manual_label IS NULL AND lease_expires >= ? ORDER BY item_index",
+                (coder, now)
+            ).fetchall()
+        return [item_index for item_index, in rows]
+
+    @instrumented
+    def submit(self, coder, item_index, manual_label):
+        """
+        Record a coder's label for an item and renew the coder's other leases.
+
+        The label is accepted if the coder holds the item's lease, coded it
+        before, or the item is not leased to anyone else (e.g. the coder's
+        own lease expired and nobody took it over).
+
+        Args:
+        coder: Coder name
+        item_index: Index of the item in the sample
+        manual_label: Manually assigned label
+
+        Returns:
+        True if the label was recorded, False if another coder has leased or coded the item
+        """
+        now = time.time()
+        with self._transaction() as cursor:
+            accepted = cursor.execute(
+                "UPDATE items SET coder = ?, manual_label = ?, coded_at = ?, lease_expires = NULL "
+                "WHERE item_index = ? AND (coder = ? OR (manual_label IS NULL AND (lease_expires IS NULL OR lease_expires < ?)))",
+                (coder, manual_label, now, item_index, coder, now)
+            ).rowcount == 1
+            cursor.execute(
+                "UPDATE items SET lease_expires = ? WHERE coder = ? AND manual_label IS NULL AND lease_expires >= ?",
+                (now + self.lease_seconds, coder, now)
+            )
+        return accepted
+
+    def release(self, coder):
+        """
+        Give a coder's uncoded items back to the queue, e.g. when they stop coding.
+
+        Args:
+        coder: Coder name
+
+        Returns:
+        Number of released items
+        """
+        with self._transaction() as cursor:
+            return cursor.execute(
+                "UPDATE items SET coder = NULL, lease_expires = NULL WHERE coder = ? AND manual_label IS NULL", (coder,)
+            ).rowcount
+
+    def reclaim(self):
+        """
+        Return the items of all expired leases to the queue.
+
+        Leasing already hands out expired items; reclaiming them explicitly
+        keeps the progress counts accurate.
+
+        Returns:
+        Number of reclaimed items
+        """
+        with self._transaction() as cursor:
+            return cursor.execute(
+                "UPDATE items SET coder = NULL, lease_expires = NULL WHERE manual_label IS NULL AND lease_expires < ?",
+                (time.time(),)
+            ).rowcount
+
+    def progress(self):
+        """
+        Count the coded, leased and open items of the sample.
+
+        Returns:
+        Dictionary with 'coded', 'leased', 'open' and 'coders' (number of coders who have coded or hold leases)
+        """
+        now = time.time()
+        with self._lock:
+            coded, leased, total, coders = self._connection.execute(
+                "SELECT COUNT(manual_label), SUM(manual_label IS NULL AND lease_expires >= ?), COUNT(*), COUNT(DISTINCT coder) FROM items",
+                (now,)
+            ).fetchone()
+        leased = leased or 0
+        return {'coded': coded, 'leased': leased, 'open': total - coded - leased, 'coders': coders}
+
+    @instrumented
+    def decisions(self):
+        """
+        Read the labels of all coded items.
+
+        Returns:
+        Polars DataFrame with item_index, manual_label and coder columns, ordered by item
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT item_index, manual_label, coder FROM items WHERE manual_label IS NOT NULL ORDER BY item_index"
+            ).fetchall()
+        return pl.DataFrame(rows, schema=['item_index', 'manual_label', 'coder'], orient='row')
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+class _Transaction:
+    """
+    Write transaction that takes SQLite's write lock up front (BEGIN IMMEDIATE).
+
+    Taking the lock at the start rather than at the first write means a
+    busy database is waited for under busy_timeout, instead of failing a
+    transaction that has already read.
+    """
+
+    def __init__(self, connection, lock, write_lock):
+        self.connection = connection
+        self.locks = (lock, write_lock)
+
+    def __enter__(self):
+        for lock in self.locks:
+            lock.acquire()
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self._release()
+            raise
+        return self.connection.cursor()
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            self.connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        finally:
+            self._release()
+
+    def _release(self):
+        for lock in reversed(self.locks):
+            lock.release()